@@ -0,0 +1,258 @@
+"""
+Request, database and Firebase metrics in the Prometheus text format
+
+Metrics are kept in memory per process and shared by all its threads.
+MetricsMiddleware records, per URL name, the request latency, status
+codes, and the number and total time of SQL queries and Firebase calls.
+metrics_view serves everything at /metrics. With several worker
+processes (e.g. gunicorn), each worker reports its own numbers.
+"""
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def bucket_label(bound):
+    return f'le="{bound}"'
+
+
+class Counter:
+    """Monotonic total per label set"""
+    
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+    
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+    
+    def collect(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield f'{self.name}{_labels(self.labels, label_values)} {value}'
+
+
+class Histogram:
+    """Bucketed distribution per label set"""
+    
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket..., count above the last bucket, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+    
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+    
+    def collect(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            series = sorted((label_values, list(values)) for label_values, values in self._series.items())
+        for label_values, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                yield f'{self.name}_bucket{_labels(self.labels, label_values, bucket_label(bound))} {cumulative}'
+            cumulative += values[-2]
+            yield f'{self.name}_bucket{_labels(self.labels, label_values, bucket_label("+Inf"))} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labels, label_values)} {values[-1]}'
+            yield f'{self.name}_count{_labels(self.labels, label_values)} {cumulative}'
+
+
+class CallbackMetric:
+    """Counter or gauge values read from a function at scrape time"""
+    
+    def __init__(self, name, documentation, metric_type, callback):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.callback = callback
+        REGISTRY.append(self)
+    
+    def collect(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.metric_type}'
+        for labels, value in self.callback():
+            yield f'{self.name}{labels} {value}'
+
+
+REQUESTS = Counter('echo_http_requests_total', 'Requests by URL name, method and status code', ['view', 'method', 'status'])
+REQUEST_DURATION = Histogram('echo_http_request_duration_seconds', 'Time to produce a response', ['view', 'method'])
+DB_QUERIES = Histogram('echo_db_queries_per_request', 'SQL queries run by one request', ['view'], COUNT_BUCKETS)
+DB_QUERY_SECONDS = Counter('echo_db_query_seconds_total', 'Time spent running SQL queries', ['view'])
+FIREBASE_CALLS = Histogram('echo_firebase_calls_per_request', 'Firebase calls started by one request', ['view'], COUNT_BUCKETS)
+FIREBASE_CALL_DURATION = Histogram('echo_firebase_call_duration_seconds', 'Time a Firebase call ran on a worker')
+OCCUPANCY_EVENTS_DROPPED = Counter(
+    'echo_occupancy_events_dropped_total', 'Occupancy events never written to OccupancyData', ['reason']
+)
+
+
+def _firebase_counters():
+    from rooms.firebase_service import FirebaseService
+    
+    counters = FirebaseService.metrics()
+    for result in ('completed', 'failed', 'timeouts', 'rejected'):
+        yield f'{{result="{result}"}}', counters[result]
+
+
+def _firebase_pool():
+    from rooms.firebase_service import FirebaseService
+    
+    counters = FirebaseService.metrics()
+    yield '{state="in_flight"}', counters['in_flight']
+    yield '{state="queued"}', counters['queue_depth']
+
+
+CallbackMetric('echo_firebase_calls_total', 'Firebase calls by result', 'counter', _firebase_counters)
+CallbackMetric('echo_firebase_pool_calls', 'Firebase calls running or waiting for a worker', 'gauge', _firebase_pool)
+
+
+_request_state = threading.local()
+
+
+def note_firebase_call():
+    """Count a Firebase call against the request running on this thread"""
+    calls = getattr(_request_state, 'firebase_calls', None)
+    if calls is not None:
+        _request_state.firebase_calls = calls + 1
+
+
+class _QueryRecorder:
+    """execute_wrapper counting queries and their total time"""
+    
+    __slots__ = ('count', 'seconds')
+    
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+    
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+class MetricsMiddleware:
+    """
+    Record latency, status, SQL queries and Firebase calls per URL name
+    
+    Latency covers the time until the response is returned; streamed
+    bodies are not included. Under ASGI, queries and Firebase calls run on
+    other threads, so only latency and status are recorded there.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
+        queries = _QueryRecorder()
+        _request_state.firebase_calls = 0
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(queries))
+                response = self.get_response(request)
+        finally:
+            firebase_calls = _request_state.firebase_calls
+            _request_state.firebase_calls = None
+        duration = time.perf_counter() - start
+        
+        view = _view_name(request)
+        REQUESTS.inc(1, view, request.method, str(response.status_code))
+        REQUEST_DURATION.observe(duration, view, request.method)
+        DB_QUERIES.observe(queries.count, view)
+        DB_QUERY_SECONDS.inc(queries.seconds, view)
+        FIREBASE_CALLS.observe(firebase_calls, view)
+        return response
+    
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        view = _view_name(request)
+        REQUESTS.inc(1, view, request.method, str(response.status_code))
+        REQUEST_DURATION.observe(time.perf_counter() - start, view, request.method)
+        return response
+
+
+def render_metrics():
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Serve the metrics of this process
+    
+    The scraper must send METRICS_TOKEN as a bearer token. Without a token
+    the metrics are only served when DEBUG is on.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+    elif not settings.DEBUG:
+        return HttpResponse('Forbidden: METRICS_TOKEN is not set\n', status=403, content_type='text/plain')
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,134 @@
+"""
+Read replicas for the read-heavy views
+
+Views decorated with read_from_replica run their GET and HEAD queries on
+one of DATABASE_REPLICA_ALIASES, picked at random once per request.
+Everything else reads from the primary ('default'), and every write goes
+there too. A request that writes marks its browser with a cookie, and
+for REPLICA_PIN_SECONDS afterwards that browser only reads from the
+primary, so users see their own changes even if the replicas lag behind.
+
+Inside a transaction on the primary, reads stay on the primary as well,
+which covers select_for_update() and reads after a write in the same
+transaction. Data cached until the next change (current reservations,
+floor counts, the manager grid, the availability index) is loaded inside
+primary_reads(), since a copy read from a lagging replica would be kept
+after the change it missed.
+
+Without replicas configured the router sends everything to the primary.
+"""
+import functools
+import random
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+PIN_COOKIE = 'db_pinned'
+
+_request_state = threading.local()
+
+
+def _replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICA_ALIASES', [])
+
+
+class ReplicaRouter:
+    """Routes reads of read_from_replica views to a replica, all else to the primary"""
+    
+    def db_for_read(self, model, **hints):
+        if not getattr(_request_state, 'replica_reads', False) or getattr(_request_state, 'primary_depth', 0):
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label == 'sessions' or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if _request_state.replica is None:
+            _request_state.replica = random.choice(_replica_aliases())
+        return _request_state.replica
+    
+    def db_for_write(self, model, **hints):
+        # Session writes do not make the replicas stale for the user
+        if model._meta.app_label != 'sessions' and hasattr(_request_state, 'wrote'):
+            _request_state.wrote = True
+            _request_state.replica_reads = False
+        return DEFAULT_DB_ALIAS
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *_replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in _replica_aliases():
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """
+    Pin browsers to the primary for REPLICA_PIN_SECONDS after they write
+    
+    Must come before any middleware that writes to the database on behalf
+    of the request.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        _request_state.wrote = False
+        _request_state.pinned = PIN_COOKIE in request.COOKIES
+        _request_state.replica_reads = False
+        _request_state.replica = None
+        try:
+            response = self.get_response(request)
+            wrote = _request_state.wrote
+        finally:
+            del _request_state.wrote
+            _request_state.replica_reads = False
+        
+        if wrote and _replica_aliases():
+            response.set_cookie(
+                PIN_COOKIE,
+                '1',
+                max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 10),
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
+
+
+def read_from_replica(view):
+    """
+    Let a view's GET and HEAD requests read from a replica
+    
+    Only for views that tolerate data a little behind the primary; the
+    browser of a user who just wrote still reads from the primary.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (
+            request.method not in ('GET', 'HEAD')
+            or not _replica_aliases()
+            or getattr(_request_state, 'pinned', True)
+            or getattr(_request_state, 'wrote', True)
+        ):
+            return view(request, *args, **kwargs)
+        _request_state.replica_reads = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _request_state.replica_reads = False
+    return wrapper
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block, even in a read_from_replica view"""
+    _request_state.primary_depth = getattr(_request_state, 'primary_depth', 0) + 1
+    try:
+        yield
+    finally:
+        _request_state.primary_depth -= 1
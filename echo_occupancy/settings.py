@@ -4,7 +4,7 @@ Django settings for echo_occupancy project.
 
 from pathlib import Path
 import os
-from decouple import config
+from decouple import config, Csv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -37,11 +37,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'echo_occupancy.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'echo_occupancy.replicas.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'reservations.middleware.CurrentReservationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -74,6 +77,39 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Tests use a file too: connections to a shared in-memory database
+        # fail on a locked table where a file waits for the lock, which
+        # tests of concurrent bookings rely on
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+# Read replicas: comma separated NAMEs of copies of the default database
+# (SQLite files locally), added as aliases replica1, replica2, ... with
+# the default's other settings. Dashboard and report views read from them
+# (see echo_occupancy.replicas); a browser that wrote reads from the
+# primary for REPLICA_PIN_SECONDS, which should exceed the replication lag.
+DATABASE_REPLICA_ALIASES = []
+for _number, _name in enumerate(config('DATABASE_REPLICAS', default='', cast=Csv()), start=1):
+    DATABASES[f'replica{_number}'] = {**DATABASES['default'], 'NAME': _name, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICA_ALIASES.append(f'replica{_number}')
+
+DATABASE_ROUTERS = ['echo_occupancy.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=10, cast=int)
+
+
+# Cache
+# Per-process memory cache. It holds the change-tracking versions and one
+# dashboard card per room, so it must have room for more entries than there
+# are rooms; the 300 entry default would evict the version keys. Deployments
+# with several processes should use Redis or Memcached instead.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=20000, cast=int),
+        },
     }
 }
 
@@ -133,3 +169,63 @@ LOGOUT_REDIRECT_URL = 'accounts:login'
 FIREBASE_DATABASE_URL = config('FIREBASE_DATABASE_URL', default='https://hotel-monitor-ada02-default-rtdb.firebaseio.com/')
 FIREBASE_CREDENTIALS_PATH = config('FIREBASE_CREDENTIALS_PATH', default='')
 
+# Seconds a cached /devices snapshot is served as fresh, and how much longer
+# a stale one may be served while it is refreshed in the background. A failed
+# fetch is cached as an empty snapshot for FIREBASE_SNAPSHOT_TTL as well.
+FIREBASE_SNAPSHOT_TTL = config('FIREBASE_SNAPSHOT_TTL', default=5, cast=int)
+FIREBASE_SNAPSHOT_STALE_TTL = config('FIREBASE_SNAPSHOT_STALE_TTL', default=30, cast=int)
+
+# Longest a page or API request waits for the /devices snapshot, in seconds
+FIREBASE_REQUEST_TIMEOUT = config('FIREBASE_REQUEST_TIMEOUT', default=1, cast=float)
+
+# Size of the shared Firebase worker pool, and how many calls may wait for a
+# free worker before new ones are rejected
+FIREBASE_MAX_WORKERS = config('FIREBASE_MAX_WORKERS', default=8, cast=int)
+FIREBASE_MAX_QUEUE = config('FIREBASE_MAX_QUEUE', default=100, cast=int)
+
+# Read IoT occupancy from the DeviceState table kept current by
+# `manage.py occupancy_listen` instead of calling Firebase per request
+OCCUPANCY_LIVE_STATE = config('OCCUPANCY_LIVE_STATE', default=False, cast=bool)
+
+# Buffered OccupancyData ingestion: rows per bulk insert, longest wait before
+# a partial batch is written, events buffered before producers block, and
+# retries of a batch that failed to write before it is dropped
+OCCUPANCY_INGEST_BATCH_SIZE = config('OCCUPANCY_INGEST_BATCH_SIZE', default=1000, cast=int)
+OCCUPANCY_INGEST_FLUSH_INTERVAL = config('OCCUPANCY_INGEST_FLUSH_INTERVAL', default=1.0, cast=float)
+OCCUPANCY_INGEST_MAX_BUFFER = config('OCCUPANCY_INGEST_MAX_BUFFER', default=20000, cast=int)
+OCCUPANCY_INGEST_MAX_RETRIES = config('OCCUPANCY_INGEST_MAX_RETRIES', default=3, cast=int)
+
+# Live dashboard stream: how often each process checks for occupancy changes,
+# and how long one Server-Sent Events connection lasts before the browser
+# reconnects
+OCCUPANCY_STREAM_INTERVAL = config('OCCUPANCY_STREAM_INTERVAL', default=1.0, cast=float)
+OCCUPANCY_STREAM_MAX_AGE = config('OCCUPANCY_STREAM_MAX_AGE', default=300, cast=int)
+
+# Seconds rendered dashboard room cards and manager grids stay cached; entries
+# are keyed by room state and occupancy version, so this only bounds memory
+DASHBOARD_FRAGMENT_TTL = config('DASHBOARD_FRAGMENT_TTL', default=3600, cast=int)
+
+# Rooms per page of the manager dashboard
+DASHBOARD_PAGE_SIZE = config('DASHBOARD_PAGE_SIZE', default=100, cast=int)
+
+# Occupancy samples per page of a room's history (room detail and API)
+OCCUPANCY_HISTORY_PAGE_SIZE = config('OCCUPANCY_HISTORY_PAGE_SIZE', default=50, cast=int)
+
+# Seconds a user's current reservation (request.current_reservation) stays
+# cached; it is also dropped whenever one of the user's reservations is saved
+CURRENT_RESERVATION_TTL = config('CURRENT_RESERVATION_TTL', default=60, cast=int)
+
+# Sensor/reservation mismatch alerts raised by occupancy_listen: seconds a room
+# must stay occupied without a reservation, or vacant while reserved, before an
+# OccupancyAlert is recorded, and how often reservations are reloaded
+ANOMALY_OCCUPIED_AFTER = config('ANOMALY_OCCUPIED_AFTER', default=900, cast=int)
+ANOMALY_VACANT_AFTER = config('ANOMALY_VACANT_AFTER', default=86400, cast=int)
+ANOMALY_REFRESH_INTERVAL = config('ANOMALY_REFRESH_INTERVAL', default=30.0, cast=float)
+
+# Directory `manage.py archive_occupancy` moves old OccupancyData rows to,
+# as gzip JSON Lines files per room and month plus a manifest.json
+OCCUPANCY_ARCHIVE_DIR = config('OCCUPANCY_ARCHIVE_DIR', default=str(BASE_DIR / 'archive' / 'occupancy'))
+
+# Bearer token required by GET /metrics (Prometheus scrape endpoint). When
+# empty, metrics are only served with DEBUG on
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
@@ -0,0 +1,17 @@
+from django.test import SimpleTestCase, override_settings
+
+
+class MetricsViewTests(SimpleTestCase):
+    @override_settings(METRICS_TOKEN='', DEBUG=False)
+    def test_no_token_outside_debug_is_forbidden(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+    
+    @override_settings(METRICS_TOKEN='', DEBUG=True)
+    def test_no_token_in_debug_is_served(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+    
+    @override_settings(METRICS_TOKEN='secret', DEBUG=False)
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
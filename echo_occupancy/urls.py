@@ -4,6 +4,7 @@ URL configuration for echo_occupancy project.
 from django.contrib import admin
 from django.urls import path, include
 from django.shortcuts import redirect
+from .metrics import metrics_view
 
 def home_view(request):
     """Home view that redirects based on authentication"""
@@ -18,5 +19,7 @@ urlpatterns = [
     path('', include('accounts.urls')),
     path('rooms/', include('rooms.urls')),
     path('reservations/', include('reservations.urls')),
+    path('api/', include('rooms.api_urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
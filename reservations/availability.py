@@ -0,0 +1,159 @@
+"""
+Interval index over active reservations for date range availability
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from django.core.cache import cache
+from django.utils import timezone
+from echo_occupancy.replicas import primary_reads
+from rooms.models import Room
+from .models import Reservation, start_of_day
+
+
+AVAILABILITY_VERSION_KEY = 'availability:version'
+
+_index_lock = threading.Lock()
+_index_cache = {}
+
+
+def get_availability_version():
+    """Time of the last change to rooms or reservations, as a Unix timestamp"""
+    version = cache.get(AVAILABILITY_VERSION_KEY)
+    if version is None:
+        cache.add(AVAILABILITY_VERSION_KEY, time.time(), None)
+        version = cache.get(AVAILABILITY_VERSION_KEY, time.time())
+    return version
+
+
+def bump_availability_version():
+    """Record that rooms or reservations changed"""
+    cache.set(AVAILABILITY_VERSION_KEY, time.time(), None)
+
+
+class AvailabilityIndex:
+    """
+    Sorted reservation intervals per room
+    
+    Each room keeps the start times of its reservations in ascending order
+    together with the running maximum of their end times. A room is free
+    for [start, end) when no reservation starting before end ends after
+    start, which is one bisect per room that has reservations at all.
+    Rooms holding a reservation without dates are never free, as on the
+    reservation page.
+    """
+    
+    def __init__(self, room_ids, reservations):
+        """
+        Args:
+            room_ids: IDs of all rooms, in the order results are returned
+            reservations: Iterable of (room_id, check_in, check_out)
+        """
+        self.room_ids = list(room_ids)
+        self.blocked = set()
+        intervals = defaultdict(list)
+        for room_id, check_in, check_out in reservations:
+            if check_in is None and check_out is None:
+                self.blocked.add(room_id)
+                continue
+            intervals[room_id].append((
+                check_in.timestamp() if check_in else float('-inf'),
+                check_out.timestamp() if check_out else float('inf')
+            ))
+        
+        self._starts = {}
+        self._max_ends = {}
+        for room_id, spans in intervals.items():
+            spans.sort()
+            max_ends = []
+            max_end = float('-inf')
+            for _, end in spans:
+                max_end = max(max_end, end)
+                max_ends.append(max_end)
+            self._starts[room_id] = [start for start, _ in spans]
+            self._max_ends[room_id] = max_ends
+    
+    @classmethod
+    def build(cls, today=None):
+        """Load all rooms and active non-manager reservations, in two queries"""
+        room_ids = Room.objects.order_by('room_number').values_list('id', flat=True)
+        reservations = Reservation.objects.active(today).exclude(
+            user__role='manager'
+        ).values_list('room_id', 'check_in', 'check_out')
+        return cls(room_ids, reservations)
+    
+    def _is_free(self, room_id, start, end):
+        if room_id in self.blocked:
+            return False
+        starts = self._starts.get(room_id)
+        if not starts:
+            return True
+        # Reservations [0, i) start before the requested range ends
+        i = bisect_left(starts, end)
+        return i == 0 or self._max_ends[room_id][i - 1] <= start
+    
+    def is_free(self, room_id, check_in, check_out):
+        """Whether the room has no reservation overlapping [check_in, check_out)"""
+        return self._is_free(room_id, check_in.timestamp(), check_out.timestamp())
+    
+    def free_rooms(self, check_in, check_out):
+        """
+        IDs of rooms with no reservation overlapping [check_in, check_out)
+        
+        Args:
+            check_in: Aware datetime the stay starts
+            check_out: Aware datetime the stay ends
+        
+        Returns:
+            list: Room IDs in room number order
+        """
+        start = check_in.timestamp()
+        end = check_out.timestamp()
+        busy = set(self.blocked)
+        for room_id in self._starts:
+            if not self._is_free(room_id, start, end):
+                busy.add(room_id)
+        return [room_id for room_id in self.room_ids if room_id not in busy]
+
+
+def get_availability_index(today=None):
+    """
+    AvailabilityIndex for today, rebuilt only after rooms or reservations change
+    
+    The index is kept per process and checked against the availability
+    version on every call.
+    """
+    if today is None:
+        today = timezone.now().date()
+    key = (get_availability_version(), today)
+    cached = _index_cache.get('index')
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    
+    with _index_lock:
+        cached = _index_cache.get('index')
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with primary_reads():
+            index = AvailabilityIndex.build(today)
+        _index_cache['index'] = (key, index)
+        return index
+
+
+def find_free_rooms(check_in_date, check_out_date):
+    """
+    Rooms free for the whole stay, in room number order
+    
+    Only the free rooms are loaded; the index decides which they are.
+    
+    Args:
+        check_in_date: First night (date)
+        check_out_date: Departure day (date)
+    
+    Returns:
+        QuerySet: Free Room rows
+    """
+    index = get_availability_index()
+    free = index.free_rooms(start_of_day(check_in_date), start_of_day(check_out_date))
+    return Room.objects.filter(id__in=free).order_by('room_number')
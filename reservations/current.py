@@ -0,0 +1,52 @@
+"""
+Cached lookup of a user's current reservation
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from echo_occupancy.replicas import primary_reads
+from .models import Reservation
+
+
+CURRENT_RESERVATION_KEY = 'reservations:current:{}:{}'
+
+
+def _cache_key(user_id, today=None):
+    if today is None:
+        today = timezone.now().date()
+    return CURRENT_RESERVATION_KEY.format(user_id, today)
+
+
+def get_current_reservation(user):
+    """
+    The user's newest active reservation with its room loaded, or None
+    
+    Cached for CURRENT_RESERVATION_TTL seconds under the user and the date,
+    so a reservation that checked out yesterday is never served. Saving or
+    deleting one of the user's reservations drops the entry (see
+    reservations.signals). Managers and anonymous users have none.
+    
+    Bookings must not rely on this; book_room checks the database under a
+    lock.
+    """
+    if not user.is_authenticated or user.is_manager():
+        return None
+    
+    key = _cache_key(user.pk)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached[0]
+    
+    # From the primary, as the entry is kept until the reservation changes
+    with primary_reads():
+        reservation = Reservation.objects.active().filter(
+            user=user
+        ).select_related('room').first()
+    # Wrapped so that "no reservation" is cached as well
+    cache.set(key, (reservation,), getattr(settings, 'CURRENT_RESERVATION_TTL', 60))
+    return reservation
+
+
+def forget_current_reservation(user_id):
+    """Drop the cached current reservation of a user"""
+    cache.delete(_cache_key(user_id))
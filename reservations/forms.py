@@ -59,3 +59,38 @@ class ReservationForm(forms.ModelForm):
         
         return cleaned_data
 
+
+class AvailabilitySearchForm(forms.Form):
+    """Date range for finding rooms free for a whole stay"""
+    
+    check_in_date = forms.DateField(
+        label='Check-in Date',
+        widget=forms.DateInput(attrs={
+            'type': 'date',
+            'class': 'form-control',
+            'min': str(date.today())
+        })
+    )
+    
+    check_out_date = forms.DateField(
+        label='Check-out Date',
+        widget=forms.DateInput(attrs={
+            'type': 'date',
+            'class': 'form-control',
+            'min': str(date.today() + timedelta(days=1))
+        })
+    )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        check_in = cleaned_data.get('check_in_date')
+        check_out = cleaned_data.get('check_out_date')
+        
+        if check_in and check_out:
+            if check_in < date.today():
+                raise forms.ValidationError('Check-in date cannot be in the past.')
+            
+            if check_out <= check_in:
+                raise forms.ValidationError('Check-out date must be after check-in date.')
+        
+        return cleaned_data
@@ -0,0 +1,89 @@
+"""
+Management command to measure booking throughput when many requests compete for one room
+"""
+import random
+import threading
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from accounts.models import User
+from rooms.models import Room
+from reservations.models import Reservation
+from reservations.services import book_room, BookingConflict
+
+
+class Command(BaseCommand):
+    help = 'Book the same room from concurrent workers and check that no stays overlap'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Number of concurrent threads')
+        parser.add_argument('--attempts', type=int, default=50, help='Bookings attempted per worker')
+        parser.add_argument('--days', type=int, default=60, help='Days ahead the requested stays fall within')
+    
+    def handle(self, *args, **options):
+        workers = options['workers']
+        attempts = options['attempts']
+        days = options['days']
+        
+        # Temporary room and users, removed again (with their reservations) at the end
+        room = Room.objects.create(room_number='BENCH')
+        users = User.objects.bulk_create([
+            User(username=f'bench-booker-{i}') for i in range(workers * attempts)
+        ])
+        results = {'booked': 0, 'conflicts': 0, 'errors': 0}
+        results_lock = threading.Lock()
+        barrier = threading.Barrier(workers)
+        
+        def work(worker):
+            rng = random.Random(worker)
+            try:
+                barrier.wait()
+                for n in range(attempts):
+                    check_in = date.today() + timedelta(days=rng.randint(1, days))
+                    check_out = check_in + timedelta(days=rng.randint(1, 3))
+                    try:
+                        book_room(users[worker * attempts + n], room, check_in, check_out)
+                        outcome = 'booked'
+                    except BookingConflict:
+                        outcome = 'conflicts'
+                    except DatabaseError as e:
+                        self.stderr.write(f'Worker {worker}: {e}')
+                        outcome = 'errors'
+                    with results_lock:
+                        results[outcome] += 1
+            finally:
+                # Each thread has its own database connection
+                connection.close()
+        
+        try:
+            threads = [threading.Thread(target=work, args=(i,)) for i in range(workers)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            
+            # Any stay starting before the latest check-out so far overlaps it
+            overlaps = 0
+            latest_check_out = None
+            stays = Reservation.objects.filter(room=room).order_by('check_in').values_list('check_in', 'check_out')
+            for check_in, check_out in stays:
+                if latest_check_out and check_in < latest_check_out:
+                    overlaps += 1
+                latest_check_out = max(latest_check_out or check_out, check_out)
+            
+            total = workers * attempts
+            self.stdout.write(
+                f'{connection.vendor}: {total} attempts from {workers} workers in {elapsed:.2f}s '
+                f'({total / elapsed:,.0f} attempts/s): {results["booked"]} booked, '
+                f'{results["conflicts"]} conflicts, {results["errors"]} errors'
+            )
+            if overlaps:
+                self.stdout.write(self.style.ERROR(f'{overlaps} overlapping reservations'))
+            else:
+                self.stdout.write(self.style.SUCCESS('No overlapping reservations'))
+        finally:
+            room.delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
@@ -0,0 +1,66 @@
+"""
+Management command to measure how long the reservation page takes to build
+"""
+import random
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from accounts.models import User
+from rooms.models import Room
+from reservations.models import Reservation, start_of_day
+from reservations.views import reservation_page
+
+
+class Command(BaseCommand):
+    help = 'Render the reservation page against synthetic rooms and reservations and report the timing'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=1000, help='Number of synthetic rooms')
+        parser.add_argument('--reservations', type=int, default=50000, help='Number of synthetic reservations')
+        parser.add_argument('--users', type=int, default=100, help='Number of users holding the reservations')
+        parser.add_argument('--runs', type=int, default=5, help='Number of page renders to time')
+    
+    def handle(self, *args, **options):
+        today = start_of_day()
+        rng = random.Random(0)
+        
+        # Temporary rooms and users, removed again (with their reservations) at the end
+        rooms = Room.objects.bulk_create([
+            Room(room_number=f'BR{i}') for i in range(options['rooms'])
+        ])
+        users = User.objects.bulk_create([
+            User(username=f'bench-user-{i}') for i in range(options['users'])
+        ])
+        try:
+            reservations = []
+            for _ in range(options['reservations']):
+                check_in = today + timedelta(days=rng.randint(-5, 365))
+                reservations.append(Reservation(
+                    user=rng.choice(users),
+                    room=rng.choice(rooms),
+                    check_in=check_in,
+                    check_out=check_in + timedelta(days=rng.randint(1, 14))
+                ))
+            Reservation.objects.bulk_create(reservations, batch_size=1000)
+            
+            request = RequestFactory().get('/reservations/')
+            request.user = users[0]
+            timings = []
+            for _ in range(options['runs']):
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    response = reservation_page(request)
+                    timings.append(time.perf_counter() - start)
+            
+            self.stdout.write(self.style.SUCCESS(
+                f'Rendered the reservation page for {len(rooms)} rooms and {len(reservations)} '
+                f'reservations in {min(timings) * 1000:.0f} ms best, '
+                f'{sum(timings) / len(timings) * 1000:.0f} ms mean over {len(timings)} runs '
+                f'({len(queries)} queries, {len(response.content):,} bytes)'
+            ))
+        finally:
+            Room.objects.filter(id__in=[room.id for room in rooms]).delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
@@ -0,0 +1,29 @@
+"""
+Management command to complete reservations whose check-out date has passed
+"""
+import time
+from django.core.management.base import BaseCommand
+from reservations.services import expire_reservations
+
+
+class Command(BaseCommand):
+    help = 'Mark reservations as completed once their check-out date has passed'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every',
+            type=int,
+            default=0,
+            help='Keep running and repeat every N seconds instead of running once'
+        )
+    
+    def handle(self, *args, **options):
+        while True:
+            count = expire_reservations()
+            self.stdout.write(
+                self.style.SUCCESS(f'Completed {count} expired reservations.')
+            )
+            
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,22 @@
+"""
+Middleware for the reservations app
+"""
+from django.utils.functional import SimpleLazyObject
+from .current import get_current_reservation
+
+
+class CurrentReservationMiddleware:
+    """
+    Set request.current_reservation to the user's current reservation
+    
+    The value is looked up (usually from the cache) on first use only.
+    Like request.user it is a lazy proxy, so test it for truth rather than
+    comparing it with None. Must come after AuthenticationMiddleware.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        request.current_reservation = SimpleLazyObject(lambda: get_current_reservation(request.user))
+        return self.get_response(request)
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['room', 'status', 'check_in', 'check_out'], name='reservation_room_status_dates'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('status__in', ['reserved', 'active'])), fields=['room', 'check_in', 'check_out'], name='reservation_active_room_dates'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['user', 'status'], name='reservation_user_status'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['status', 'check_out'], name='reservation_status_checkout'),
+        ),
+    ]
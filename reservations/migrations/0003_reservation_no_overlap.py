@@ -0,0 +1,69 @@
+# Trigger preventing overlapping active reservations of a room on PostgreSQL,
+# with the same rule as book_room: reservations of managers are ignored, and
+# undated reservations only clash with undated ones. An exclusion constraint
+# cannot look up the user's role on another table. The trigger takes a
+# per-room advisory lock before checking, so concurrent writers of one room
+# are checked one after the other. Other databases: see 0004.
+
+from django.db import migrations
+
+
+CREATE_TRIGGER = """
+CREATE FUNCTION reservation_no_overlap() RETURNS trigger AS $$
+BEGIN
+    IF NEW.status NOT IN ('reserved', 'active')
+        OR EXISTS (SELECT 1 FROM accounts_user WHERE id = NEW.user_id AND role = 'manager')
+    THEN
+        RETURN NEW;
+    END IF;
+    PERFORM pg_advisory_xact_lock(NEW.room_id);
+    IF EXISTS (
+        SELECT 1 FROM reservations_reservation r
+        JOIN accounts_user u ON u.id = r.user_id
+        WHERE r.room_id = NEW.room_id
+            AND r.id IS DISTINCT FROM NEW.id
+            AND r.status IN ('reserved', 'active')
+            AND u.role <> 'manager'
+            AND (
+                (NEW.check_in IS NOT NULL AND NEW.check_out IS NOT NULL
+                    AND r.check_in < NEW.check_out AND r.check_out > NEW.check_in)
+                OR (NEW.check_in IS NULL AND NEW.check_out IS NULL
+                    AND r.check_in IS NULL AND r.check_out IS NULL)
+            )
+    ) THEN
+        RAISE EXCEPTION 'reservation_no_overlap' USING ERRCODE = 'exclusion_violation';
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER reservation_no_overlap
+    BEFORE INSERT OR UPDATE ON reservations_reservation
+    FOR EACH ROW EXECUTE FUNCTION reservation_no_overlap();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS reservation_no_overlap ON reservations_reservation;
+DROP FUNCTION IF EXISTS reservation_no_overlap();
+"""
+
+
+def create_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_TRIGGER)
+
+
+def drop_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0002_reservation_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
@@ -0,0 +1,62 @@
+# Triggers preventing overlapping active reservations of a room on SQLite,
+# with the rule of book_room and of the PostgreSQL trigger added in 0003:
+# reservations of managers are ignored, and undated reservations only
+# clash with undated ones.
+
+from django.db import migrations
+
+
+OVERLAP_CHECK = """
+WHEN NEW.status IN ('reserved', 'active')
+    AND NOT EXISTS (SELECT 1 FROM accounts_user WHERE id = NEW.user_id AND role = 'manager')
+BEGIN
+    SELECT RAISE(ABORT, 'reservation_no_overlap')
+    WHERE EXISTS (
+        SELECT 1 FROM reservations_reservation r
+        JOIN accounts_user u ON u.id = r.user_id
+        WHERE r.room_id = NEW.room_id
+            AND r.id IS NOT NEW.id
+            AND r.status IN ('reserved', 'active')
+            AND u.role <> 'manager'
+            AND (
+                (NEW.check_in IS NOT NULL AND NEW.check_out IS NOT NULL
+                    AND r.check_in < NEW.check_out AND r.check_out > NEW.check_in)
+                OR (NEW.check_in IS NULL AND NEW.check_out IS NULL
+                    AND r.check_in IS NULL AND r.check_out IS NULL)
+            )
+    );
+END;
+"""
+
+CREATE_TRIGGERS = [
+    "CREATE TRIGGER reservation_no_overlap_insert BEFORE INSERT ON reservations_reservation " + OVERLAP_CHECK,
+    "CREATE TRIGGER reservation_no_overlap_update BEFORE UPDATE ON reservations_reservation " + OVERLAP_CHECK,
+]
+
+DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS reservation_no_overlap_insert;",
+    "DROP TRIGGER IF EXISTS reservation_no_overlap_update;",
+]
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in CREATE_TRIGGERS:
+            schema_editor.execute(statement)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in DROP_TRIGGERS:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0003_reservation_no_overlap'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
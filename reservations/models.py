@@ -1,8 +1,40 @@
+from datetime import datetime, time
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from rooms.models import Room
 
 
+ACTIVE_STATUSES = ['reserved', 'active']
+
+
+def start_of_day(day=None):
+    """Aware datetime at midnight of day (default: today)"""
+    if day is None:
+        day = timezone.now().date()
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class ReservationQuerySet(models.QuerySet):
+    def active(self, today=None):
+        """
+        Reserved or active reservations whose check-out date has not passed
+        
+        Expired rows keep their status until expire_reservations runs, so
+        they are filtered out here rather than relied on being completed.
+        """
+        return self.filter(status__in=ACTIVE_STATUSES).exclude(
+            check_out__lt=start_of_day(today)
+        )
+    
+    def expired(self, today=None):
+        """Reserved or active reservations whose check-out date has passed"""
+        return self.filter(
+            status__in=ACTIVE_STATUSES,
+            check_out__lt=start_of_day(today)
+        )
+
+
 class Reservation(models.Model):
     """Reservation model linking users to rooms"""
     STATUS_CHOICES = [
@@ -32,11 +64,28 @@ class Reservation(models.Model):
     check_out = models.DateTimeField(blank=True, null=True)
     notes = models.TextField(blank=True)
     
+    objects = ReservationQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-reserved_at']
         verbose_name = 'Reservation'
         verbose_name_plural = 'Reservations'
-        # Note: Unique constraint for active reservations is enforced in views
+        # Note: Unique constraint for active reservations is enforced in views,
+        # and on PostgreSQL by the reservation_no_overlap trigger (migration 0003)
+        indexes = [
+            # Room availability and conflict checks
+            models.Index(fields=['room', 'status', 'check_in', 'check_out'], name='reservation_room_status_dates'),
+            models.Index(
+                fields=['room', 'check_in', 'check_out'],
+                condition=models.Q(status__in=ACTIVE_STATUSES),
+                name='reservation_active_room_dates'
+            ),
+            # "The user's current reservation"
+            models.Index(fields=['user', 'status'], name='reservation_user_status'),
+            # expire_reservations. Not a partial index: SQLite only uses
+            # one when the query spells out the statuses as literals
+            models.Index(fields=['status', 'check_out'], name='reservation_status_checkout'),
+        ]
     
     def __str__(self):
         return f'{self.user.username} - Room {self.room.room_number} ({self.status})'
@@ -0,0 +1,125 @@
+"""
+Reservation booking and maintenance tasks
+"""
+from datetime import datetime
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rooms.models import Room
+from .models import Reservation
+from .signals import reservations_expired
+
+
+class BookingConflict(Exception):
+    """Raised when a reservation cannot be made; the message is shown to the user"""
+
+
+def _lock_booking(user, room):
+    """
+    Serialize bookings for the user and the room until the transaction ends
+    
+    Rows are locked with SELECT ... FOR UPDATE, always user first, so
+    concurrent bookings cannot deadlock. SQLite has no row locks, so there
+    the room is written first, which takes the database write lock.
+    """
+    if connection.features.has_select_for_update:
+        get_user_model().objects.select_for_update().filter(pk=user.pk).first()
+        Room.objects.select_for_update().filter(pk=room.pk).first()
+    else:
+        Room.objects.filter(pk=room.pk).update(updated_at=timezone.now())
+
+
+def book_room(user, room, check_in_date=None, check_out_date=None, notes=''):
+    """
+    Reserve a room for a user in one transaction
+    
+    The user and room are locked before checking for the user's active
+    reservation and for overlapping reservations of the room, so
+    concurrent requests cannot both pass the checks. The overlap
+    triggers of the database (see migrations 0003 and 0004) apply the
+    same rule to anything written around this function.
+    
+    Args:
+        user: User making the reservation
+        room: Room to reserve
+        check_in_date: First night (date), optional
+        check_out_date: Departure day (date), optional
+        notes: Notes stored with the reservation
+    
+    Returns:
+        Reservation: The new reservation
+    
+    Raises:
+        BookingConflict: If the user already has a reservation or the room is taken
+    """
+    check_in = check_out = None
+    if check_in_date:
+        check_in = timezone.make_aware(datetime.combine(check_in_date, datetime.min.time()))
+    if check_out_date:
+        check_out = timezone.make_aware(datetime.combine(check_out_date, datetime.min.time()))
+    
+    with transaction.atomic():
+        _lock_booking(user, room)
+        
+        existing_reservation = Reservation.objects.active().filter(
+            user=user
+        ).select_related('room').first()
+        if existing_reservation:
+            raise BookingConflict(
+                f'You already have a reservation for Room {existing_reservation.room.room_number}. Please cancel it first.'
+            )
+        
+        existing_reservations = Reservation.objects.active().filter(
+            room=room
+        ).exclude(user__role='manager')
+        
+        if check_in and check_out:
+            # Two reservations overlap unless one ends before the other starts
+            conflict = existing_reservations.filter(
+                check_in__isnull=False,
+                check_out__isnull=False
+            ).exclude(
+                Q(check_out__lte=check_in) | Q(check_in__gte=check_out)
+            ).first()
+            if conflict:
+                raise BookingConflict(
+                    f'Room {room.room_number} is already reserved from {conflict.check_in.date()} to {conflict.check_out.date()}. Please choose different dates.'
+                )
+        elif existing_reservations.filter(check_in__isnull=True, check_out__isnull=True).exists():
+            raise BookingConflict(f'Room {room.room_number} is already reserved by another user.')
+        
+        try:
+            return Reservation.objects.create(
+                user=user,
+                room=room,
+                status='reserved',
+                check_in=check_in,
+                check_out=check_out,
+                notes=notes
+            )
+        except IntegrityError as e:
+            if 'reservation_no_overlap' not in str(e):
+                raise
+            # Overlap trigger: a reservation written around book_room got in first
+            if check_in and check_out:
+                raise BookingConflict(
+                    f'Room {room.room_number} was just reserved for overlapping dates. Please choose different dates.'
+                )
+            raise BookingConflict(f'Room {room.room_number} was just reserved by another user.')
+
+
+def expire_reservations(today=None):
+    """
+    Mark reservations as completed if check-out date has passed
+    
+    Runs as a single UPDATE and sends reservations_expired once when any
+    row changed, instead of saving (and signalling) each reservation.
+    
+    Returns:
+        int: Number of reservations completed
+    """
+    count = Reservation.objects.expired(today).update(status='completed')
+    if count:
+        reservations_expired.send(sender=Reservation, count=count)
+    return count
@@ -0,0 +1,31 @@
+"""
+Custom signals for the reservations app, and the receivers it registers
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+from rooms.models import Room
+from .models import Reservation
+from .availability import bump_availability_version
+from .current import forget_current_reservation
+
+
+# Sent once after expire_reservations() completes a batch of reservations.
+# Receives `count`, the number of reservations that were completed.
+reservations_expired = Signal()
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+@receiver(reservations_expired)
+def availability_changed(sender, **kwargs):
+    """Invalidate the availability index when a room or reservation changes"""
+    bump_availability_version()
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def current_reservation_changed(sender, instance, **kwargs):
+    """Drop the cached current reservation of the reservation's user"""
+    forget_current_reservation(instance.user_id)
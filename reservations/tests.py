@@ -0,0 +1,286 @@
+import random
+import threading
+from datetime import date, timedelta
+from unittest import mock
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from accounts.models import User
+from rooms.history import HISTORY_ORDERING
+from rooms.models import OccupancyData, Room
+from .availability import AvailabilityIndex, find_free_rooms, get_availability_index
+from .models import Reservation, start_of_day
+from .services import BookingConflict, book_room, expire_reservations
+from .signals import reservations_expired
+
+
+class QueryPlanTests(TestCase):
+    """The hot reservation and history queries are answered from their indexes"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        rooms = Room.objects.bulk_create(Room(room_number=str(100 + i)) for i in range(200))
+        users = User.objects.bulk_create(User(username=f'guest{i}') for i in range(500))
+        # 50 back-to-back stays per room, half of them over and completed
+        # or cancelled, as expire_reservations leaves them
+        Reservation.objects.bulk_create(
+            Reservation(
+                user=users[i % len(users)],
+                room=rooms[i % len(rooms)],
+                status=('completed', 'cancelled', 'reserved', 'active')[i // len(rooms) % 2 + 2 * (i >= 5000)],
+                check_in=now + timedelta(days=3 * (i // len(rooms)) - 75),
+                check_out=now + timedelta(days=3 * (i // len(rooms)) - 72)
+            )
+            for i in range(10000)
+        )
+        OccupancyData.objects.bulk_create(
+            OccupancyData(room=rooms[i % len(rooms)], is_occupied=i % 2 == 0, timestamp=now - timedelta(minutes=i))
+            for i in range(10000)
+        )
+        cls.room = rooms[0]
+        cls.user = users[0]
+        # Give the planner statistics, as a long-running database has
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    
+    def assertUsesIndex(self, queryset, *indexes):
+        plan = queryset.explain()
+        self.assertTrue(any(index in plan for index in indexes), msg=plan)
+    
+    def test_room_conflict_check(self):
+        # As in book_room
+        now = timezone.now()
+        queryset = Reservation.objects.active().filter(room=self.room).exclude(
+            user__role='manager'
+        ).filter(check_in__lt=now + timedelta(days=3), check_out__gt=now)
+        # SQLite cannot use the partial index with the statuses bound as parameters
+        self.assertUsesIndex(queryset, 'reservation_active_room_dates', 'reservation_room_status_dates')
+    
+    def test_current_reservation_of_user(self):
+        self.assertUsesIndex(Reservation.objects.active().filter(user=self.user), 'reservation_user_status')
+    
+    def test_expired_reservations(self):
+        self.assertUsesIndex(Reservation.objects.expired(), 'reservation_status_checkout')
+    
+    def test_room_history(self):
+        queryset = self.room.occupancy_history.order_by(*HISTORY_ORDERING)[:50]
+        self.assertUsesIndex(queryset, 'occupancy_room_timestamp_id')
+
+
+class OverlapTests(TestCase):
+    """The database applies book_room's overlap rule to any write"""
+    
+    def setUp(self):
+        self.room = Room.objects.create(room_number='101')
+        self.guest = User.objects.create(username='guest')
+        self.other = User.objects.create(username='other')
+        self.check_in = timezone.now() + timedelta(days=1)
+    
+    def reserve(self, user, days=None):
+        return Reservation.objects.create(
+            user=user,
+            room=self.room,
+            check_in=self.check_in if days else None,
+            check_out=self.check_in + timedelta(days=days) if days else None
+        )
+    
+    def test_overlap_written_around_book_room_is_rejected(self):
+        self.reserve(self.guest, days=3)
+        with self.assertRaisesMessage(IntegrityError, 'reservation_no_overlap'):
+            self.reserve(self.other, days=1)
+    
+    def test_undated_reservations_only_clash_with_undated(self):
+        self.reserve(self.guest, days=3)
+        self.reserve(self.other)
+        with self.assertRaisesMessage(IntegrityError, 'reservation_no_overlap'):
+            self.reserve(User.objects.create(username='third'))
+    
+    def test_conflict_found_by_database_is_reported(self):
+        self.reserve(self.other, days=3)
+        start = self.check_in.date()
+        # As if the reservation was written after book_room's own check
+        with mock.patch.object(Reservation.objects, 'active', return_value=Reservation.objects.none()):
+            with self.assertRaisesMessage(BookingConflict, 'Room 101 was just reserved for overlapping dates'):
+                book_room(self.guest, self.room, start, start + timedelta(days=1))
+    
+    def test_manager_reservations_are_ignored(self):
+        manager = User.objects.create(username='manager', role='manager')
+        self.reserve(manager, days=3)
+        start = self.check_in.date()
+        book_room(self.guest, self.room, start, start + timedelta(days=2))
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    def test_one_of_two_concurrent_bookings_wins(self):
+        room = Room.objects.create(room_number='101')
+        users = [User.objects.create(username=f'guest{i}') for i in range(2)]
+        check_in = date.today() + timedelta(days=1)
+        barrier = threading.Barrier(len(users))
+        outcomes = []
+        
+        def book(user):
+            try:
+                barrier.wait()
+                book_room(user, room, check_in, check_in + timedelta(days=2))
+                outcomes.append('booked')
+            except BookingConflict:
+                outcomes.append('conflict')
+            finally:
+                # Each thread has its own database connection
+                connection.close()
+        
+        threads = [threading.Thread(target=book, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(sorted(outcomes), ['booked', 'conflict'])
+        self.assertEqual(Reservation.objects.filter(room=room).count(), 1)
+
+
+class ExpireReservationsTests(TestCase):
+    def setUp(self):
+        self.guest = User.objects.create(username='guest')
+        self.handler = mock.Mock()
+        reservations_expired.connect(self.handler)
+        self.addCleanup(reservations_expired.disconnect, self.handler)
+    
+    def reserve(self, number, status, check_in, check_out):
+        return Reservation.objects.create(
+            user=self.guest,
+            room=Room.objects.create(room_number=number),
+            status=status,
+            check_in=check_in,
+            check_out=check_out
+        )
+    
+    def test_only_past_check_outs_are_completed(self):
+        now = timezone.now()
+        past = [
+            self.reserve('101', 'reserved', day(-5), day(-2)),
+            self.reserve('102', 'active', day(-3), day(-1) + timedelta(hours=23)),
+        ]
+        kept = [
+            self.reserve('103', 'cancelled', day(-5), day(-2)),
+            self.reserve('104', 'active', now - timedelta(days=2), day(0)),
+            self.reserve('105', 'reserved', day(1), day(3)),
+        ]
+        self.assertEqual(expire_reservations(), 2)
+        self.handler.assert_called_once_with(signal=reservations_expired, sender=Reservation, count=2)
+        statuses = dict(Reservation.objects.values_list('id', 'status'))
+        self.assertEqual([statuses[r.id] for r in past], ['completed', 'completed'])
+        self.assertEqual([statuses[r.id] for r in kept], ['cancelled', 'active', 'reserved'])
+        
+        # Nothing left to expire, and no signal for it
+        self.assertEqual(expire_reservations(), 0)
+        self.assertEqual(self.handler.call_count, 1)
+
+
+def day(n):
+    """Midnight n days from today"""
+    return start_of_day(date.today() + timedelta(days=n))
+
+
+class AvailabilityIndexTests(SimpleTestCase):
+    def index(self, *reservations):
+        return AvailabilityIndex([1, 2, 3], reservations)
+    
+    def test_touching_ranges_are_free(self):
+        index = self.index((1, day(1), day(3)))
+        self.assertTrue(index.is_free(1, day(3), day(5)))
+        self.assertTrue(index.is_free(1, day(0), day(1)))
+        self.assertFalse(index.is_free(1, day(2), day(4)))
+    
+    def test_nested_reservation_does_not_hide_enclosing_one(self):
+        # The stay starting last ends first; only the running maximum of
+        # the ends shows that day 5 is still taken
+        index = self.index((1, day(1), day(10)), (1, day(2), day(3)))
+        self.assertFalse(index.is_free(1, day(5), day(6)))
+        self.assertTrue(index.is_free(1, day(10), day(11)))
+    
+    def test_open_ended_reservations(self):
+        index = self.index((1, None, day(5)), (2, day(5), None))
+        self.assertFalse(index.is_free(1, day(1), day(2)))
+        self.assertTrue(index.is_free(1, day(5), day(6)))
+        self.assertFalse(index.is_free(2, day(8), day(9)))
+        self.assertTrue(index.is_free(2, day(1), day(5)))
+    
+    def test_undated_reservation_blocks_room(self):
+        index = self.index((3, None, None))
+        self.assertFalse(index.is_free(3, day(100), day(101)))
+    
+    def test_free_rooms_keep_room_order(self):
+        index = self.index((2, day(1), day(3)))
+        self.assertEqual(index.free_rooms(day(1), day(2)), [1, 3])
+        self.assertEqual(index.free_rooms(day(3), day(4)), [1, 2, 3])
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create(room_number='101')
+        self.guest = User.objects.create(username='guest')
+    
+    def reserve(self, user, room, start, end):
+        return Reservation.objects.create(user=user, room=room, check_in=day(start), check_out=day(end))
+    
+    def free_numbers(self, start, end):
+        rooms = find_free_rooms(date.today() + timedelta(days=start), date.today() + timedelta(days=end))
+        return [room.room_number for room in rooms]
+    
+    def test_manager_reservations_are_ignored(self):
+        manager = User.objects.create(username='manager', role='manager')
+        self.reserve(manager, self.room, 1, 3)
+        self.assertEqual(self.free_numbers(1, 2), ['101'])
+    
+    def test_index_is_rebuilt_after_reservation_is_saved(self):
+        index = get_availability_index()
+        self.assertIs(get_availability_index(), index)
+        self.assertEqual(self.free_numbers(1, 2), ['101'])
+        self.reserve(self.guest, self.room, 1, 3)
+        self.assertIsNot(get_availability_index(), index)
+        self.assertEqual(self.free_numbers(1, 2), [])
+    
+    def test_matches_overlap_query_on_random_ranges(self):
+        rng = random.Random(0)
+        rooms = [self.room] + [Room.objects.create(room_number=str(102 + i)) for i in range(9)]
+        for number, room in enumerate(rooms):
+            start = rng.randint(0, 3)
+            while start < 40:
+                end = start + rng.randint(1, 4)
+                self.reserve(User.objects.create(username=f'guest{number}-{start}'), room, start, end)
+                start = end + rng.randint(0, 3)
+        
+        for _ in range(50):
+            start = rng.randint(0, 40)
+            end = start + rng.randint(1, 5)
+            taken = Reservation.objects.active().filter(
+                check_in__lt=day(end), check_out__gt=day(start)
+            ).values('room_id')
+            expected = Room.objects.exclude(id__in=taken).order_by('room_number')
+            self.assertEqual(self.free_numbers(start, end), [room.room_number for room in expected])
+    
+    def test_api_rejects_invalid_dates(self):
+        self.client.force_login(self.guest)
+        tomorrow = date.today() + timedelta(days=1)
+        for params in (
+            {},
+            {'check_in': 'soon', 'check_out': tomorrow},
+            {'check_in': tomorrow, 'check_out': tomorrow},
+            {'check_in': date.today() - timedelta(days=1), 'check_out': tomorrow},
+        ):
+            response = self.client.get('/api/rooms/available/', params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('errors', response.json())
+    
+    def test_api_lists_free_rooms(self):
+        self.client.force_login(self.guest)
+        Room.objects.create(room_number='102')
+        self.reserve(self.guest, self.room, 1, 3)
+        tomorrow = date.today() + timedelta(days=1)
+        response = self.client.get('/api/rooms/available/', {'check_in': tomorrow, 'check_out': tomorrow + timedelta(days=1)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([room['room_number'] for room in response.json()['rooms']], ['102'])
@@ -5,6 +5,7 @@ app_name = 'reservations'
 
 urlpatterns = [
     path('', views.reservation_page, name='reservation_page'),
+    path('search/', views.search_rooms, name='search_rooms'),
     path('reserve/<str:room_number>/', views.reserve_room, name='reserve_room'),
     path('cancel/<int:reservation_id>/', views.cancel_reservation, name='cancel_reservation'),
 ]
@@ -1,111 +1,90 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
 from django.utils import timezone
-from datetime import datetime
+from echo_occupancy.replicas import read_from_replica
+from rooms.exports import ExportError, export_response, parse_export_params
 from rooms.models import Room
 from .models import Reservation
-from .forms import ReservationForm
+from .forms import ReservationForm, AvailabilitySearchForm
+from .availability import find_free_rooms
+from .services import book_room, BookingConflict
 
 
-def mark_expired_reservations_completed():
-    """Mark reservations as completed if check-out date has passed"""
-    today = timezone.now().date()
-    expired_reservations = Reservation.objects.filter(
-        status__in=['reserved', 'active'],
-        check_out__isnull=False
-    )
+def index_reservations(rows, today):
+    """
+    Map each room to its current and its upcoming reservation in one pass
+    
+    A reservation is current when today lies between its check-in and
+    check-out dates, or when it is missing either date. Otherwise it is
+    upcoming when it checks in after today. Rows are taken in the order
+    given and the first match per room wins.
     
-    for reservation in expired_reservations:
-        if reservation.check_out.date() < today:
-            reservation.status = 'completed'
-            reservation.save()
+    Args:
+        rows: Iterable of (id, room_id, check_in, check_out)
+        today: Date to resolve against
+    
+    Returns:
+        tuple: (room_id -> current reservation ID, room_id -> upcoming reservation ID)
+    """
+    current = {}
+    upcoming = {}
+    for reservation_id, room_id, check_in, check_out in rows:
+        if check_in and check_out:
+            check_in_date = check_in.date()
+            # Room is active only if today is within the reservation period (check_in <= today <= check_out)
+            if check_in_date <= today <= check_out.date():
+                current.setdefault(room_id, reservation_id)
+            elif check_in_date > today:
+                upcoming.setdefault(room_id, reservation_id)
+        else:
+            # If no dates set but status is active/reserved, consider it active
+            current.setdefault(room_id, reservation_id)
+    return current, upcoming
 
 
 @login_required
+@read_from_replica
 def reservation_page(request):
     """Reservation page where users can select and reserve rooms"""
-    # Mark expired reservations as completed
-    mark_expired_reservations_completed()
-    
     user = request.user
-    
-    # Get all rooms
-    all_rooms = Room.objects.all()
-    
-    # Get all active reservations (exclude manager reservations and completed/cancelled)
+    is_manager = user.is_manager()
     today = timezone.now().date()
-    today_dt = timezone.now()
-    active_reservations = Reservation.objects.filter(
-        status__in=['reserved', 'active']
-    ).select_related('room', 'user').exclude(
-        user__role='manager'  # Exclude manager reservations
-    )
-    
-    # Filter reservations that are currently active (today is within reservation period)
-    # A room is reserved only if today is between check-in and check-out dates
-    currently_active = []
-    for res in active_reservations:
-        # Skip manager reservations
-        if res.user.is_manager():
-            continue
-        
-        # If reservation has dates, check if today is within the reservation period
-        if res.check_in and res.check_out:
-            check_in_date = res.check_in.date() if hasattr(res.check_in, 'date') else res.check_in
-            check_out_date = res.check_out.date() if hasattr(res.check_out, 'date') else res.check_out
-            # Room is active only if today is within the reservation period (check_in <= today <= check_out)
-            if check_in_date <= today <= check_out_date:
-                currently_active.append(res)
-        elif res.status in ['reserved', 'active']:
-            # If no dates set but status is active/reserved, consider it active
-            currently_active.append(res)
     
-    # Create a set of reserved room IDs (only rooms where today is within reservation period)
-    reserved_room_ids = {res.room.id for res in currently_active}
-    
-    # Get user's current reservation
-    user_reservation = None
-    if not user.is_manager():
-        user_reservation = Reservation.objects.filter(
-            user=user,
-            status__in=['reserved', 'active']
-        ).order_by('-reserved_at').first()
-    
-    # Prepare room data with status
-    # Also get all future reservations to show in UI
-    all_future_reservations = Reservation.objects.filter(
-        status__in=['reserved', 'active']
-    ).select_related('room', 'user').exclude(
+    # Scan active reservations of normal users as plain rows, then load
+    # only the ones shown (at most two per room)
+    active_rows = Reservation.objects.active().exclude(
         user__role='manager'
+    ).values_list('id', 'room_id', 'check_in', 'check_out')
+    current_ids, upcoming_ids = index_reservations(active_rows, today)
+    shown = Reservation.objects.select_related('user').in_bulk(
+        set(current_ids.values()) | set(upcoming_ids.values())
     )
+    current = {room_id: shown[res_id] for room_id, res_id in current_ids.items()}
+    upcoming = {room_id: shown[res_id] for room_id, res_id in upcoming_ids.items()}
+    
+    # Get user's current reservation (None for managers)
+    user_reservation = request.current_reservation
     
     rooms_data = []
-    for room in all_rooms:
-        is_reserved = room.id in reserved_room_ids
-        reservation = next((r for r in currently_active if r.room == room), None)
+    for room in Room.objects.all():
+        reservation = current.get(room.id)
+        is_reserved = reservation is not None
+        is_own = is_reserved and reservation.user_id == user.id
         
-        # Get future reservation for this room (if any) to show dates
-        future_reservation = None
-        if not reservation:
-            future_res = next((r for r in all_future_reservations if r.room == room and r.check_in and r.check_in.date() > today), None)
-            if future_res:
-                future_reservation = future_res
+        # Future reservation is only shown for rooms that are free today
+        future_reservation = None if is_reserved else upcoming.get(room.id)
         
-        # Determine if user can select this room
-        # Room can be selected if:
-        # 1. Not currently reserved (today is not within reservation period)
-        # 2. Or it's the user's own reservation
-        can_select = not is_reserved or (reservation and reservation.user == user)
+        # Room can be selected if it is not reserved today, or it is the user's own reservation
+        can_select = not is_reserved or is_own
         
         # Determine color
-        if reservation and reservation.user == user:
+        if is_own:
             color = 'green'  # User's selected room
         elif is_reserved:
             color = 'yellow'  # Currently rented/reserved by someone else
-        elif future_reservation:
-            color = 'white'  # Available but has future reservation
         else:
             color = 'white'  # Available
         
@@ -121,7 +100,7 @@ def reservation_page(request):
     context = {
         'rooms_data': rooms_data,
         'user_reservation': user_reservation,
-        'is_manager': user.is_manager(),
+        'is_manager': is_manager,
     }
     
     return render(request, 'reservations/reservation_page.html', context)
@@ -139,10 +118,7 @@ def reserve_room(request, room_number):
         return redirect('reservations:reservation_page')
     
     # Check if user already has an active reservation
-    existing_reservation = Reservation.objects.filter(
-        user=user,
-        status__in=['reserved', 'active']
-    ).first()
+    existing_reservation = request.current_reservation
     
     if existing_reservation:
         if existing_reservation.room == room:
@@ -158,76 +134,20 @@ def reserve_room(request, room_number):
             check_in_date = form.cleaned_data.get('check_in_date')
             check_out_date = form.cleaned_data.get('check_out_date')
             
-            # Check for date conflicts with existing reservations
-            # Allow booking if dates don't overlap with existing reservations
-            existing_reservations = Reservation.objects.filter(
-                room=room,
-                status__in=['reserved', 'active']
-            ).exclude(user__role='manager')
-            
-            if check_in_date and check_out_date:
-                # Convert to datetime for comparison
-                check_in_dt = timezone.make_aware(
-                    datetime.combine(check_in_date, datetime.min.time())
-                )
-                check_out_dt = timezone.make_aware(
-                    datetime.combine(check_out_date, datetime.min.time())
-                )
-                
-                # Check for overlapping reservations
-                # Two reservations overlap if: 
-                # - new check-in is between existing check-in and check-out, OR
-                # - new check-out is between existing check-in and check-out, OR
-                # - new reservation completely contains existing reservation
-                conflicting_reservations = existing_reservations.filter(
-                    check_in__isnull=False,
-                    check_out__isnull=False
-                ).exclude(
-                    Q(check_out__lte=check_in_dt) | Q(check_in__gte=check_out_dt)
+            # Checks and insert run in one transaction with the room locked
+            try:
+                book_room(
+                    user, room, check_in_date, check_out_date,
+                    notes=form.cleaned_data.get('notes', '')
                 )
-                
-                if conflicting_reservations.exists():
-                    conflict = conflicting_reservations.first()
-                    messages.error(
-                        request, 
-                        f'Room {room_number} is already reserved from {conflict.check_in.date()} to {conflict.check_out.date()}. Please choose different dates.'
-                    )
-                    return render(request, 'reservations/reserve_room.html', {
-                        'form': form,
-                        'room': room,
-                        'room_number': room_number
-                    })
-            else:
-                # If no dates provided, check if room has any active reservation
-                active_reservation = existing_reservations.filter(
-                    check_in__isnull=True,
-                    check_out__isnull=True
-                ).first()
-                
-                if active_reservation:
-                    messages.error(request, f'Room {room_number} is already reserved by another user.')
-                    return render(request, 'reservations/reserve_room.html', {
-                        'form': form,
-                        'room': room,
-                        'room_number': room_number
-                    })
+            except BookingConflict as e:
+                messages.error(request, str(e))
+                return render(request, 'reservations/reserve_room.html', {
+                    'form': form,
+                    'room': room,
+                    'room_number': room_number
+                })
             
-            reservation = form.save(commit=False)
-            reservation.user = user
-            reservation.room = room
-            reservation.status = 'reserved'
-            
-            # Convert date to datetime for check_in and check_out
-            if check_in_date:
-                reservation.check_in = timezone.make_aware(
-                    datetime.combine(check_in_date, datetime.min.time())
-                )
-            if check_out_date:
-                reservation.check_out = timezone.make_aware(
-                    datetime.combine(check_out_date, datetime.min.time())
-                )
-            
-            reservation.save()
             messages.success(
                 request, 
                 f'Room {room_number} has been reserved from {check_in_date} to {check_out_date}!'
@@ -247,7 +167,11 @@ def reserve_room(request, room_number):
                 'room_number': room_number
             })
     else:
-        form = ReservationForm()
+        # Dates chosen on the availability search are carried over
+        form = ReservationForm(initial={
+            'check_in_date': request.GET.get('check_in'),
+            'check_out_date': request.GET.get('check_out'),
+        })
     
     # If GET request, show reservation form
     return render(request, 'reservations/reserve_room.html', {
@@ -278,3 +202,87 @@ def cancel_reservation(request, reservation_id):
     
     return redirect('reservations:reservation_page')
 
+
+@login_required
+@read_from_replica
+def search_rooms(request):
+    """Find rooms that are free for a whole date range"""
+    form = AvailabilitySearchForm(request.GET or None)
+    free_rooms = None
+    if form.is_valid():
+        free_rooms = find_free_rooms(
+            form.cleaned_data['check_in_date'],
+            form.cleaned_data['check_out_date']
+        )
+    
+    context = {
+        'form': form,
+        'free_rooms': free_rooms,
+        'is_manager': request.user.is_manager(),
+    }
+    return render(request, 'reservations/search_rooms.html', context)
+
+
+@login_required
+@require_GET
+def available_rooms_api(request):
+    """
+    JSON list of rooms free for ?check_in=YYYY-MM-DD&check_out=YYYY-MM-DD
+    
+    Returns 400 with the form errors if the dates are missing or invalid.
+    """
+    form = AvailabilitySearchForm({
+        'check_in_date': request.GET.get('check_in'),
+        'check_out_date': request.GET.get('check_out'),
+    })
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    
+    check_in = form.cleaned_data['check_in_date']
+    check_out = form.cleaned_data['check_out_date']
+    rooms = find_free_rooms(check_in, check_out)
+    return JsonResponse({
+        'check_in': check_in.isoformat(),
+        'check_out': check_out.isoformat(),
+        'rooms': [
+            {'room_number': room.room_number, 'has_iot_device': room.has_iot_device}
+            for room in rooms
+        ],
+    })
+
+
+@login_required
+@require_GET
+def export_reservations(request):
+    """
+    Stream reservations as CSV or JSON Lines, managers only
+    
+    Accepts the parameters of rooms.exports.parse_export_params();
+    since/until keep stays overlapping the range, plus an optional
+    ?status= filter.
+    """
+    if not request.user.is_manager():
+        return JsonResponse({'error': 'Only managers can export data.'}, status=403)
+    try:
+        params = parse_export_params(request)
+    except ExportError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    reservations = Reservation.objects.all()
+    if params['room_numbers']:
+        reservations = reservations.filter(room__room_number__in=params['room_numbers'])
+    if params['since']:
+        reservations = reservations.filter(check_out__gte=params['since'])
+    if params['until']:
+        reservations = reservations.filter(check_in__lt=params['until'])
+    if request.GET.get('status'):
+        reservations = reservations.filter(status=request.GET['status'])
+    
+    return export_response(
+        request,
+        reservations,
+        ['id', 'room', 'user', 'status', 'check_in', 'check_out', 'reserved_at', 'notes'],
+        ['room__room_number', 'user__username', 'status', 'check_in', 'check_out', 'reserved_at', 'notes'],
+        'reservations',
+        params
+    )
@@ -1,12 +1,30 @@
 from django.contrib import admin
-from .models import Room, OccupancyData
+from .models import Building, Floor, Room, OccupancyData, DeviceState, OccupancyHourly, OccupancyDaily, OccupancyAlert
+
+
+class FloorInline(admin.TabularInline):
+    model = Floor
+    extra = 0
+
+
+@admin.register(Building)
+class BuildingAdmin(admin.ModelAdmin):
+    list_display = ['code', 'name']
+    search_fields = ['code', 'name']
+    inlines = [FloorInline]
 
 
 @admin.register(Room)
 class RoomAdmin(admin.ModelAdmin):
-    list_display = ['room_number', 'has_iot_device', 'iot_device_id']
-    list_filter = ['has_iot_device']
+    list_display = ['room_number', 'building', 'floor', 'has_iot_device', 'iot_device_id']
+    list_filter = ['building', 'has_iot_device']
+    list_select_related = ['building', 'floor__building']
     search_fields = ['room_number']
+    
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'floor':
+            kwargs['queryset'] = Floor.objects.select_related('building')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
 @admin.register(OccupancyData)
@@ -16,3 +34,32 @@ class OccupancyDataAdmin(admin.ModelAdmin):
     readonly_fields = ['timestamp']
     date_hierarchy = 'timestamp'
 
+
+@admin.register(DeviceState)
+class DeviceStateAdmin(admin.ModelAdmin):
+    list_display = ['device_id', 'is_occupied', 'updated_at']
+    list_filter = ['is_occupied']
+    search_fields = ['device_id']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(OccupancyHourly)
+class OccupancyHourlyAdmin(admin.ModelAdmin):
+    list_display = ['room', 'hour', 'occupied_seconds', 'transitions', 'samples']
+    list_filter = ['hour']
+    date_hierarchy = 'hour'
+
+
+@admin.register(OccupancyDaily)
+class OccupancyDailyAdmin(admin.ModelAdmin):
+    list_display = ['room', 'day', 'occupied_seconds', 'transitions', 'samples']
+    list_filter = ['day']
+    date_hierarchy = 'day'
+
+
+@admin.register(OccupancyAlert)
+class OccupancyAlertAdmin(admin.ModelAdmin):
+    list_display = ['room', 'kind', 'started_at', 'resolved_at', 'reservation']
+    list_filter = ['kind', 'started_at']
+    search_fields = ['room__room_number']
+    date_hierarchy = 'started_at'
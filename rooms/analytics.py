@@ -0,0 +1,219 @@
+"""
+Occupancy analytics for managers: hour-of-week heatmaps and utilization
+
+Reports cover whole UTC days and are computed from the daily rollups (see
+rooms.rollups), never from raw OccupancyData. Each daily row holds the
+occupied seconds of its 24 hours as columns, so the database sums a
+period into one row per room and weekday and Python only handles 168
+numbers per room however long the period is. Reservations are read as
+plain (room_id, check_in, check_out) rows.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .models import Room, OccupancyDaily, HOURLY_FIELDS
+from reservations.models import Reservation, start_of_day
+
+
+HOURS_PER_WEEK = 168
+MAX_REPORT_DAYS = 400
+
+# Reservations that held the room, whether or not they are over yet
+UTILIZED_STATUSES = ['reserved', 'active', 'completed']
+
+
+class AnalyticsError(ValueError):
+    """Raised for invalid report parameters; the message is returned to the client"""
+
+
+def parse_report_params(request, default_days=28):
+    """
+    Read the period and rooms of a utilization report
+    
+    Query parameters:
+        since: First day to include (YYYY-MM-DD), default default_days
+            before until
+        until: Day to stop before (YYYY-MM-DD), default tomorrow
+        rooms: Comma separated room numbers
+    
+    Raises:
+        AnalyticsError: If a parameter is invalid or the period is too long
+    """
+    days = {}
+    for name in ('since', 'until'):
+        value = request.GET.get(name)
+        try:
+            days[name] = parse_date(value) if value else None
+        except ValueError:
+            # Well formed but not a date, e.g. 2026-02-30
+            days[name] = None
+        if value and days[name] is None:
+            raise AnalyticsError(f'Invalid {name} date "{value}", expected YYYY-MM-DD')
+    
+    until = days['until'] or timezone.now().date() + timedelta(days=1)
+    since = days['since'] or until - timedelta(days=default_days)
+    if since >= until:
+        raise AnalyticsError('since must be before until')
+    if (until - since).days > MAX_REPORT_DAYS:
+        raise AnalyticsError(f'Reports cover at most {MAX_REPORT_DAYS} days')
+    
+    return {
+        'start': start_of_day(since),
+        'end': start_of_day(until),
+        'room_numbers': [n.strip() for n in request.GET.get('rooms', '').split(',') if n.strip()],
+    }
+
+
+def days_per_weekday(start, end):
+    """
+    Number of days between start and end on each day of the week
+    
+    Returns:
+        list: 7 counts, index 0 being Monday
+    """
+    first = start.date()
+    days = (end.date() - first).days
+    counts = [days // 7] * 7
+    for offset in range(days % 7):
+        counts[(first.weekday() + offset) % 7] += 1
+    return counts
+
+
+def occupancy_heatmap(start, end, room_ids=None):
+    """
+    Sensor occupancy rate per room and hour of the week
+    
+    Args:
+        start: First day to include
+        end: Day to stop before
+        room_ids: Rooms to include, default all with rollups in the period
+    
+    Returns:
+        dict: room id -> list of 168 occupancy rates between 0 and 1
+    """
+    days = days_per_weekday(start, end)
+    cells = OccupancyDaily.objects.filter(day__gte=start.date(), day__lt=end.date())
+    if room_ids is not None:
+        cells = cells.filter(room_id__in=room_ids)
+    cells = cells.values('room_id', 'weekday').annotate(
+        **{f'total_{field}': Sum(field) for field in HOURLY_FIELDS}
+    ).order_by().values_list('room_id', 'weekday', *(f'total_{field}' for field in HOURLY_FIELDS))
+    
+    heatmap = {}
+    for room_id, weekday, *hours in cells.iterator():
+        row = heatmap.get(room_id)
+        if row is None:
+            row = heatmap[room_id] = [0.0] * HOURS_PER_WEEK
+        if days[weekday]:
+            for hour, occupied in enumerate(hours):
+                row[weekday * 24 + hour] = min(occupied / (days[weekday] * 3600), 1.0)
+    return heatmap
+
+
+def reservation_totals(start, end, room_ids=None):
+    """
+    Reserved time and stays per room in a period
+    
+    Only reservations of normal users with both dates count. Reserved time
+    is clipped to the period; stays are the full length of the
+    reservations that start in it.
+    
+    Returns:
+        dict: room id -> {'reserved_seconds', 'stays', 'stay_seconds'}
+    """
+    reservations = Reservation.objects.filter(
+        status__in=UTILIZED_STATUSES,
+        check_in__lt=end,
+        check_out__gt=start
+    ).exclude(user__role='manager')
+    if room_ids is not None:
+        reservations = reservations.filter(room_id__in=room_ids)
+    
+    totals = defaultdict(lambda: {'reserved_seconds': 0.0, 'stays': 0, 'stay_seconds': 0.0})
+    for room_id, check_in, check_out in reservations.values_list(
+        'room_id', 'check_in', 'check_out'
+    ).iterator(chunk_size=5000):
+        room_totals = totals[room_id]
+        room_totals['reserved_seconds'] += (min(check_out, end) - max(check_in, start)).total_seconds()
+        if check_in >= start:
+            room_totals['stays'] += 1
+            room_totals['stay_seconds'] += (check_out - check_in).total_seconds()
+    return totals
+
+
+def _average_days(stay_seconds, stays):
+    return round(stay_seconds / stays / 86400, 2) if stays else None
+
+
+def _mean(values):
+    return round(sum(values) / len(values), 4) if values else None
+
+
+def utilization_report(start, end, room_numbers=None, include_heatmaps=True):
+    """
+    Occupancy and reservation utilization of rooms between start and end
+    
+    sensor_rate is the share of the period a room's sensor reported it
+    occupied, reserved_rate the share it was reserved. The summary
+    heatmap averages the rooms that have sensor data.
+    
+    Args:
+        start: Aware datetime, start of the period
+        end: Aware datetime, end of the period
+        room_numbers: Rooms to report on, default all
+        include_heatmaps: Include each room's 168-hour heatmap
+    
+    Returns:
+        dict: 'start', 'end', 'summary' and 'rooms', one entry per room
+    """
+    rooms = Room.objects.order_by('room_number')
+    if room_numbers:
+        rooms = rooms.filter(room_number__in=room_numbers)
+    rooms = list(rooms.values_list('id', 'room_number', 'has_iot_device'))
+    room_ids = [room_id for room_id, _, _ in rooms] if room_numbers else None
+    
+    heatmap = occupancy_heatmap(start, end, room_ids)
+    totals = reservation_totals(start, end, room_ids)
+    days = days_per_weekday(start, end)
+    period_seconds = sum(days) * 86400 or 1
+    
+    report_rooms = []
+    for room_id, room_number, has_iot_device in rooms:
+        rates = heatmap.get(room_id)
+        room_totals = totals.get(room_id, {'reserved_seconds': 0.0, 'stays': 0, 'stay_seconds': 0.0})
+        sensor_rate = None
+        if rates is not None:
+            occupied_seconds = sum(rate * days[slot // 24] * 3600 for slot, rate in enumerate(rates))
+            sensor_rate = round(occupied_seconds / period_seconds, 4)
+        entry = {
+            'room_number': room_number,
+            'has_iot_device': has_iot_device,
+            'sensor_rate': sensor_rate,
+            'reserved_rate': round(min(room_totals['reserved_seconds'] / period_seconds, 1.0), 4),
+            'stays': room_totals['stays'],
+            'average_stay_days': _average_days(room_totals['stay_seconds'], room_totals['stays']),
+        }
+        if include_heatmaps:
+            entry['heatmap'] = [round(rate, 4) for rate in rates] if rates is not None else None
+        report_rooms.append(entry)
+    
+    sensed = list(heatmap.values())
+    stays = sum(room_totals['stays'] for room_totals in totals.values())
+    stay_seconds = sum(room_totals['stay_seconds'] for room_totals in totals.values())
+    summary = {
+        'rooms': len(report_rooms),
+        'rooms_with_sensor_data': len(sensed),
+        'sensor_rate': _mean([entry['sensor_rate'] for entry in report_rooms if entry['sensor_rate'] is not None]),
+        'reserved_rate': _mean([entry['reserved_rate'] for entry in report_rooms]),
+        'stays': stays,
+        'average_stay_days': _average_days(stay_seconds, stays),
+        'heatmap': [_mean(column) for column in zip(*sensed)] if sensed else None,
+    }
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'summary': summary,
+        'rooms': report_rooms,
+    }
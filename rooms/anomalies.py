@@ -0,0 +1,360 @@
+"""
+Streaming detection of rooms whose sensor disagrees with their reservations
+
+Room.get_current_occupancy_status stops at the reservation, so sensor data
+is never compared with it. AnomalyDetector consumes occupancy events as
+they arrive and checks each one against an in-memory index of the days
+each room is reserved on, which costs a dictionary lookup and a bisect
+rather than a query. A room occupied without a reservation, or vacant
+while reserved, raises an OccupancyAlert once the mismatch has lasted
+ANOMALY_OCCUPIED_AFTER or ANOMALY_VACANT_AFTER seconds, and the alert is
+resolved as soon as sensor and reservations agree again. Alerts are
+written in batches.
+"""
+import heapq
+import queue
+import threading
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date, timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from reservations.availability import get_availability_version
+from reservations.models import Reservation, start_of_day
+from .models import Room, DeviceState, OccupancyAlert
+
+
+class ReservationDays:
+    """
+    Days each room is reserved on
+    
+    As on the dashboard, a reservation holds its room from the check-in
+    day through the check-out day, and one without dates holds it every
+    day.
+    """
+    
+    def __init__(self, reservations):
+        """
+        Args:
+            reservations: Iterable of (id, room_id, check_in, check_out)
+        """
+        self.undated = {}
+        spans = defaultdict(list)
+        for reservation_id, room_id, check_in, check_out in reservations:
+            if check_in is None and check_out is None:
+                self.undated.setdefault(room_id, reservation_id)
+                continue
+            spans[room_id].append((
+                timezone.localdate(check_in) if check_in else date.min,
+                timezone.localdate(check_out) if check_out else date.max,
+                reservation_id
+            ))
+        
+        self._spans = {}
+        for room_id, room_spans in spans.items():
+            room_spans.sort()
+            self._spans[room_id] = ([first for first, _, _ in room_spans], room_spans)
+    
+    @classmethod
+    def build(cls, today=None):
+        """Load active non-manager reservations in one query"""
+        return cls(Reservation.objects.active(today).exclude(
+            user__role='manager'
+        ).values_list('id', 'room_id', 'check_in', 'check_out'))
+    
+    def reservation_on(self, room_id, day):
+        """ID of the reservation holding the room on day, or None"""
+        reservation_id = self.undated.get(room_id)
+        if reservation_id is not None:
+            return reservation_id
+        entry = self._spans.get(room_id)
+        if entry is None:
+            return None
+        firsts, spans = entry
+        # Reservations of a room do not overlap, so only the last one
+        # starting by day can hold it
+        i = bisect_right(firsts, day)
+        if i and spans[i - 1][1] >= day:
+            return spans[i - 1][2]
+        return None
+
+
+class AnomalyDetector:
+    """
+    Raises OccupancyAlerts from a stream of occupancy events
+    
+    observe() and tick() do the work and can be called directly; alerts
+    are only written by flush(). start() instead runs them on a background
+    thread fed by submit(), which flushes after every batch of events and
+    ticks while none arrive, so mismatches that outlast their delay
+    without a further event are still raised. close() writes whatever is
+    left.
+    
+    Usage:
+        with AnomalyDetector() as detector:
+            detector.submit('101', True)
+    """
+    
+    def __init__(self, occupied_after=None, vacant_after=None, refresh_interval=None,
+                 tick_interval=1.0, batch_size=1000):
+        if occupied_after is None:
+            occupied_after = getattr(settings, 'ANOMALY_OCCUPIED_AFTER', 900)
+        if vacant_after is None:
+            vacant_after = getattr(settings, 'ANOMALY_VACANT_AFTER', 86400)
+        if refresh_interval is None:
+            refresh_interval = getattr(settings, 'ANOMALY_REFRESH_INTERVAL', 30.0)
+        self.delays = {
+            'unreserved_occupied': timedelta(seconds=occupied_after),
+            'reserved_vacant': timedelta(seconds=vacant_after),
+        }
+        self.refresh_interval = refresh_interval
+        self.tick_interval = tick_interval
+        self.batch_size = batch_size
+        self.events = 0
+        self.ignored = 0
+        self.raised = 0
+        self.resolved = 0
+        self._key = None
+        self._checked_at = 0.0
+        self._day = None
+        self._day_bounds = (None, None)
+        self._device_rooms = {}
+        self._reservations = None
+        # room id -> last reported occupancy
+        self._states = {}
+        # room id -> ((kind, reservation id), since) of the current mismatch
+        self._pending = {}
+        # room id -> open OccupancyAlert
+        self._open = {}
+        # (deadline, room id, since) of pending mismatches, stale entries included
+        self._due = []
+        self._created = []
+        self._updated = []
+        self._queue = queue.Queue()
+        self._thread = None
+    
+    def load(self, now=None):
+        """
+        Load rooms, reservations, open alerts and the last state of every device
+        
+        Mismatches found in DeviceState count from the device's last update.
+        """
+        now = now or timezone.now()
+        self._open = {
+            alert.room_id: alert
+            for alert in OccupancyAlert.objects.filter(resolved_at__isnull=True)
+        }
+        self.refresh(now, force=True)
+        for device_id, is_occupied, updated_at in DeviceState.objects.values_list(
+            'device_id', 'is_occupied', 'updated_at'
+        ):
+            room_id = self._device_rooms.get(device_id)
+            if room_id is not None:
+                self._states[room_id] = is_occupied
+                self._evaluate(room_id, now, since=min(updated_at, now))
+    
+    def refresh(self, now, force=False):
+        """
+        Reload rooms and reservations if they changed, then re-check every room
+        
+        The availability version is read at most every refresh_interval
+        seconds, and on the first event of a new day.
+        
+        Returns:
+            bool: Whether the index was rebuilt
+        """
+        day = self._local_day(now)
+        checked_at = time.monotonic()
+        if not force and self._key[1] == day and checked_at - self._checked_at < self.refresh_interval:
+            return False
+        self._checked_at = checked_at
+        key = (get_availability_version(), day)
+        if not force and key == self._key:
+            return False
+        
+        self._device_rooms = dict(Room.objects.filter(
+            has_iot_device=True, iot_device_id__isnull=False
+        ).values_list('iot_device_id', 'id'))
+        self._reservations = ReservationDays.build(day)
+        self._key = key
+        self._forget_rooms((set(self._states) | set(self._open)) - set(self._device_rooms.values()), now)
+        for room_id in self._states:
+            self._evaluate(room_id, now)
+        return True
+    
+    def observe(self, device_id, is_occupied, timestamp=None):
+        """
+        Process one occupancy event
+        
+        Args:
+            device_id: Firebase device ID of the room that reported
+            is_occupied: Occupancy reported by the sensor
+            timestamp: When the event happened (default: now)
+        """
+        now = timestamp or timezone.now()
+        if self._key is None:
+            self.load(now)
+        else:
+            self.refresh(now)
+        room_id = self._device_rooms.get(str(device_id))
+        if room_id is None:
+            self.ignored += 1
+            return
+        self.events += 1
+        self._states[room_id] = bool(is_occupied)
+        self._evaluate(room_id, now)
+        self.check_due(now)
+    
+    def tick(self, now=None):
+        """Pick up reservation changes and raise alerts that became due"""
+        now = now or timezone.now()
+        if self._key is None:
+            self.load(now)
+        else:
+            self.refresh(now)
+        self.check_due(now)
+    
+    def check_due(self, now):
+        """Raise alerts for mismatches that lasted their delay by now"""
+        due = self._due
+        while due and due[0][0] <= now:
+            _, room_id, since = heapq.heappop(due)
+            pending = self._pending.get(room_id)
+            if pending is None or pending[1] != since or room_id in self._open:
+                continue
+            kind, reservation_id = pending[0]
+            alert = OccupancyAlert(room_id=room_id, kind=kind, reservation_id=reservation_id, started_at=since)
+            self._open[room_id] = alert
+            self._created.append(alert)
+            self.raised += 1
+    
+    def flush(self):
+        """
+        Write raised and resolved alerts
+        
+        Returns:
+            int: Number of alerts created or updated
+        """
+        created, self._created = self._created, []
+        updated, self._updated = self._updated, []
+        if created or updated:
+            with transaction.atomic():
+                OccupancyAlert.objects.bulk_create(created, batch_size=500)
+                OccupancyAlert.objects.bulk_update(updated, ['resolved_at'], batch_size=500)
+        return len(created) + len(updated)
+    
+    def _local_day(self, now):
+        # timezone.localdate() costs more than the rest of an event, so
+        # the bounds of the current day are kept
+        start, end = self._day_bounds
+        if start is None or not start <= now < end:
+            self._day = timezone.localdate(now)
+            self._day_bounds = (start_of_day(self._day), start_of_day(self._day + timedelta(days=1)))
+        return self._day
+    
+    def _evaluate(self, room_id, now, since=None):
+        reservation_id = self._reservations.reservation_on(room_id, self._local_day(now))
+        if self._states[room_id]:
+            mismatch = ('unreserved_occupied', None) if reservation_id is None else None
+        else:
+            mismatch = ('reserved_vacant', reservation_id) if reservation_id is not None else None
+        
+        alert = self._open.get(room_id)
+        if alert is not None and (alert.kind, alert.reservation_id) != mismatch:
+            self._resolve(alert, now)
+        pending = self._pending.get(room_id)
+        if pending is not None and pending[0] == mismatch:
+            return
+        if mismatch is None:
+            self._pending.pop(room_id, None)
+            return
+        
+        since = since or now
+        self._pending[room_id] = (mismatch, since)
+        heapq.heappush(self._due, (since + self.delays[mismatch[0]], room_id, since))
+        if len(self._due) > 2 * len(self._pending) + 1000:
+            # Drop entries of mismatches that ended before their deadline
+            self._due = [
+                (start + self.delays[kind], pending_room_id, start)
+                for pending_room_id, ((kind, _), start) in self._pending.items()
+            ]
+            heapq.heapify(self._due)
+    
+    def _resolve(self, alert, now):
+        del self._open[alert.room_id]
+        alert.resolved_at = now
+        # Alerts not written yet are created resolved
+        if alert.pk is not None:
+            self._updated.append(alert)
+        self.resolved += 1
+    
+    def _forget_rooms(self, room_ids, now):
+        """Stop tracking rooms that were deleted or lost their device"""
+        if not room_ids:
+            return
+        for room_id in room_ids:
+            self._states.pop(room_id, None)
+            self._pending.pop(room_id, None)
+            self._open.pop(room_id, None)
+        self._created = [alert for alert in self._created if alert.room_id not in room_ids]
+        self._updated = [alert for alert in self._updated if alert.room_id not in room_ids]
+        OccupancyAlert.objects.filter(room_id__in=room_ids, resolved_at__isnull=True).update(resolved_at=now)
+    
+    def start(self):
+        """Start the background thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='anomaly-detector', daemon=True)
+            self._thread.start()
+        return self
+    
+    def close(self):
+        """Process the queued events, stop the background thread and write the alerts"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self.flush()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def submit(self, device_id, is_occupied, timestamp=None):
+        """Queue one occupancy event for the background thread"""
+        self._queue.put((str(device_id), bool(is_occupied), timestamp or timezone.now()))
+    
+    def submit_record(self, device_id, data, **kwargs):
+        """Queue a raw Firebase device record, ignoring empty ones"""
+        from .firebase_service import FirebaseService
+        
+        occupancy = FirebaseService.format_occupancy(data)
+        if occupancy:
+            self.submit(device_id, occupancy['is_occupied'], **kwargs)
+    
+    def _run(self):
+        try:
+            while True:
+                events = []
+                try:
+                    events.append(self._queue.get(timeout=self.tick_interval))
+                    while len(events) < self.batch_size and events[-1] is not None:
+                        events.append(self._queue.get_nowait())
+                except queue.Empty:
+                    pass
+                try:
+                    for event in events:
+                        if event is not None:
+                            self.observe(*event)
+                    self.tick()
+                    self.flush()
+                except Exception as e:
+                    print(f"Error checking occupancy alerts: {e}")
+                if events and events[-1] is None:
+                    return
+        finally:
+            # The detector thread has its own database connection
+            connection.close()
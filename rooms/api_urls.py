@@ -0,0 +1,15 @@
+from django.urls import path
+from reservations import views as reservation_views
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('occupancy/', views.occupancy_api, name='occupancy'),
+    path('occupancy/stream/', views.occupancy_stream, name='occupancy_stream'),
+    path('export/occupancy/', views.export_occupancy, name='export_occupancy'),
+    path('export/reservations/', reservation_views.export_reservations, name='export_reservations'),
+    path('rooms/<str:room_number>/history/', views.room_history_api, name='room_history'),
+    path('rooms/available/', reservation_views.available_rooms_api, name='available_rooms'),
+    path('analytics/utilization/', views.utilization_api, name='utilization'),
+]
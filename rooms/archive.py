@@ -0,0 +1,199 @@
+"""
+Cold archival of raw OccupancyData rows to compressed files
+
+Rows are appended to gzip JSON Lines files, one per room and month
+(<room>/<YYYY-MM>.jsonl.gz under OCCUPANCY_ARCHIVE_DIR), and deleted from
+the database once written. manifest.json lists every file with its row
+count, time range, size and the highest row ID it holds, so a run that
+stopped between writing and deleting can simply be repeated.
+"""
+import gzip
+import json
+import os
+from datetime import timezone as dt_timezone
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from django.utils.text import get_valid_filename
+from .models import OccupancyData, RollupWatermark
+from .rollups import WATERMARK_NAME
+
+
+MANIFEST_NAME = 'manifest.json'
+DELETE_BATCH_SIZE = 500
+
+
+def _isoformat(timestamp):
+    # Fixed width, so timestamps in the manifest compare as strings
+    return timestamp.astimezone(dt_timezone.utc).isoformat(timespec='microseconds')
+
+
+class OccupancyArchive:
+    """
+    Archive directory of raw occupancy rows
+    
+    Usage:
+        archive = OccupancyArchive()
+        archive.archive(before=timezone.now() - timedelta(days=30))
+        for record in archive.read('101', start=since):
+            ...
+    """
+    
+    def __init__(self, directory=None):
+        self.directory = str(directory or getattr(
+            settings, 'OCCUPANCY_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'archive', 'occupancy')
+        ))
+        self.manifest = self._load_manifest()
+    
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_NAME)
+    
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'version': 1, 'files': {}}
+    
+    def _save_manifest(self):
+        # Write a new file and swap it in, so the manifest is never half written
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.manifest_path)
+    
+    def archive(self, before, chunk_size=1000, rolled_up_only=True):
+        """
+        Move rows with a timestamp before `before` to the archive
+        
+        Rows are read in ID order, chunk_size at a time. Each chunk is
+        written and synced to disk, recorded in the manifest, and only
+        then deleted, in short batches so no lock is held for long.
+        
+        Args:
+            before: Aware datetime; older rows are archived
+            chunk_size: Rows read and written per chunk
+            rolled_up_only: Keep rows rollup_occupancy has not processed yet
+        
+        Returns:
+            int: Number of rows archived
+        """
+        rows = OccupancyData.objects.filter(timestamp__lt=before)
+        if rolled_up_only:
+            watermark = RollupWatermark.objects.filter(name=WATERMARK_NAME).values_list('last_id', flat=True).first()
+            rows = rows.filter(id__lte=watermark or 0)
+        
+        archived = 0
+        last_id = 0
+        while True:
+            chunk = list(
+                rows.filter(id__gt=last_id).order_by('id').values_list(
+                    'id', 'room__room_number', 'is_occupied', 'timestamp', 'sensor_data'
+                )[:chunk_size]
+            )
+            if not chunk:
+                return archived
+            
+            self._write_chunk(chunk)
+            ids = [row[0] for row in chunk]
+            for start in range(0, len(ids), DELETE_BATCH_SIZE):
+                OccupancyData.objects.filter(id__in=ids[start:start + DELETE_BATCH_SIZE]).delete()
+            archived += len(chunk)
+            last_id = ids[-1]
+    
+    def _write_chunk(self, chunk):
+        """Append one chunk of (id, room_number, is_occupied, timestamp, sensor_data) rows"""
+        files = {}
+        for row in chunk:
+            room_number = str(row[1])
+            month = row[3].astimezone(dt_timezone.utc).strftime('%Y-%m')
+            relative_path = f'{get_valid_filename(room_number)}/{month}.jsonl.gz'
+            files.setdefault(relative_path, (room_number, month, []))[2].append(row)
+        
+        for relative_path, (room_number, month, file_rows) in files.items():
+            entry = self.manifest['files'].setdefault(relative_path, {
+                'room': room_number,
+                'month': month,
+                'rows': 0,
+                'bytes': 0,
+                'first_timestamp': None,
+                'last_timestamp': None,
+                'last_id': 0,
+            })
+            # Rows from an earlier run that stopped before deleting them
+            file_rows = [row for row in file_rows if row[0] > entry['last_id']]
+            if file_rows:
+                self._append(relative_path, entry, file_rows)
+        self._save_manifest()
+    
+    def _append(self, relative_path, entry, rows):
+        path = os.path.join(self.directory, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'ab') as raw:
+            # Drop anything written after the manifest was last saved
+            raw.truncate(entry['bytes'])
+            raw.seek(entry['bytes'])
+            with gzip.GzipFile(fileobj=raw, mode='ab') as f:
+                for row_id, room_number, is_occupied, timestamp, sensor_data in rows:
+                    f.write(json.dumps({
+                        'id': row_id,
+                        'room': room_number,
+                        'is_occupied': is_occupied,
+                        'timestamp': _isoformat(timestamp),
+                        'sensor_data': sensor_data,
+                    }).encode('utf-8') + b'\n')
+            raw.flush()
+            os.fsync(raw.fileno())
+            entry['bytes'] = raw.tell()
+        
+        first_timestamp = _isoformat(min(row[3] for row in rows))
+        last_timestamp = _isoformat(max(row[3] for row in rows))
+        entry['rows'] += len(rows)
+        entry['last_id'] = rows[-1][0]
+        if entry['first_timestamp'] is None or first_timestamp < entry['first_timestamp']:
+            entry['first_timestamp'] = first_timestamp
+        if entry['last_timestamp'] is None or last_timestamp > entry['last_timestamp']:
+            entry['last_timestamp'] = last_timestamp
+    
+    def read(self, room_number=None, start=None, end=None):
+        """
+        Stream archived rows back, file by file
+        
+        Only files whose time range overlaps [start, end) are opened.
+        
+        Args:
+            room_number: Only rows of this room (default: all rooms)
+            start: Aware datetime, skip older rows
+            end: Aware datetime, skip rows at or after it
+        
+        Yields:
+            dict: 'id', 'room', 'is_occupied', 'timestamp' (datetime) and 'sensor_data'
+        """
+        start_iso = _isoformat(start) if start else None
+        end_iso = _isoformat(end) if end else None
+        entries = sorted(
+            self.manifest['files'].items(),
+            key=lambda item: (item[1]['room'], item[1]['month'])
+        )
+        for relative_path, entry in entries:
+            if room_number is not None and entry['room'] != str(room_number):
+                continue
+            if not entry['rows']:
+                continue
+            if start_iso and entry['last_timestamp'] < start_iso:
+                continue
+            if end_iso and entry['first_timestamp'] >= end_iso:
+                continue
+            
+            with gzip.open(os.path.join(self.directory, relative_path), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    if start_iso and record['timestamp'] < start_iso:
+                        continue
+                    if end_iso and record['timestamp'] >= end_iso:
+                        continue
+                    record['timestamp'] = parse_datetime(record['timestamp'])
+                    yield record
@@ -4,139 +4,421 @@ Firebase Realtime Database service for fetching occupancy data
 import firebase_admin
 from firebase_admin import credentials, db
 from django.conf import settings
+from django.core.cache import cache
+from echo_occupancy.metrics import FIREBASE_CALL_DURATION, note_firebase_call
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
 import os
+import threading
+import time
+
+
+SNAPSHOT_CACHE_KEY = 'firebase:devices:snapshot'
+SNAPSHOT_REFRESH_LOCK_KEY = 'firebase:devices:refreshing'
+DEVICE_CACHE_KEY = 'firebase:device:{}'
 
 
 class FirebaseService:
     """Service class for interacting with Firebase Realtime Database"""
     
     _app = None
+    _init_future = None
+    
+    # Process-wide worker pool used to put timeouts on Firebase calls.
+    # Created lazily and shared by every instance.
+    _executor = None
+    _executor_lock = threading.Lock()
+    # The /devices fetch in flight, joined by every caller that needs one
+    _snapshot_future = None
+    _snapshot_lock = threading.Lock()
+    _metrics_lock = threading.Lock()
+    _metrics = {
+        'submitted': 0,
+        'completed': 0,
+        'failed': 0,
+        'timeouts': 0,
+        'rejected': 0,
+        'in_flight': 0,
+        'queue_depth': 0,
+    }
     
     def __init__(self):
-        if FirebaseService._app is None:
+        # Snapshot of /devices reused for the lifetime of this instance,
+        # so one request never sees two different versions
+        self._snapshot = None
+        if FirebaseService._app is None and not self._use_live_state():
             self._initialize_firebase()
     
+    @staticmethod
+    def _use_live_state():
+        """Whether occupancy is read from DeviceState, kept current by occupancy_listen"""
+        return getattr(settings, 'OCCUPANCY_LIVE_STATE', False)
+    
+    @staticmethod
+    def _snapshot_ttl():
+        return getattr(settings, 'FIREBASE_SNAPSHOT_TTL', 5)
+    
+    @staticmethod
+    def _snapshot_stale_ttl():
+        return getattr(settings, 'FIREBASE_SNAPSHOT_STALE_TTL', 30)
+    
+    @classmethod
+    def _get_executor(cls):
+        """Return the shared executor, creating it on first use"""
+        if cls._executor is None:
+            with cls._executor_lock:
+                if cls._executor is None:
+                    cls._executor = ThreadPoolExecutor(
+                        max_workers=getattr(settings, 'FIREBASE_MAX_WORKERS', 8),
+                        thread_name_prefix='firebase'
+                    )
+        return cls._executor
+    
+    @classmethod
+    def _record(cls, **changes):
+        with cls._metrics_lock:
+            for name, delta in changes.items():
+                cls._metrics[name] += delta
+    
+    @classmethod
+    def metrics(cls):
+        """
+        Snapshot of the worker pool counters
+        
+        Returns:
+            dict: Totals for submitted, completed, failed, timed out and
+            rejected calls, plus the current in-flight count and queue depth
+        """
+        with cls._metrics_lock:
+            return dict(cls._metrics)
+    
+    @classmethod
+    def _submit(cls, fn, *args):
+        """
+        Run fn on the shared executor
+        
+        Returns:
+            Future: The pending call, or None if the queue is full
+        """
+        with cls._metrics_lock:
+            if cls._metrics['queue_depth'] >= getattr(settings, 'FIREBASE_MAX_QUEUE', 100):
+                cls._metrics['rejected'] += 1
+                return None
+            cls._metrics['submitted'] += 1
+            cls._metrics['in_flight'] += 1
+            cls._metrics['queue_depth'] += 1
+        note_firebase_call()
+        
+        def run():
+            cls._record(queue_depth=-1)
+            start = time.perf_counter()
+            try:
+                result = fn(*args)
+            except Exception:
+                cls._record(in_flight=-1, failed=1)
+                raise
+            finally:
+                FIREBASE_CALL_DURATION.observe(time.perf_counter() - start)
+            cls._record(in_flight=-1, completed=1)
+            return result
+        
+        future = cls._get_executor().submit(run)
+        
+        def on_cancelled(f):
+            # Cancelled before it started, so run() never updated the counters
+            if f.cancelled():
+                cls._record(in_flight=-1, queue_depth=-1)
+        
+        future.add_done_callback(on_cancelled)
+        return future
+    
     def _initialize_firebase(self):
         """Initialize Firebase Admin SDK with timeout to prevent hanging"""
-        try:
-            from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
-            
-            def init_firebase():
-                # Try to use credentials file if provided
-                if hasattr(settings, 'FIREBASE_CREDENTIALS_PATH') and settings.FIREBASE_CREDENTIALS_PATH:
-                    cred_path = settings.FIREBASE_CREDENTIALS_PATH
-                    if os.path.exists(cred_path):
-                        cred = credentials.Certificate(cred_path)
-                        return firebase_admin.initialize_app(
-                            cred,
-                            {'databaseURL': settings.FIREBASE_DATABASE_URL}
-                        )
-                
-                # Try to use default credentials (for Google Cloud environments)
-                try:
+        # Another request is already initializing, don't start a second one
+        if FirebaseService._init_future is not None and not FirebaseService._init_future.done():
+            return
+        
+        def init_firebase():
+            # Try to use credentials file if provided
+            if hasattr(settings, 'FIREBASE_CREDENTIALS_PATH') and settings.FIREBASE_CREDENTIALS_PATH:
+                cred_path = settings.FIREBASE_CREDENTIALS_PATH
+                if os.path.exists(cred_path):
+                    cred = credentials.Certificate(cred_path)
                     return firebase_admin.initialize_app(
-                        options={'databaseURL': settings.FIREBASE_DATABASE_URL}
+                        cred,
+                        {'databaseURL': settings.FIREBASE_DATABASE_URL}
                     )
-                except ValueError:
-                    # App already initialized
-                    return firebase_admin.get_app()
+            
+            # Try to use default credentials (for Google Cloud environments)
+            try:
+                return firebase_admin.initialize_app(
+                    options={'databaseURL': settings.FIREBASE_DATABASE_URL}
+                )
+            except ValueError:
+                # App already initialized
+                return firebase_admin.get_app()
+        
+        def on_initialized(f):
+            # Picks up an initialization that finishes after the timeout
+            if not f.cancelled() and f.exception() is None:
+                FirebaseService._app = f.result()
+        
+        try:
+            future = self._submit(init_firebase)
+            if future is None:
+                return
+            FirebaseService._init_future = future
+            future.add_done_callback(on_initialized)
             
             # Use timeout to prevent hanging (2 seconds max for initialization)
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(init_firebase)
-                try:
-                    FirebaseService._app = future.result(timeout=2)
-                except FutureTimeoutError:
-                    print("Warning: Firebase initialization timed out")
-                    print("The app will work but real-time occupancy data may not be available.")
-                    FirebaseService._app = None
-                except Exception as e:
-                    print(f"Warning: Firebase initialization failed: {e}")
-                    print("The app will work but real-time occupancy data may not be available.")
-                    FirebaseService._app = None
+            try:
+                FirebaseService._app = future.result(timeout=2)
+            except FutureTimeoutError:
+                self._record(timeouts=1)
+                print("Warning: Firebase initialization timed out")
+                print("The app will work but real-time occupancy data may not be available.")
         except Exception as e:
             print(f"Warning: Firebase initialization failed: {e}")
             print("The app will work but real-time occupancy data may not be available.")
             FirebaseService._app = None
     
+    @staticmethod
+    def format_occupancy(data):
+        """
+        Normalize a raw device record into occupancy data
+        
+        Args:
+            data: Raw device dict as stored in Firebase
+        
+        Returns:
+            dict: Occupancy data or None if the record is empty
+        """
+        if not data or not isinstance(data, dict):
+            return None
+        return {
+            'is_occupied': data.get('occupied', False) or data.get('is_occupied', False),
+            'timestamp': data.get('timestamp'),
+            'sensor_data': data
+        }
+    
     def get_room_occupancy(self, device_id, timeout=1):
         """
         Get real-time occupancy data for a room device
         
+        Lookups are served from the cached /devices snapshot. Devices that
+        are missing from it fall back to a direct fetch, whose result is
+        cached for the same TTL.
+        
         Args:
             device_id: The Firebase device ID or room number
             timeout: Timeout in seconds (default: 1)
-            
+        
         Returns:
             dict: Occupancy data or None if not available
         """
+        return self.get_many([device_id], timeout=timeout)[device_id]
+    
+    def get_many(self, device_ids, timeout=2):
+        """
+        Get real-time occupancy data for several devices at once
+        
+        Devices found in the cached /devices snapshot are answered from it;
+        the rest are fetched concurrently on the shared pool. The whole call
+        returns within one overall deadline, and devices that did not answer
+        in time map to None.
+        
+        Args:
+            device_ids: Iterable of Firebase device IDs
+            timeout: Overall timeout in seconds (default: 2)
+        
+        Returns:
+            dict: Occupancy data (or None) keyed by device ID
+        """
+        device_ids = list(device_ids)
+        results = {device_id: None for device_id in device_ids}
+        
+        if self._use_live_state():
+            # DeviceState mirrors all of /devices, there is nothing to fetch
+            snapshot = self.get_all_rooms_occupancy()
+            for device_id in device_ids:
+                results[device_id] = self.format_occupancy(snapshot.get(str(device_id)))
+            return results
+        
         # Fast return if Firebase is not initialized
         if FirebaseService._app is None:
-            return None
+            return results
         
-        try:
-            # Use threading-based timeout for cross-platform compatibility
-            from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
-            
-            def fetch_firebase_data():
-                # Firebase path structure: /devices/{device_id} or /rooms/{room_number}
-                # Adjust based on your Firebase structure
-                ref = db.reference(f'/devices/{device_id}')
-                data = ref.get()
-                
-                if data:
-                    return {
-                        'is_occupied': data.get('occupied', False) or data.get('is_occupied', False),
-                        'timestamp': data.get('timestamp'),
-                        'sensor_data': data
-                    }
-                
-                # Try alternative path structure
-                ref = db.reference(f'/rooms/{device_id}')
-                data = ref.get()
-                
-                if data:
-                    return {
-                        'is_occupied': data.get('occupied', False) or data.get('is_occupied', False),
-                        'timestamp': data.get('timestamp'),
-                        'sensor_data': data
-                    }
-                
-                return None
-            
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(fetch_firebase_data)
-                try:
-                    return future.result(timeout=timeout)
-                except FutureTimeoutError:
-                    print(f"Timeout fetching Firebase data for device {device_id} after {timeout} seconds")
-                    return None
-                    
-        except Exception as e:
-            print(f"Error fetching Firebase data for device {device_id}: {e}")
-            return None
+        deadline = time.monotonic() + timeout
+        snapshot = self.get_all_rooms_occupancy(timeout=timeout)
+        
+        missing = []
+        for device_id in device_ids:
+            data = self.format_occupancy(snapshot.get(str(device_id)))
+            if data:
+                results[device_id] = data
+                continue
+            cached = cache.get(DEVICE_CACHE_KEY.format(device_id))
+            if cached is not None:
+                results[device_id] = cached.get('data')
+            else:
+                missing.append(device_id)
+        
+        futures = {}
+        for device_id in missing:
+            future = self._submit(self._fetch_room_occupancy, device_id)
+            if future is not None:
+                futures[future] = device_id
+        if not futures:
+            return results
+        
+        done, not_done = wait(futures, timeout=max(0, deadline - time.monotonic()))
+        for future in done:
+            device_id = futures[future]
+            try:
+                data = future.result()
+            except Exception as e:
+                print(f"Error fetching Firebase data for device {device_id}: {e}")
+                continue
+            results[device_id] = data
+            cache.set(DEVICE_CACHE_KEY.format(device_id), {'data': data}, self._snapshot_ttl())
+        for future in not_done:
+            future.cancel()
+            self._record(timeouts=1)
+            print(f"Timeout fetching Firebase data for device {futures[future]} after {timeout} seconds")
+        
+        return results
+    
+    @staticmethod
+    def _fetch_room_occupancy(device_id):
+        """Fetch occupancy data for a single device directly from Firebase"""
+        # Firebase path structure: /devices/{device_id} or /rooms/{room_number}
+        # Adjust based on your Firebase structure
+        ref = db.reference(f'/devices/{device_id}')
+        data = ref.get()
+        
+        if data:
+            return FirebaseService.format_occupancy(data)
+        
+        # Try alternative path structure
+        ref = db.reference(f'/rooms/{device_id}')
+        data = ref.get()
+        
+        return FirebaseService.format_occupancy(data)
     
     def get_all_rooms_occupancy(self, timeout=5):
-        """Get occupancy data for all rooms with IoT devices"""
+        """
+        Get occupancy data for all rooms with IoT devices
+        
+        The /devices snapshot is kept in the Django cache. Within
+        FIREBASE_SNAPSHOT_TTL seconds it is returned as is; for a further
+        FIREBASE_SNAPSHOT_STALE_TTL seconds the stale copy is returned while
+        a single background refresh fetches a new one. Only a cold cache
+        blocks on Firebase. A failed blocking fetch is remembered as an
+        empty snapshot for FIREBASE_SNAPSHOT_TTL, so during an outage only
+        one request per TTL waits for Firebase.
+        
+        With OCCUPANCY_LIVE_STATE enabled the records come from the
+        DeviceState table instead, without any call to Firebase.
+        
+        Args:
+            timeout: Timeout in seconds for a blocking fetch (default: 5)
+        
+        Returns:
+            dict: Raw device records keyed by device ID
+        """
+        if self._snapshot is not None:
+            return self._snapshot
+        
+        if self._use_live_state():
+            from .models import DeviceState
+            self._snapshot = dict(DeviceState.objects.values_list('device_id', 'data'))
+            return self._snapshot
+        
         if FirebaseService._app is None:
             return {}
         
+        entry = cache.get(SNAPSHOT_CACHE_KEY)
+        if entry is not None:
+            if entry.get('failed'):
+                self._snapshot = {}
+                return self._snapshot
+            if time.time() - entry['fetched_at'] >= self._snapshot_ttl():
+                # Nobody waits on the refresh, so it keeps its own timeout
+                self._refresh_snapshot_in_background()
+            self._snapshot = entry['data']
+            return self._snapshot
+        
+        data = self._fetch_all_rooms_occupancy(timeout=timeout)
+        if data is None:
+            # add() keeps a snapshot stored meanwhile by a late fetch
+            cache.add(
+                SNAPSHOT_CACHE_KEY,
+                {'data': {}, 'fetched_at': time.time(), 'failed': True},
+                self._snapshot_ttl()
+            )
+            return {}
+        self._snapshot = data
+        return data
+    
+    def _store_snapshot(self, data):
+        cache.set(
+            SNAPSHOT_CACHE_KEY,
+            {'data': data, 'fetched_at': time.time()},
+            self._snapshot_ttl() + self._snapshot_stale_ttl()
+        )
+    
+    def _refresh_snapshot_in_background(self, timeout=5):
+        """Refresh the cached snapshot unless another refresh is running"""
+        if not cache.add(SNAPSHOT_REFRESH_LOCK_KEY, True, timeout + 1):
+            return
+        
+        def refresh():
+            try:
+                # A failure keeps the stale snapshot until it expires
+                self._fetch_all_rooms_occupancy(timeout=timeout)
+            finally:
+                cache.delete(SNAPSHOT_REFRESH_LOCK_KEY)
+        
+        # Runs on its own thread: it waits on the pool itself, so queueing it
+        # there could deadlock a saturated pool
+        threading.Thread(target=refresh, daemon=True).start()
+    
+    def _fetch_all_rooms_occupancy(self, timeout=5):
+        """
+        Fetch the whole /devices tree from Firebase and cache it
+        
+        Only one fetch runs at a time per process: callers arriving while
+        one is in flight wait for that one instead of queueing another.
+        A fetch that outlasts timeout is not abandoned; its result is
+        still cached when it arrives.
+        
+        Returns:
+            dict: Raw device records, or None if the fetch failed or timed out
+        """
+        def fetch_all_data():
+            ref = db.reference('/devices')
+            all_data = ref.get()
+            return all_data if all_data else {}
+        
+        def on_fetched(f):
+            if not f.cancelled() and f.exception() is None:
+                self._store_snapshot(f.result())
+        
+        with FirebaseService._snapshot_lock:
+            future = FirebaseService._snapshot_future
+            if future is None or future.done():
+                future = self._submit(fetch_all_data)
+                if future is None:
+                    print("Firebase worker queue full, skipping all Firebase data")
+                    return None
+                future.add_done_callback(on_fetched)
+                FirebaseService._snapshot_future = future
+        
         try:
-            from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
-            
-            def fetch_all_data():
-                ref = db.reference('/devices')
-                all_data = ref.get()
-                return all_data if all_data else {}
-            
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(fetch_all_data)
-                try:
-                    return future.result(timeout=timeout)
-                except FutureTimeoutError:
-                    print(f"Timeout fetching all Firebase data after {timeout} seconds")
-                    return {}
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self._record(timeouts=1)
+            print(f"Timeout fetching all Firebase data after {timeout} seconds")
+            return None
         except Exception as e:
             print(f"Error fetching all Firebase data: {e}")
-            return {}
-
+            return None
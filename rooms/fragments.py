@@ -0,0 +1,103 @@
+"""
+Cached HTML fragments for the dashboard room grid
+"""
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+from echo_occupancy.replicas import primary_reads
+from .services import cache_is_shared, resolve_occupancy, get_occupancy_changed_at
+
+
+CARD_CACHE_KEY = 'dashboard:card:{}'
+GRID_CACHE_KEY = 'dashboard:grid:{}:{}:{}'
+
+
+def _fragment_ttl():
+    return getattr(settings, 'DASHBOARD_FRAGMENT_TTL', 3600)
+
+
+def _grid_ttl():
+    # A per-process cache only sees the version bumps of its own process,
+    # so changes saved by other web workers would otherwise stay hidden
+    # for the whole fragment TTL
+    if cache_is_shared():
+        return _fragment_ttl()
+    return min(_fragment_ttl(), max(getattr(settings, 'FIREBASE_SNAPSHOT_TTL', 5), 1))
+
+
+def _card_key(room_data, user):
+    """
+    Cache key for one room card, derived from everything the card shows
+    
+    A room whose state did not change keeps its key, so after any change
+    only the cards that look different are rendered again.
+    """
+    room = room_data['room']
+    status = room_data['status']
+    reservation = room_data['reservation']
+    state = (
+        room.room_number,
+        room.has_iot_device,
+        room_data['color'],
+        status['is_occupied'],
+        bool(status['occupancy_data']),
+        reservation.user.username if reservation else None,
+        bool(reservation and user is not None and reservation.user_id == user.id),
+    )
+    return CARD_CACHE_KEY.format(hashlib.md5(repr(state).encode()).hexdigest())
+
+
+def render_room_cards(rooms_data, user):
+    """
+    HTML of the room cards for resolve_occupancy rows
+    
+    Cards are read from the cache in one get_many; only missing ones are
+    rendered and stored.
+    """
+    keys = [_card_key(room_data, user) for room_data in rooms_data]
+    cached = cache.get_many(keys)
+    rendered = {}
+    cards = []
+    for key, room_data in zip(keys, rooms_data):
+        card = cached.get(key) or rendered.get(key)
+        if card is None:
+            card = rendered[key] = render_to_string('rooms/room_card.html', {
+                'room_data': room_data,
+                'user': user
+            })
+        cards.append(card)
+    if rendered:
+        cache.set_many(rendered, _fragment_ttl())
+    return mark_safe(''.join(cards))
+
+
+def get_room_grid(rooms, user):
+    """
+    HTML of the dashboard room cards visible to the user
+    
+    Managers all see the same grid for the same rooms, so it is cached
+    whole under get_occupancy_changed_at(), the date and the room IDs of
+    the page. Reservation and room signals and the occupancy listener
+    bump the version, so a warm manager dashboard runs no occupancy
+    queries until something changes. With a per-process cache the grid
+    is only kept for FIREBASE_SNAPSHOT_TTL. Other users get their cards
+    from render_room_cards.
+    
+    Returns:
+        SafeString: The cards, empty if the user sees no room
+    """
+    if not user.is_manager():
+        return render_room_cards(resolve_occupancy(rooms, user), user)
+    
+    rooms = list(rooms)
+    page = hashlib.md5(','.join(str(room.id) for room in rooms).encode()).hexdigest()
+    key = GRID_CACHE_KEY.format(get_occupancy_changed_at(), timezone.now().date(), page)
+    grid = cache.get(key)
+    if grid is None:
+        with primary_reads():
+            grid = render_room_cards(resolve_occupancy(rooms, user), user)
+        cache.set(key, grid, _grid_ttl())
+    return mark_safe(grid)
@@ -0,0 +1,106 @@
+"""
+Occupancy history of a room, newest first, one keyset page at a time
+
+Pages are ordered by (timestamp, id) descending and continue from the row
+before them (see rooms.pagination), which the (room, -timestamp, -id)
+index answers with a range scan. Scrolling back a year costs the same as
+loading the latest samples.
+"""
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from reservations.models import start_of_day
+from .pagination import keyset_page
+
+
+HISTORY_ORDERING = ['-timestamp', '-id']
+MAX_HISTORY_LIMIT = 500
+
+
+class HistoryError(ValueError):
+    """Raised for invalid history parameters; the message is returned to the client"""
+
+
+def _parse_moment(name, value):
+    try:
+        moment = parse_datetime(value)
+    except ValueError:
+        moment = None
+    if moment is None:
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise HistoryError(f'Invalid {name} "{value}", expected YYYY-MM-DD or an ISO 8601 datetime')
+        return start_of_day(day)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_history_params(request):
+    """
+    Read the time range and page size of a history request
+    
+    Query parameters:
+        since: Earliest sample to include (YYYY-MM-DD or ISO 8601 datetime)
+        until: Time to stop before (YYYY-MM-DD or ISO 8601 datetime)
+        limit: Samples per page, default OCCUPANCY_HISTORY_PAGE_SIZE
+    
+    Raises:
+        HistoryError: If a parameter is invalid
+    """
+    bounds = {}
+    for name in ('since', 'until'):
+        value = request.GET.get(name, '').strip()
+        bounds[name] = _parse_moment(name, value) if value else None
+    if bounds['since'] and bounds['until'] and bounds['since'] >= bounds['until']:
+        raise HistoryError('since must be before until')
+    
+    limit = request.GET.get('limit')
+    if limit:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise HistoryError(f'Invalid limit "{limit}"')
+        if not 1 <= limit <= MAX_HISTORY_LIMIT:
+            raise HistoryError(f'limit must be between 1 and {MAX_HISTORY_LIMIT}')
+    else:
+        limit = getattr(settings, 'OCCUPANCY_HISTORY_PAGE_SIZE', 50)
+    
+    return {'since': bounds['since'], 'until': bounds['until'], 'limit': limit}
+
+
+def history_page(room, params, after=None, before=None):
+    """
+    One page of a room's occupancy samples, newest first
+    
+    Args:
+        room: Room whose history to read
+        params: Result of parse_history_params()
+        after: Cursor of the page before, continues with older samples
+        before: Cursor of the page after, goes back to newer samples
+    
+    Returns:
+        KeysetPage of OccupancyData
+    
+    Raises:
+        InvalidCursor: If a cursor is malformed
+    """
+    records = room.occupancy_history.all()
+    if params['since']:
+        records = records.filter(timestamp__gte=params['since'])
+    if params['until']:
+        records = records.filter(timestamp__lt=params['until'])
+    return keyset_page(records, HISTORY_ORDERING, params['limit'], after=after, before=before)
+
+
+def serialize_history_record(record):
+    """JSON-ready form of one OccupancyData row, timestamp in local time"""
+    return {
+        'id': record.id,
+        'timestamp': timezone.localtime(record.timestamp).isoformat(),
+        'is_occupied': record.is_occupied,
+        'sensor_data': record.sensor_data,
+    }
@@ -0,0 +1,207 @@
+"""
+Buffered bulk ingestion of IoT occupancy events into OccupancyData
+"""
+import threading
+import time
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from echo_occupancy.metrics import OCCUPANCY_EVENTS_DROPPED
+from .models import Room, OccupancyData
+
+
+class IngestionBufferFull(Exception):
+    """Raised when an event cannot be buffered because the buffer is full"""
+
+
+class OccupancyIngestor:
+    """
+    Collects occupancy events in memory and writes them with bulk_create
+    
+    A batch is written, in one transaction, as soon as batch_size events
+    are buffered or flush_interval seconds have passed. Once max_buffer
+    events are waiting, submit() blocks (or raises IngestionBufferFull)
+    until the writer catches up. close() writes whatever is left.
+    
+    A batch that fails to write goes back into the buffer and is retried
+    with the next flush, up to max_retries times before it is dropped.
+    
+    Without start() there is no background writer and submit() writes
+    each full batch itself.
+    
+    Usage:
+        with OccupancyIngestor() as ingestor:
+            ingestor.submit('101', True, sensor_data)
+    """
+    
+    def __init__(self, batch_size=None, flush_interval=None, max_buffer=None, max_retries=None):
+        self.batch_size = batch_size or getattr(settings, 'OCCUPANCY_INGEST_BATCH_SIZE', 1000)
+        self.flush_interval = flush_interval or getattr(settings, 'OCCUPANCY_INGEST_FLUSH_INTERVAL', 1.0)
+        self.max_buffer = max(max_buffer or getattr(settings, 'OCCUPANCY_INGEST_MAX_BUFFER', 20000), self.batch_size)
+        if max_retries is None:
+            max_retries = getattr(settings, 'OCCUPANCY_INGEST_MAX_RETRIES', 3)
+        self.max_retries = max_retries
+        self.written = 0
+        self.dropped = 0
+        self._failed_flushes = 0
+        self._buffer = []
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._room_ids = {}
+        self._closed = False
+        self._thread = None
+    
+    def start(self):
+        """Start the background writer"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='occupancy-ingestor', daemon=True)
+            self._thread.start()
+        return self
+    
+    def close(self):
+        """Stop the background writer and flush remaining events"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def submit(self, device_id, is_occupied, sensor_data=None, timestamp=None, block=True, timeout=None):
+        """
+        Buffer one occupancy event
+        
+        Args:
+            device_id: Firebase device ID of the room that reported
+            is_occupied: Occupancy reported by the sensor
+            sensor_data: Raw record to store with the event
+            timestamp: When the event happened (default: now)
+            block: Wait for room in the buffer instead of raising
+            timeout: Longest wait in seconds when block is True
+        
+        Raises:
+            IngestionBufferFull: If the buffer stays full
+        """
+        event = (str(device_id), bool(is_occupied), sensor_data or {}, timestamp or timezone.now())
+        with self._condition:
+            if len(self._buffer) >= self.max_buffer and not self._closed:
+                if not block or not self._condition.wait_for(
+                    lambda: len(self._buffer) < self.max_buffer or self._closed, timeout
+                ):
+                    raise IngestionBufferFull(f'{len(self._buffer)} occupancy events waiting')
+            if self._closed:
+                raise RuntimeError('OccupancyIngestor is closed')
+            self._buffer.append(event)
+            full_batch = len(self._buffer) >= self.batch_size
+            if full_batch:
+                self._condition.notify_all()
+        
+        # Without a background writer the producer writes full batches itself
+        if full_batch and self._thread is None:
+            self.flush()
+    
+    def submit_record(self, device_id, data, **kwargs):
+        """Buffer a raw Firebase device record, ignoring empty ones"""
+        from .firebase_service import FirebaseService
+        
+        occupancy = FirebaseService.format_occupancy(data)
+        if occupancy:
+            self.submit(device_id, occupancy['is_occupied'], occupancy['sensor_data'], **kwargs)
+    
+    def flush(self):
+        """
+        Write all buffered events now
+        
+        Raises:
+            DatabaseError: If the write failed; the events are back in the
+                buffer unless they already failed max_retries times
+        """
+        with self._flush_lock:
+            with self._condition:
+                events, self._buffer = self._buffer, []
+                self._condition.notify_all()
+            if not events:
+                return 0
+            
+            try:
+                self._resolve_rooms({device_id for device_id, _, _, _ in events})
+            except DatabaseError:
+                self._retry_later(events)
+                raise
+            kept = []
+            rows = []
+            for event in events:
+                device_id, is_occupied, sensor_data, timestamp = event
+                room_id = self._room_ids.get(device_id)
+                if room_id is None:
+                    self._drop(1, 'unknown_room')
+                    continue
+                kept.append(event)
+                rows.append(OccupancyData(
+                    room_id=room_id,
+                    is_occupied=is_occupied,
+                    sensor_data=sensor_data,
+                    timestamp=timestamp
+                ))
+            
+            try:
+                with transaction.atomic():
+                    OccupancyData.objects.bulk_create(rows, batch_size=self.batch_size)
+            except DatabaseError:
+                self._retry_later(kept)
+                raise
+            self._failed_flushes = 0
+            self.written += len(rows)
+            return len(rows)
+    
+    def _retry_later(self, events):
+        """Put events that failed to write back in front of the buffer, or drop them"""
+        self._failed_flushes += 1
+        if self._failed_flushes > self.max_retries:
+            self._failed_flushes = 0
+            self._drop(len(events), 'write_failed')
+            print(f"Dropped {len(events)} occupancy events after {self.max_retries} retries")
+            return
+        with self._condition:
+            self._buffer[:0] = events
+    
+    def _drop(self, count, reason):
+        self.dropped += count
+        OCCUPANCY_EVENTS_DROPPED.inc(count, reason)
+    
+    def _resolve_rooms(self, device_ids):
+        """Load room IDs for devices not seen before in one query"""
+        unknown = device_ids - set(self._room_ids)
+        if unknown:
+            self._room_ids.update(
+                Room.objects.filter(iot_device_id__in=unknown).values_list('iot_device_id', 'id')
+            )
+    
+    def _run(self):
+        try:
+            while True:
+                deadline = time.monotonic() + self.flush_interval
+                with self._condition:
+                    self._condition.wait_for(
+                        lambda: len(self._buffer) >= self.batch_size or self._closed,
+                        max(0, deadline - time.monotonic())
+                    )
+                    if self._closed:
+                        return
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Error writing occupancy events: {e}")
+                    # Give the database a moment before retrying the batch
+                    with self._condition:
+                        self._condition.wait_for(lambda: self._closed, self.flush_interval)
+        finally:
+            # The writer thread has its own database connection
+            connection.close()
@@ -0,0 +1,161 @@
+"""
+In-process fan-out of room state changes to streaming dashboard clients
+"""
+import asyncio
+import contextvars
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .models import Room
+from .services import resolve_occupancy, serialize_room_state, get_occupancy_changed_at
+
+
+def load_room_states():
+    """
+    Current state of every room, not personalised for any user
+    
+    Returns:
+        dict: room_number -> (state, user ID of the current reservation or None)
+    """
+    states = {}
+    for room_data in resolve_occupancy(Room.objects.all(), None):
+        reservation = room_data['reservation']
+        states[room_data['room'].room_number] = (
+            serialize_room_state(room_data),
+            reservation.user_id if reservation else None
+        )
+    return states
+
+
+class Subscriber:
+    """One connected client and the rooms it may see"""
+    
+    def __init__(self, user_id, room_numbers=None, queue_size=100):
+        self.user_id = user_id
+        # None means every room (managers)
+        self.room_numbers = set(room_numbers) if room_numbers is not None else None
+        self.queue = asyncio.Queue(maxsize=queue_size)
+    
+    def wants(self, room_number):
+        return self.room_numbers is None or room_number in self.room_numbers
+    
+    def send(self, state, reserved_by_id):
+        if reserved_by_id is not None and reserved_by_id == self.user_id:
+            state = dict(state, is_own=True, color='green')
+        if self.queue.full():
+            # A slow client only ever needs the latest states, drop the oldest
+            self.queue.get_nowait()
+        self.queue.put_nowait(state)
+
+
+class OccupancyHub:
+    """
+    Publishes room state changes to every interested Subscriber
+    
+    Changes are published with publish(), or picked up by a single watcher
+    task that checks the occupancy version every
+    OCCUPANCY_STREAM_INTERVAL seconds and reloads room states only when it
+    moved. That covers reservations saved by any process and sensor
+    changes written by occupancy_listen, at one check per process rather
+    than one per client. The watcher runs only while clients are connected.
+    
+    Args:
+        load_states: Callable returning the states of load_room_states()
+            (default: read from the database)
+        get_version: Callable returning a value that changes whenever the
+            states do (default: get_occupancy_changed_at)
+    """
+    
+    def __init__(self, interval=None, queue_size=100, load_states=None, get_version=None):
+        self.interval = interval or getattr(settings, 'OCCUPANCY_STREAM_INTERVAL', 1.0)
+        self.queue_size = queue_size
+        self.load_states = load_states or load_room_states
+        self.get_version = get_version or get_occupancy_changed_at
+        self.subscribers = set()
+        self.states = {}
+        self._version = None
+        self._watcher = None
+        self._refresh_lock = asyncio.Lock()
+    
+    async def subscribe(self, user_id, room_numbers=None):
+        """Register a client and queue the current state of its rooms"""
+        subscriber = Subscriber(user_id, room_numbers, self.queue_size)
+        await self.refresh()
+        
+        # No await from here on, so nothing is published in between
+        self.subscribers.add(subscriber)
+        if self._watcher is None or self._watcher.done():
+            # The watcher outlives this request. In the request's context its
+            # sync_to_async calls would go to the request's thread executor,
+            # which quits when the response is returned.
+            self._watcher = asyncio.get_running_loop().create_task(
+                self._watch(), context=contextvars.Context()
+            )
+        for room_number, (state, reserved_by_id) in self.states.items():
+            if subscriber.wants(room_number):
+                subscriber.send(state, reserved_by_id)
+        return subscriber
+    
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+    
+    def publish(self, state, reserved_by_id=None):
+        """
+        Send a room state to every subscriber allowed to see that room
+        
+        Must be called on the event loop the subscribers run on.
+        """
+        room_number = state['room_number']
+        self.states[room_number] = (state, reserved_by_id)
+        for subscriber in self.subscribers:
+            if subscriber.wants(room_number):
+                subscriber.send(state, reserved_by_id)
+    
+    async def refresh(self):
+        """Reload room states if occupancy changed, publishing the differences"""
+        async with self._refresh_lock:
+            version = await sync_to_async(self.get_version)()
+            if version == self._version:
+                return
+            states = await sync_to_async(self.load_states)()
+            self._version = version
+            for room_number, entry in states.items():
+                if self.states.get(room_number) != entry:
+                    self.publish(*entry)
+    
+    async def _watch(self):
+        while self.subscribers:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Error refreshing live occupancy: {e}")
+    
+    async def stream(self, subscriber, max_age=None, keepalive=15):
+        """
+        Server-Sent Events for a subscriber
+        
+        The stream ends after max_age seconds and the browser's EventSource
+        reconnects, so clients that went away without the server noticing
+        are released.
+        """
+        max_age = max_age or getattr(settings, 'OCCUPANCY_STREAM_MAX_AGE', 300)
+        deadline = time.monotonic() + max_age
+        try:
+            yield 'retry: 2000\n\n'
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    state = await asyncio.wait_for(subscriber.queue.get(), min(keepalive, remaining))
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f'data: {json.dumps(state)}\n\n'
+        finally:
+            self.unsubscribe(subscriber)
+
+
+hub = OccupancyHub()
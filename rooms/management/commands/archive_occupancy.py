@@ -0,0 +1,53 @@
+"""
+Management command to move old OccupancyData rows to compressed archive files
+"""
+import re
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rooms.archive import OccupancyArchive
+from rooms.models import OccupancyData
+
+
+AGE_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+
+def parse_age(value):
+    """Parse an age such as '30d', '12h' or '2w' (plain numbers are days)"""
+    match = re.fullmatch(r'(\d+)([smhdw]?)', value.strip())
+    if not match:
+        raise CommandError(f'Invalid age "{value}", expected e.g. 30d, 12h or 2w')
+    return timedelta(**{AGE_UNITS[match.group(2) or 'd']: int(match.group(1))})
+
+
+class Command(BaseCommand):
+    help = 'Archive OccupancyData rows older than a given age to gzip JSON Lines files and delete them'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', default='30d', help='Age of rows to archive, e.g. 30d, 12h or 2w')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows written and deleted per chunk')
+        parser.add_argument('--dir', default=None, help='Archive directory (default: OCCUPANCY_ARCHIVE_DIR)')
+        parser.add_argument(
+            '--include-unrolled',
+            action='store_true',
+            help='Also archive rows rollup_occupancy has not processed yet'
+        )
+    
+    def handle(self, *args, **options):
+        before = timezone.now() - parse_age(options['older_than'])
+        archive = OccupancyArchive(options['dir'])
+        count = archive.archive(
+            before,
+            chunk_size=options['chunk_size'],
+            rolled_up_only=not options['include_unrolled']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {count} occupancy records older than {before:%Y-%m-%d %H:%M} to {archive.directory}.'
+        ))
+        
+        if not options['include_unrolled']:
+            kept = OccupancyData.objects.filter(timestamp__lt=before).count()
+            if kept:
+                self.stdout.write(self.style.WARNING(
+                    f'Kept {kept} older records that rollup_occupancy has not processed yet.'
+                ))
@@ -0,0 +1,81 @@
+"""
+Management command to measure AnomalyDetector throughput
+"""
+import random
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection
+from accounts.models import User
+from reservations.models import Reservation, start_of_day
+from rooms.anomalies import AnomalyDetector
+from rooms.models import Room, OccupancyAlert
+
+
+class Command(BaseCommand):
+    help = 'Feed synthetic occupancy events through AnomalyDetector and report events per second and queries'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=200000, help='Number of events to process')
+        parser.add_argument('--devices', type=int, default=1000, help='Number of simulated devices')
+        parser.add_argument('--reserved-share', type=float, default=0.5, help='Share of rooms reserved today')
+        parser.add_argument('--interval', type=float, default=0.05, help='Simulated seconds between events')
+    
+    def handle(self, *args, **options):
+        events = options['events']
+        devices = options['devices']
+        
+        # Temporary rooms and guest, removed again (with their reservations
+        # and alerts) at the end
+        guest = User.objects.create(username='anomaly-benchmark-guest', role='normal')
+        rooms = Room.objects.bulk_create([
+            Room(room_number=f'A{i}', has_iot_device=True, iot_device_id=f'anomaly-{i}')
+            for i in range(devices)
+        ])
+        Reservation.objects.bulk_create([
+            Reservation(
+                user=guest,
+                room=room,
+                check_in=start_of_day(),
+                check_out=start_of_day() + timedelta(days=2)
+            )
+            for room in rooms[:int(devices * options['reserved_share'])]
+        ])
+        
+        queries = 0
+        
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+        
+        try:
+            detector = AnomalyDetector(occupied_after=300, vacant_after=1800)
+            detector.load()
+            rng = random.Random(0)
+            states = [rng.random() < 0.5 for _ in range(devices)]
+            base = start_of_day() + timedelta(hours=1)
+            step = timedelta(seconds=options['interval'])
+            
+            with connection.execute_wrapper(count_query):
+                start = time.perf_counter()
+                for n in range(events):
+                    device = rng.randrange(devices)
+                    # Mostly repeated states, as sensors report far more often than rooms change
+                    if rng.random() < 0.1:
+                        states[device] = not states[device]
+                    detector.observe(f'anomaly-{device}', states[device], base + n * step)
+                elapsed = time.perf_counter() - start
+                detector.flush()
+            
+            stored = OccupancyAlert.objects.filter(room__in=rooms).count()
+            self.stdout.write(self.style.SUCCESS(
+                f'Processed {detector.events} events in {elapsed:.2f}s ({detector.events / elapsed:,.0f} events/s), '
+                f'{queries} queries including alert writes'
+            ))
+            self.stdout.write(
+                f'Raised {detector.raised} alerts and resolved {detector.resolved}; {stored} stored'
+            )
+        finally:
+            Room.objects.filter(id__in=[room.id for room in rooms]).delete()
+            guest.delete()
@@ -0,0 +1,40 @@
+"""
+Management command to measure OccupancyData ingestion throughput
+"""
+import time
+from django.core.management.base import BaseCommand
+from rooms.ingestion import OccupancyIngestor
+from rooms.models import Room, OccupancyData
+
+
+class Command(BaseCommand):
+    help = 'Push synthetic occupancy events through OccupancyIngestor and report events per second'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=50000, help='Number of events to ingest')
+        parser.add_argument('--devices', type=int, default=200, help='Number of simulated devices')
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per bulk insert')
+    
+    def handle(self, *args, **options):
+        events = options['events']
+        devices = options['devices']
+        
+        # Temporary rooms, removed again (with their rows) at the end
+        rooms = Room.objects.bulk_create([
+            Room(room_number=f'B{i}', has_iot_device=True, iot_device_id=f'bench-{i}')
+            for i in range(devices)
+        ])
+        try:
+            start = time.perf_counter()
+            with OccupancyIngestor(batch_size=options['batch_size']) as ingestor:
+                for n in range(events):
+                    ingestor.submit(f'bench-{n % devices}', n % 2 == 0, {'seq': n})
+            elapsed = time.perf_counter() - start
+            
+            stored = OccupancyData.objects.filter(room__in=rooms).count()
+            self.stdout.write(self.style.SUCCESS(
+                f'Ingested {stored} of {events} events in {elapsed:.2f}s '
+                f'({stored / elapsed:,.0f} events/s, batch size {ingestor.batch_size})'
+            ))
+        finally:
+            Room.objects.filter(id__in=[room.id for room in rooms]).delete()
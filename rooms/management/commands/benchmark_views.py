@@ -0,0 +1,168 @@
+"""
+Management command to time the main pages end to end and compare against a baseline
+"""
+import json
+import math
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import User
+from rooms.models import Room, OccupancyData
+from reservations.availability import find_free_rooms
+from reservations.models import Reservation
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the dashboard, reservation page, room detail and reserve views through the test client, '
+        'write the results to JSON and fail on regressions against a baseline'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=10, help='Timed requests per scenario')
+        parser.add_argument('--output', default='benchmark_results.json', help='File to write the results to')
+        parser.add_argument('--baseline', default=None, help='Earlier results file to compare against')
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.25,
+            help='Allowed slowdown or memory growth over the baseline, as a fraction'
+        )
+    
+    def handle(self, *args, **options):
+        manager = User.objects.filter(role='manager').order_by('id').first()
+        today = timezone.now()
+        current = Reservation.objects.active().filter(
+            user__role='normal', check_in__lte=today, check_out__gte=today
+        ).select_related('user', 'room').first()
+        room = Room.objects.filter(has_iot_device=True).first() or Room.objects.first()
+        if manager is None or current is None or room is None:
+            raise CommandError('Needs a manager, rooms and a current reservation; run seed_load first')
+        
+        check_in = today.date() + timedelta(days=400)
+        check_out = check_in + timedelta(days=1)
+        free_rooms = find_free_rooms(check_in, check_out)
+        if not free_rooms:
+            raise CommandError('No room is free to benchmark reserve_room')
+        
+        def cancel_booking():
+            Reservation.objects.filter(user=booker).delete()
+        
+        results = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'runs': options['runs'],
+                'rooms': Room.objects.count(),
+                'reservations': Reservation.objects.count(),
+                'occupancy_rows': OccupancyData.objects.count(),
+            },
+            'scenarios': {},
+        }
+        # A user without reservations books the same free room and dates on
+        # every run; one left behind by a killed run is replaced
+        User.objects.filter(username='benchmark-booker').delete()
+        booker = User.objects.create_user(username='benchmark-booker', password='password')
+        try:
+            scenarios = [
+                ('dashboard_manager', manager, 'get', reverse('rooms:dashboard'), None, None),
+                ('dashboard_user', current.user, 'get', reverse('rooms:dashboard'), None, None),
+                ('reservation_page', current.user, 'get', reverse('reservations:reservation_page'), None, None),
+                ('room_detail', manager, 'get', reverse('rooms:room_detail', args=[room.room_number]), None, None),
+                (
+                    'reserve_room', booker, 'post',
+                    reverse('reservations:reserve_room', args=[free_rooms[0].room_number]),
+                    {'check_in_date': check_in.isoformat(), 'check_out_date': check_out.isoformat(), 'notes': ''},
+                    cancel_booking
+                ),
+            ]
+            
+            # Read IoT state from DeviceState, so no request waits on Firebase
+            with override_settings(OCCUPANCY_LIVE_STATE=True):
+                for name, user, method, url, data, after in scenarios:
+                    client = Client()
+                    client.force_login(user)
+                    results['scenarios'][name] = self.measure(client, method, url, data, after, options['runs'])
+                    self.report(name, results['scenarios'][name])
+        finally:
+            booker.delete()
+        
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(f'Wrote {options["output"]}')
+        
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+            regressions = self.compare(results, baseline, options['tolerance'])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            if regressions:
+                raise CommandError(f'{len(regressions)} regression(s) against {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {options["baseline"]}'))
+    
+    def measure(self, client, method, url, data, after, runs):
+        """Median and p95 wall time, query count and peak traced memory of one request"""
+        def request():
+            response = getattr(client, method)(url, data)
+            if response.status_code >= 400 or (method == 'get' and response.status_code != 200):
+                raise CommandError(f'{method.upper()} {url} returned {response.status_code}')
+            if after:
+                after()
+            return response
+        
+        request()  # Warm up caches and connections
+        timings = []
+        for _ in range(runs):
+            # The query log is capped, an earlier full log would capture nothing
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = getattr(client, method)(url, data)
+                timings.append((time.perf_counter() - start) * 1000)
+            if after:
+                after()
+        
+        # Memory is traced in a separate request, tracing slows everything down
+        tracemalloc.start()
+        try:
+            request()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        
+        timings.sort()
+        return {
+            'status': response.status_code,
+            'median_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(timings[math.ceil(0.95 * len(timings)) - 1], 2),
+            'queries': len(queries),
+            'peak_kb': round(peak / 1024, 1),
+        }
+    
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:<20} median {result["median_ms"]:>9.2f} ms  p95 {result["p95_ms"]:>9.2f} ms  '
+            f'{result["queries"]:>4} queries  peak {result["peak_kb"]:>9.1f} KB'
+        )
+    
+    def compare(self, results, baseline, tolerance):
+        regressions = []
+        for name, result in results['scenarios'].items():
+            base = baseline.get('scenarios', {}).get(name)
+            if base is None:
+                continue
+            if result['median_ms'] > base['median_ms'] * (1 + tolerance):
+                regressions.append(f'{name}: median {result["median_ms"]} ms, baseline {base["median_ms"]} ms')
+            if result['queries'] > base['queries']:
+                regressions.append(f'{name}: {result["queries"]} queries, baseline {base["queries"]}')
+            if result['peak_kb'] > base['peak_kb'] * (1 + tolerance):
+                regressions.append(f'{name}: peak {result["peak_kb"]} KB, baseline {base["peak_kb"]} KB')
+        return regressions
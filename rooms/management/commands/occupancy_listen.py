@@ -0,0 +1,60 @@
+"""
+Management command to mirror live IoT occupancy from Firebase into DeviceState
+"""
+from django.core.management.base import BaseCommand, CommandError
+from rooms.anomalies import AnomalyDetector
+from rooms.ingestion import OccupancyIngestor
+from rooms.occupancy_listener import FirebaseEventSource, OccupancyListener
+
+
+class Command(BaseCommand):
+    help = 'Stream device changes from Firebase and keep the DeviceState table up to date'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/devices', help='Firebase path to listen on')
+        parser.add_argument('--min-backoff', type=float, default=1, help='First reconnect delay in seconds')
+        parser.add_argument('--max-backoff', type=float, default=60, help='Longest reconnect delay in seconds')
+        parser.add_argument('--no-history', action='store_true', help='Do not record changes in OccupancyData')
+        parser.add_argument('--no-alerts', action='store_true',
+                            help='Do not compare changes with reservations to raise OccupancyAlerts')
+    
+    def handle(self, *args, **options):
+        try:
+            source = FirebaseEventSource(options['path'])
+        except ConnectionError as e:
+            raise CommandError(str(e))
+        
+        ingestor = None
+        if not options['no_history']:
+            ingestor = OccupancyIngestor().start()
+        detector = None
+        if not options['no_alerts']:
+            detector = AnomalyDetector().start()
+        
+        handlers = [consumer.submit_record for consumer in (ingestor, detector) if consumer]
+        
+        def on_change(device_id, data):
+            for handler in handlers:
+                handler(device_id, data)
+        
+        listener = OccupancyListener(
+            source,
+            on_change=on_change if handlers else None,
+            min_backoff=options['min_backoff'],
+            max_backoff=options['max_backoff'],
+            log=self.stdout.write
+        )
+        
+        self.stdout.write(self.style.SUCCESS(f'Mirroring {options["path"]} into DeviceState'))
+        try:
+            listener.run()
+        except KeyboardInterrupt:
+            listener.stop()
+            self.stdout.write(self.style.WARNING('\nStopped occupancy listener.'))
+        finally:
+            if ingestor:
+                ingestor.close()
+                self.stdout.write(f'Recorded {ingestor.written} occupancy changes.')
+            if detector:
+                detector.close()
+                self.stdout.write(f'Raised {detector.raised} occupancy alerts, resolved {detector.resolved}.')
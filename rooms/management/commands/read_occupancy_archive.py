@@ -0,0 +1,36 @@
+"""
+Management command to stream archived occupancy rows as JSON Lines
+"""
+import json
+from datetime import datetime, time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rooms.archive import OccupancyArchive
+
+
+def _start_of(value):
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise CommandError(f'Invalid date "{value}", expected YYYY-MM-DD')
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class Command(BaseCommand):
+    help = 'Write archived OccupancyData rows to stdout as JSON Lines'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--room', default=None, help='Room number (default: all rooms)')
+        parser.add_argument('--since', default=None, help='First day to include (YYYY-MM-DD)')
+        parser.add_argument('--until', default=None, help='Day to stop before (YYYY-MM-DD)')
+        parser.add_argument('--dir', default=None, help='Archive directory (default: OCCUPANCY_ARCHIVE_DIR)')
+    
+    def handle(self, *args, **options):
+        start = _start_of(options['since']) if options['since'] else None
+        end = _start_of(options['until']) if options['until'] else None
+        for record in OccupancyArchive(options['dir']).read(options['room'], start=start, end=end):
+            record['timestamp'] = record['timestamp'].isoformat()
+            self.stdout.write(json.dumps(record))
@@ -0,0 +1,39 @@
+"""
+Management command to fold new OccupancyData rows into the hourly and daily rollups
+"""
+import time
+from django.core.management.base import BaseCommand
+from rooms.rollups import roll_up_occupancy, reset_rollups
+
+
+class Command(BaseCommand):
+    help = 'Update OccupancyHourly and OccupancyDaily from OccupancyData rows written since the last run'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Raw rows processed per transaction')
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Delete the rollups and rebuild them from all raw rows'
+        )
+        parser.add_argument(
+            '--every',
+            type=int,
+            default=0,
+            help='Keep running and repeat every N seconds instead of running once'
+        )
+    
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            reset_rollups()
+            self.stdout.write('Deleted existing rollups.')
+        
+        while True:
+            count = roll_up_occupancy(batch_size=options['batch_size'])
+            self.stdout.write(
+                self.style.SUCCESS(f'Rolled up {count} occupancy records.')
+            )
+            
+            if not options['every']:
+                break
+            time.sleep(options['every'])
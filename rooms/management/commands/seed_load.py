@@ -0,0 +1,187 @@
+"""
+Management command to generate synthetic rooms, users, reservations and occupancy history
+"""
+import random
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import User
+from rooms.models import Building, Floor, Room, OccupancyData, DeviceState
+from rooms.services import bump_occupancy_version
+from reservations.availability import bump_availability_version
+from reservations.models import Reservation, start_of_day
+
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Generate load-test data with bulk inserts (log in as <prefix>-manager or <prefix>-user-N, password "password")'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=1000, help='Number of rooms')
+        parser.add_argument('--users', type=int, default=500, help='Number of normal users')
+        parser.add_argument('--reservations', type=int, default=10000, help='Number of reservations')
+        parser.add_argument('--occupancy-rows', type=int, default=100000, help='Number of OccupancyData rows')
+        parser.add_argument('--iot-share', type=float, default=0.25, help='Share of rooms with an IoT device')
+        parser.add_argument('--buildings', type=int, default=0,
+                            help='Spread the rooms evenly over this many buildings (default: no buildings)')
+        parser.add_argument('--floors', type=int, default=10, help='Floors per building')
+        parser.add_argument('--prefix', default='S', help='Room number prefix (up to 5 characters)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument('--clear', action='store_true', help='Delete data from an earlier run with the same prefix first')
+    
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if not 0 < len(prefix) <= 5:
+            raise CommandError('--prefix must be 1 to 5 characters')
+        user_prefix = f'{prefix.lower()}-'
+        rng = random.Random(options['seed'])
+        
+        if options['clear']:
+            self.clear(prefix, user_prefix)
+        if Room.objects.filter(room_number__startswith=prefix).exists():
+            raise CommandError(f'Rooms starting with "{prefix}" already exist, use --clear or another --prefix')
+        
+        # Hashing is slow, every seeded user shares one hash
+        password = make_password('password')
+        User.objects.create(username=f'{user_prefix}manager', password=password, role='manager')
+        users = User.objects.bulk_create([
+            User(username=f'{user_prefix}user-{i}', password=password, role='normal')
+            for i in range(options['users'])
+        ], batch_size=BATCH_SIZE)
+        
+        floors = self.create_floors(prefix, options['buildings'], options['floors'])
+        per_floor = -(-options['rooms'] // len(floors)) if floors else 0
+        rooms = Room.objects.bulk_create([
+            Room(
+                room_number=f'{prefix}{i:05d}',
+                floor=floors[i // per_floor] if floors else None,
+                building=floors[i // per_floor].building if floors else None,
+                has_iot_device=has_iot,
+                iot_device_id=f'{user_prefix}device-{i}' if has_iot else None
+            )
+            for i, has_iot in (
+                (i, rng.random() < options['iot_share']) for i in range(options['rooms'])
+            )
+        ], batch_size=BATCH_SIZE)
+        self.stdout.write(f'Created {len(rooms)} rooms and {len(users) + 1} users.')
+        
+        reservations = self.create_reservations(rooms, users, options['reservations'], rng)
+        self.stdout.write(f'Created {reservations} reservations.')
+        
+        iot_rooms = [room for room in rooms if room.has_iot_device]
+        rows = self.create_occupancy(iot_rooms, options['occupancy_rows'], rng)
+        self.stdout.write(f'Created {rows} occupancy records for {len(iot_rooms)} IoT rooms.')
+        
+        # Bulk inserts send no signals
+        bump_occupancy_version()
+        bump_availability_version()
+        self.stdout.write(self.style.SUCCESS('Load data ready.'))
+    
+    def clear(self, prefix, user_prefix):
+        rooms = Room.objects.filter(room_number__startswith=prefix)
+        DeviceState.objects.filter(
+            device_id__in=rooms.exclude(iot_device_id=None).values('iot_device_id')
+        ).delete()
+        rooms.delete()
+        Building.objects.filter(code__startswith=f'{prefix}-B').delete()
+        User.objects.filter(username__startswith=user_prefix).delete()
+        self.stdout.write(f'Deleted earlier data with prefix "{prefix}".')
+    
+    def create_floors(self, prefix, buildings, floors_per_building):
+        """Buildings <prefix>-B1, <prefix>-B2, ... with floors 1 to floors_per_building"""
+        if buildings <= 0:
+            return []
+        created = Building.objects.bulk_create([
+            Building(code=f'{prefix}-B{n}', name=f'Building {prefix}-{n}') for n in range(1, buildings + 1)
+        ])
+        floors = Floor.objects.bulk_create([
+            Floor(building=building, number=number)
+            for building in created for number in range(1, max(floors_per_building, 1) + 1)
+        ])
+        self.stdout.write(f'Created {len(created)} buildings with {len(floors)} floors.')
+        return floors
+    
+    def create_reservations(self, rooms, users, count, rng):
+        """
+        Give each room a timeline of back-to-back stays around today
+        
+        Stays never overlap within a room. Past stays are completed or
+        cancelled; current and future ones go to users in turn, so most
+        users hold at most one active reservation.
+        """
+        if not rooms or not users or count <= 0:
+            return 0
+        today = start_of_day()
+        per_room, extra = divmod(count, len(rooms))
+        next_user = 0
+        batch = []
+        created = 0
+        for index, room in enumerate(rooms):
+            cursor = today - timedelta(days=rng.randint(60, 180))
+            for _ in range(per_room + (index < extra)):
+                check_in = cursor + timedelta(days=rng.randint(0, 5))
+                check_out = check_in + timedelta(days=rng.randint(1, 7))
+                cursor = check_out
+                if check_out < today:
+                    status = 'cancelled' if rng.random() < 0.1 else 'completed'
+                    user = rng.choice(users)
+                else:
+                    status = 'active' if check_in <= today else 'reserved'
+                    user = users[next_user % len(users)]
+                    next_user += 1
+                batch.append(Reservation(
+                    user=user,
+                    room=room,
+                    status=status,
+                    check_in=check_in,
+                    check_out=check_out
+                ))
+            if len(batch) >= BATCH_SIZE:
+                created += len(Reservation.objects.bulk_create(batch))
+                batch = []
+        created += len(Reservation.objects.bulk_create(batch))
+        return created
+    
+    def create_occupancy(self, rooms, count, rng):
+        """Sensor history over the last 30 days, plus the current DeviceState of each device"""
+        if not rooms or count <= 0:
+            return 0
+        start = start_of_day() - timedelta(days=30)
+        per_room, extra = divmod(count, len(rooms))
+        batch = []
+        states = []
+        created = 0
+        for index, room in enumerate(rooms):
+            samples = per_room + (index < extra)
+            step = timedelta(days=30) / max(samples, 1)
+            occupied = rng.random() < 0.5
+            timestamp = start
+            for n in range(samples):
+                if rng.random() < 0.3:
+                    occupied = not occupied
+                timestamp = start + step * n + step * rng.random() * 0.5
+                batch.append(OccupancyData(
+                    room=room,
+                    is_occupied=occupied,
+                    timestamp=timestamp,
+                    sensor_data={'occupied': occupied, 'motion': occupied and rng.random() < 0.8, 'seq': n}
+                ))
+                if len(batch) >= BATCH_SIZE:
+                    created += len(OccupancyData.objects.bulk_create(batch))
+                    batch = []
+            states.append(DeviceState(
+                device_id=room.iot_device_id,
+                is_occupied=occupied,
+                data={'occupied': occupied, 'timestamp': timestamp.isoformat()}
+            ))
+        created += len(OccupancyData.objects.bulk_create(batch))
+        DeviceState.objects.bulk_create(
+            states,
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['device_id'],
+            update_fields=['is_occupied', 'data']
+        )
+        return created
@@ -0,0 +1,47 @@
+"""
+Management command to copy the SQLite primary database to its replicas
+"""
+import sqlite3
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the default SQLite database over each DATABASE_REPLICAS file, standing in '
+        'for replication when trying read replicas locally'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every',
+            type=float,
+            default=0,
+            help='Keep running and copy again every N seconds, simulating replication lag'
+        )
+    
+    def handle(self, *args, **options):
+        aliases = getattr(settings, 'DATABASE_REPLICA_ALIASES', [])
+        if not aliases:
+            raise CommandError('No replicas configured; set DATABASE_REPLICAS')
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Only SQLite databases can be copied; use the database\'s own replication')
+        
+        while True:
+            primary.ensure_connection()
+            for alias in aliases:
+                # Connections of this process must not hold the old file open
+                connections[alias].close()
+                target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    primary.connection.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(self.style.SUCCESS(f'Copied the primary database to {alias}.'))
+            
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(help_text='Firebase device ID', max_length=100, unique=True)),
+                ('is_occupied', models.BooleanField(default=False)),
+                ('data', models.JSONField(blank=True, default=dict, help_text='Raw device record from Firebase')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Device State',
+                'verbose_name_plural': 'Device States',
+                'ordering': ['device_id'],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:39
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0002_devicestate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='occupancydata',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='When the sensor reported this state'),
+        ),
+    ]
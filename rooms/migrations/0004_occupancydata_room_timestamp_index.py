@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0003_occupancydata_event_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='occupancydata',
+            index=models.Index(fields=['room', '-timestamp'], name='occupancy_room_timestamp'),
+        ),
+    ]
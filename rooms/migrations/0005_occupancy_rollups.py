@@ -0,0 +1,72 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0004_occupancydata_room_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OccupancyHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('occupied_seconds', models.FloatField(default=0, help_text='Seconds the room was reported occupied')),
+                ('transitions', models.PositiveIntegerField(default=0, help_text='Changes between occupied and vacant')),
+                ('samples', models.PositiveIntegerField(default=0, help_text='Raw OccupancyData rows in the period')),
+                ('first_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('last_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('last_is_occupied', models.BooleanField(default=False, help_text='State reported by the last sample')),
+                ('hour', models.DateTimeField(help_text='Start of the hour')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_occupancy', to='rooms.room')),
+            ],
+            options={
+                'verbose_name': 'Hourly Occupancy',
+                'verbose_name_plural': 'Hourly Occupancy',
+                'ordering': ['-hour'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OccupancyDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('occupied_seconds', models.FloatField(default=0, help_text='Seconds the room was reported occupied')),
+                ('transitions', models.PositiveIntegerField(default=0, help_text='Changes between occupied and vacant')),
+                ('samples', models.PositiveIntegerField(default=0, help_text='Raw OccupancyData rows in the period')),
+                ('first_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('last_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('last_is_occupied', models.BooleanField(default=False, help_text='State reported by the last sample')),
+                ('day', models.DateField()),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_occupancy', to='rooms.room')),
+            ],
+            options={
+                'verbose_name': 'Daily Occupancy',
+                'verbose_name_plural': 'Daily Occupancy',
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='occupancyhourly',
+            constraint=models.UniqueConstraint(fields=('room', 'hour'), name='occupancy_hourly_room_hour'),
+        ),
+        migrations.AddConstraint(
+            model_name='occupancydaily',
+            constraint=models.UniqueConstraint(fields=('room', 'day'), name='occupancy_daily_room_day'),
+        ),
+    ]
@@ -0,0 +1,171 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:34
+
+from django.db import migrations, models
+
+
+HOURLY_FIELDS = [f'hour_{hour:02d}_seconds' for hour in range(24)]
+
+
+def backfill_hourly_seconds(apps, schema_editor):
+    """Fill the new columns of existing daily rollups from the hourly ones"""
+    OccupancyHourly = apps.get_model('rooms', 'OccupancyHourly')
+    OccupancyDaily = apps.get_model('rooms', 'OccupancyDaily')
+    
+    def save(room_id, day, seconds):
+        OccupancyDaily.objects.filter(room_id=room_id, day=day).update(
+            weekday=day.weekday(), **dict(zip(HOURLY_FIELDS, seconds))
+        )
+    
+    current = None
+    seconds = None
+    rows = OccupancyHourly.objects.order_by('room_id', 'hour').values_list('room_id', 'hour', 'occupied_seconds')
+    for room_id, hour, occupied_seconds in rows.iterator(chunk_size=5000):
+        key = (room_id, hour.date())
+        if key != current:
+            if current is not None:
+                save(*current, seconds)
+            current = key
+            seconds = [0.0] * 24
+        seconds[hour.hour] += occupied_seconds
+    if current is not None:
+        save(*current, seconds)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0005_occupancy_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_00_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 00:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_01_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 01:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_02_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 02:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_03_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 03:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_04_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 04:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_05_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 05:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_06_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 06:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_07_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 07:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_08_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 08:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_09_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 09:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_10_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 10:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_11_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 11:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_12_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 12:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_13_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 13:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_14_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 14:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_15_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 15:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_16_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 16:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_17_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 17:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_18_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 18:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_19_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 19:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_20_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 20:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_21_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 21:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_22_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 22:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='hour_23_seconds',
+            field=models.FloatField(default=0, help_text='Seconds occupied from 23:00 UTC'),
+        ),
+        migrations.AddField(
+            model_name='occupancydaily',
+            name='weekday',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Day of the week, 0 is Monday'),
+        ),
+        migrations.AddIndex(
+            model_name='occupancydaily',
+            index=models.Index(fields=['day'], name='occupancy_daily_day'),
+        ),
+        migrations.RunPython(backfill_hourly_seconds, migrations.RunPython.noop),
+    ]
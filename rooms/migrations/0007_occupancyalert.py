@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0004_reservation_no_overlap_sqlite'),
+        ('rooms', '0006_occupancydaily_hourly_seconds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccupancyAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('unreserved_occupied', 'Occupied without a reservation'), ('reserved_vacant', 'Reserved but vacant')], max_length=30)),
+                ('started_at', models.DateTimeField(help_text='When the sensor and reservations started to disagree')),
+                ('resolved_at', models.DateTimeField(blank=True, help_text='When they agreed again', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('reservation', models.ForeignKey(blank=True, help_text='Reservation of a reserved but vacant room', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='alerts', to='reservations.reservation')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='rooms.room')),
+            ],
+            options={
+                'verbose_name': 'Occupancy Alert',
+                'verbose_name_plural': 'Occupancy Alerts',
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(condition=models.Q(('resolved_at__isnull', True)), fields=['room'], name='occupancy_alert_open')],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0007_occupancyalert'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Building',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(help_text='Short code used in filters, e.g. "B2"', max_length=20, unique=True)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Building',
+                'verbose_name_plural': 'Buildings',
+                'ordering': ['code'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Floor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.SmallIntegerField(help_text='0 is the ground floor, negative numbers are basements')),
+                ('name', models.CharField(blank=True, max_length=50)),
+            ],
+            options={
+                'verbose_name': 'Floor',
+                'verbose_name_plural': 'Floors',
+                'ordering': ['building', 'number'],
+            },
+        ),
+        migrations.AddField(
+            model_name='floor',
+            name='building',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='floors', to='rooms.building'),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='building',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rooms', to='rooms.building'),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='floor',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rooms', to='rooms.floor'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['building', 'room_number'], name='room_building_number'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['floor', 'room_number'], name='room_floor_number'),
+        ),
+        migrations.AddConstraint(
+            model_name='floor',
+            constraint=models.UniqueConstraint(fields=('building', 'number'), name='floor_building_number'),
+        ),
+    ]
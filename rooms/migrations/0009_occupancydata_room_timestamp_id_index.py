@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0008_buildings_floors'),
+    ]
+
+    operations = [
+        # The new index is built before the old one is dropped
+        migrations.AddIndex(
+            model_name='occupancydata',
+            index=models.Index(fields=['room', '-timestamp', '-id'], name='occupancy_room_timestamp_id'),
+        ),
+        migrations.RemoveIndex(
+            model_name='occupancydata',
+            name='occupancy_room_timestamp',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0009_occupancydata_room_timestamp_id_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='devicestate',
+            index=models.Index(fields=['updated_at'], name='device_state_updated_at'),
+        ),
+    ]
@@ -1,10 +1,68 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+
+
+class Building(models.Model):
+    """A building whose floors hold rooms"""
+    code = models.CharField(max_length=20, unique=True, help_text='Short code used in filters, e.g. "B2"')
+    name = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['code']
+        verbose_name = 'Building'
+        verbose_name_plural = 'Buildings'
+    
+    def __str__(self):
+        return self.name or self.code
+
+
+class Floor(models.Model):
+    """A floor of a building"""
+    building = models.ForeignKey(Building, on_delete=models.CASCADE, related_name='floors')
+    number = models.SmallIntegerField(help_text='0 is the ground floor, negative numbers are basements')
+    name = models.CharField(max_length=50, blank=True)
+    
+    class Meta:
+        ordering = ['building', 'number']
+        verbose_name = 'Floor'
+        verbose_name_plural = 'Floors'
+        constraints = [
+            models.UniqueConstraint(fields=['building', 'number'], name='floor_building_number'),
+        ]
+    
+    def __str__(self):
+        return f'{self.building.code} {self.name or f"Floor {self.number}"}'
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Keep the building copied onto the floor's rooms
+        self.rooms.exclude(building_id=self.building_id).update(building_id=self.building_id)
 
 
 class Room(models.Model):
-    """Room model representing the 40 rooms"""
+    """A room, optionally placed on a floor of a building"""
     room_number = models.CharField(max_length=10, unique=True)
+    floor = models.ForeignKey(
+        Floor,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='rooms',
+        db_index=False
+    )
+    # Copy of floor.building, kept by save() and Floor.save(), so the rooms
+    # of a building can be paged in room number order from one index
+    building = models.ForeignKey(
+        Building,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='rooms',
+        db_index=False
+    )
     has_iot_device = models.BooleanField(default=False, help_text='Whether this room has an IoT device connected')
     iot_device_id = models.CharField(max_length=100, blank=True, null=True, help_text='Firebase device ID')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -14,10 +72,22 @@ class Room(models.Model):
         ordering = ['room_number']
         verbose_name = 'Room'
         verbose_name_plural = 'Rooms'
+        indexes = [
+            # Dashboard pages of a building or floor
+            models.Index(fields=['building', 'room_number'], name='room_building_number'),
+            models.Index(fields=['floor', 'room_number'], name='room_floor_number'),
+        ]
     
     def __str__(self):
         return f'Room {self.room_number}'
     
+    def save(self, *args, **kwargs):
+        self.building_id = self.floor.building_id if self.floor_id else None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'floor' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'building'}
+        super().save(*args, **kwargs)
+    
     def get_current_occupancy_status(self):
         """Get the latest occupancy status from Firebase or Reservation"""
         from reservations.models import Reservation
@@ -26,10 +96,9 @@ class Room(models.Model):
         # Check if room is currently reserved/rented (exclude manager reservations)
         # Only consider it reserved if today is within the reservation period
         today = timezone.now().date()
-        all_reservations = Reservation.objects.filter(
-            room=self,
-            status__in=['reserved', 'active']
-        ).exclude(user__role='manager')
+        all_reservations = Reservation.objects.active().filter(
+            room=self
+        ).exclude(user__role='manager').select_related('user')
         
         active_reservation = None
         for res in all_reservations:
@@ -83,14 +152,174 @@ class OccupancyData(models.Model):
     """Historical occupancy data from IoT devices"""
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='occupancy_history')
     is_occupied = models.BooleanField(default=False)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, help_text='When the sensor reported this state')
     sensor_data = models.JSONField(default=dict, blank=True, help_text='Raw sensor data from IoT device')
     
     class Meta:
         ordering = ['-timestamp']
         verbose_name = 'Occupancy Data'
         verbose_name_plural = 'Occupancy Data'
+        indexes = [
+            # Room history, newest first; id breaks ties for keyset pages
+            models.Index(fields=['room', '-timestamp', '-id'], name='occupancy_room_timestamp_id'),
+        ]
     
     def __str__(self):
         return f'{self.room.room_number} - {self.timestamp}'
 
+
+class DeviceState(models.Model):
+    """Latest known state of an IoT device, mirrored from Firebase by occupancy_listen"""
+    device_id = models.CharField(max_length=100, unique=True, help_text='Firebase device ID')
+    is_occupied = models.BooleanField(default=False)
+    data = models.JSONField(default=dict, blank=True, help_text='Raw device record from Firebase')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['device_id']
+        verbose_name = 'Device State'
+        verbose_name_plural = 'Device States'
+        indexes = [
+            # Latest sensor change, see get_occupancy_changed_at
+            models.Index(fields=['updated_at'], name='device_state_updated_at'),
+        ]
+    
+    def __str__(self):
+        return f'{self.device_id} - {self.updated_at}'
+
+
+class OccupancyRollup(models.Model):
+    """
+    Occupancy of a room summarised over a fixed period
+    
+    A sensor state holds from its sample until the room's next sample, so
+    occupied_seconds only covers time up to the latest sample.
+    """
+    period_seconds = None
+    
+    occupied_seconds = models.FloatField(default=0, help_text='Seconds the room was reported occupied')
+    transitions = models.PositiveIntegerField(default=0, help_text='Changes between occupied and vacant')
+    samples = models.PositiveIntegerField(default=0, help_text='Raw OccupancyData rows in the period')
+    first_timestamp = models.DateTimeField(null=True, blank=True)
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+    last_is_occupied = models.BooleanField(default=False, help_text='State reported by the last sample')
+    
+    class Meta:
+        abstract = True
+    
+    @property
+    def occupied_hours(self):
+        return self.occupied_seconds / 3600
+    
+    @property
+    def occupancy_rate(self):
+        """Share of the period the room was occupied, in percent"""
+        return 100 * self.occupied_seconds / self.period_seconds
+
+
+class OccupancyHourly(OccupancyRollup):
+    """Occupancy of a room per hour (UTC), maintained by rollup_occupancy"""
+    period_seconds = 3600
+    
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='hourly_occupancy')
+    hour = models.DateTimeField(help_text='Start of the hour')
+    
+    class Meta:
+        ordering = ['-hour']
+        verbose_name = 'Hourly Occupancy'
+        verbose_name_plural = 'Hourly Occupancy'
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'hour'], name='occupancy_hourly_room_hour'),
+        ]
+    
+    def __str__(self):
+        return f'{self.room.room_number} - {self.hour}'
+
+
+class OccupancyDaily(OccupancyRollup):
+    """Occupancy of a room per day (UTC), maintained by rollup_occupancy"""
+    period_seconds = 86400
+    
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='daily_occupancy')
+    day = models.DateField()
+    weekday = models.PositiveSmallIntegerField(default=0, help_text='Day of the week, 0 is Monday')
+    
+    class Meta:
+        ordering = ['-day']
+        verbose_name = 'Daily Occupancy'
+        verbose_name_plural = 'Daily Occupancy'
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'day'], name='occupancy_daily_room_day'),
+        ]
+        indexes = [
+            # Reports over a period for all rooms
+            models.Index(fields=['day'], name='occupancy_daily_day'),
+        ]
+    
+    def __str__(self):
+        return f'{self.room.room_number} - {self.day}'
+    
+    @property
+    def hourly_seconds(self):
+        """Occupied seconds in each hour of the day, as a list of 24"""
+        return [getattr(self, field) for field in HOURLY_FIELDS]
+
+
+# Occupied seconds per hour of the day as plain columns (hour_00_seconds to
+# hour_23_seconds), so hour-of-week reports over long periods are summed by
+# the database from one row per room and day
+HOURLY_FIELDS = [f'hour_{hour:02d}_seconds' for hour in range(24)]
+for _hour, _field in enumerate(HOURLY_FIELDS):
+    OccupancyDaily.add_to_class(_field, models.FloatField(default=0, help_text=f'Seconds occupied from {_hour:02d}:00 UTC'))
+del _hour, _field
+
+
+class RollupWatermark(models.Model):
+    """ID of the last raw row folded into a set of rollups"""
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return f'{self.name} - {self.last_id}'
+
+
+class OccupancyAlert(models.Model):
+    """Disagreement between a room's sensor and its reservations, raised by the anomaly detector"""
+    KIND_CHOICES = [
+        ('unreserved_occupied', 'Occupied without a reservation'),
+        ('reserved_vacant', 'Reserved but vacant'),
+    ]
+    
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='alerts')
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    reservation = models.ForeignKey(
+        'reservations.Reservation',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='alerts',
+        help_text='Reservation of a reserved but vacant room'
+    )
+    started_at = models.DateTimeField(help_text='When the sensor and reservations started to disagree')
+    resolved_at = models.DateTimeField(null=True, blank=True, help_text='When they agreed again')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-started_at']
+        verbose_name = 'Occupancy Alert'
+        verbose_name_plural = 'Occupancy Alerts'
+        indexes = [
+            # Open alerts, loaded when the detector starts
+            models.Index(fields=['room'], condition=models.Q(resolved_at__isnull=True), name='occupancy_alert_open'),
+        ]
+    
+    def __str__(self):
+        return f'{self.room.room_number} - {self.get_kind_display()} ({self.started_at})'
+    
+    @property
+    def is_open(self):
+        return self.resolved_at is None
@@ -0,0 +1,307 @@
+"""
+Streaming mirror of the Firebase /devices tree into DeviceState
+
+The listener keeps an in-memory copy of the device tree, applies the
+put/patch events of the Realtime Database streaming API to it, and writes
+the devices that changed to the DeviceState table. Web requests then read
+occupancy from that table instead of calling Firebase.
+
+Any object with the same methods as FirebaseEventSource can be used as the
+event source. MemoryEventSource keeps the tree in memory, so the listener
+can run without Firebase, e.g. in tests.
+"""
+import copy
+import queue
+import random
+import threading
+from django.utils import timezone
+from .models import DeviceState
+from .services import bump_occupancy_version
+
+
+class FirebaseEventSource:
+    """Event source backed by the Firebase Realtime Database streaming API"""
+    
+    def __init__(self, path='/devices'):
+        from .firebase_service import FirebaseService
+        
+        self.path = path
+        if FirebaseService._app is None:
+            FirebaseService()._initialize_firebase()
+        if FirebaseService._app is None:
+            raise ConnectionError('Firebase is not initialized')
+    
+    def snapshot(self):
+        """Return the full tree under path"""
+        from firebase_admin import db
+        return db.reference(self.path).get() or {}
+    
+    def listen(self, callback):
+        """
+        Start streaming events to callback(event_type, path, data)
+        
+        Returns:
+            FirebaseSubscription: Handle used to check and close the stream
+        """
+        from firebase_admin import db
+        
+        def on_event(event):
+            callback(event.event_type, event.path, event.data)
+        
+        return FirebaseSubscription(db.reference(self.path).listen(on_event))
+
+
+class FirebaseSubscription:
+    """Wraps a firebase_admin ListenerRegistration"""
+    
+    def __init__(self, registration):
+        self.registration = registration
+    
+    def is_alive(self):
+        # The SDK ends its stream thread silently when the connection drops.
+        # The thread is not public API: if a release renames it, assume the
+        # stream is alive rather than reconnecting every check_interval.
+        thread = getattr(self.registration, '_thread', None)
+        return thread is None or thread.is_alive()
+    
+    def close(self):
+        self.registration.close()
+
+
+class MemoryEventSource:
+    """
+    Event source holding the device tree in memory
+    
+    send() changes the tree and streams the event to the current
+    subscription, disconnect() drops the stream the way a lost connection
+    does. Events sent while disconnected only reach the tree, as they would
+    only reach Firebase.
+    """
+    
+    def __init__(self, tree=None):
+        self.tree = DeviceStateStore()
+        self.tree.replace(copy.deepcopy(tree or {}))
+        self.subscription = None
+    
+    def snapshot(self):
+        return copy.deepcopy(self.tree.devices)
+    
+    def listen(self, callback):
+        self.subscription = MemorySubscription(callback)
+        return self.subscription
+    
+    def send(self, event_type, path, data):
+        """Apply an event to the tree and stream it to the listener, if connected"""
+        self.tree.apply(event_type, path, copy.deepcopy(data))
+        if self.subscription is not None and self.subscription.is_alive():
+            self.subscription.callback(event_type, path, copy.deepcopy(data))
+    
+    def disconnect(self):
+        if self.subscription is not None:
+            self.subscription.close()
+
+
+class MemorySubscription:
+    """Subscription handle of MemoryEventSource"""
+    
+    def __init__(self, callback):
+        self.callback = callback
+        self.closed = False
+    
+    def is_alive(self):
+        return not self.closed
+    
+    def close(self):
+        self.closed = True
+
+
+class DeviceStateStore:
+    """In-memory copy of the device tree, persisted to DeviceState"""
+    
+    def __init__(self):
+        self.devices = {}
+    
+    def replace(self, tree):
+        """
+        Replace the whole tree with a fresh snapshot
+        
+        Returns:
+            set: IDs of devices that were added, changed or removed
+        """
+        tree = tree if isinstance(tree, dict) else {}
+        changed = {
+            device_id for device_id in set(self.devices) | set(tree)
+            if self.devices.get(device_id) != tree.get(device_id)
+        }
+        self.devices = dict(tree)
+        return changed
+    
+    def apply(self, event_type, path, data):
+        """
+        Apply one streaming event
+        
+        Args:
+            event_type: 'put' replaces the value at path, 'patch' merges the
+                keys of data into it
+            path: Path relative to the listened reference, e.g. '/' or '/101/occupied'
+            data: New value, None deletes
+        
+        Returns:
+            set: IDs of devices touched by the event
+        """
+        segments = [segment for segment in path.split('/') if segment]
+        
+        if not segments:
+            if event_type == 'put':
+                return self.replace(data)
+            if event_type == 'patch' and isinstance(data, dict):
+                for device_id, value in data.items():
+                    self._set([device_id], value)
+                return set(data)
+            return set()
+        
+        if event_type == 'put':
+            self._set(segments, data)
+        elif event_type == 'patch' and isinstance(data, dict):
+            for key, value in data.items():
+                self._set(segments + [key], value)
+        else:
+            return set()
+        return {segments[0]}
+    
+    def _set(self, segments, value):
+        node = self.devices
+        for segment in segments[:-1]:
+            child = node.get(segment)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = node[segment] = {}
+            node = child
+        if value is None:
+            node.pop(segments[-1], None)
+        else:
+            node[segments[-1]] = value
+    
+    def persist(self, device_ids):
+        """Write the given devices to DeviceState, deleting removed ones"""
+        from .firebase_service import FirebaseService
+        
+        if not device_ids:
+            return
+        now = timezone.now()
+        states = []
+        removed = []
+        for device_id in device_ids:
+            data = self.devices.get(device_id)
+            occupancy = FirebaseService.format_occupancy(data)
+            if occupancy is None:
+                removed.append(device_id)
+                continue
+            states.append(DeviceState(
+                device_id=device_id,
+                is_occupied=bool(occupancy['is_occupied']),
+                data=data,
+                updated_at=now
+            ))
+        if states:
+            DeviceState.objects.bulk_create(
+                states,
+                update_conflicts=True,
+                unique_fields=['device_id'],
+                update_fields=['is_occupied', 'data', 'updated_at']
+            )
+        if removed:
+            DeviceState.objects.filter(device_id__in=removed).delete()
+        bump_occupancy_version()
+
+
+class OccupancyListener:
+    """
+    Keeps DeviceState in sync with an event source
+    
+    Every (re)connection starts with a full snapshot, so events missed
+    while disconnected are never lost. Failed connections are retried with
+    exponential backoff and jitter.
+    """
+    
+    def __init__(self, source, store=None, on_change=None, min_backoff=1, max_backoff=60,
+                 check_interval=5, batch_size=500, log=print):
+        self.source = source
+        self.store = store or DeviceStateStore()
+        self.on_change = on_change
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.check_interval = check_interval
+        self.batch_size = batch_size
+        self.log = log
+        self.stop_event = threading.Event()
+        self._events = queue.Queue()
+    
+    def stop(self):
+        self.stop_event.set()
+    
+    def resync(self):
+        """Reload the full tree from the source and persist the differences"""
+        changed = self.store.replace(self.source.snapshot())
+        self._commit(changed)
+        return changed
+    
+    def run(self):
+        """Run until stop() is called"""
+        backoff = self.min_backoff
+        while not self.stop_event.is_set():
+            subscription = None
+            try:
+                self._events = queue.Queue()
+                self.resync()
+                subscription = self.source.listen(self._enqueue)
+                backoff = self.min_backoff
+                self.log('Listening for occupancy changes')
+                self._consume(subscription)
+            except Exception as e:
+                self.log(f'Occupancy listener error: {e}')
+            finally:
+                if subscription is not None:
+                    try:
+                        subscription.close()
+                    except Exception:
+                        pass
+            
+            if self.stop_event.is_set():
+                break
+            delay = backoff + random.uniform(0, backoff / 2)
+            self.log(f'Reconnecting in {delay:.1f} seconds')
+            self.stop_event.wait(delay)
+            backoff = min(backoff * 2, self.max_backoff)
+    
+    def _enqueue(self, event_type, path, data):
+        # Called on the source's thread; the database work happens in run()
+        self._events.put((event_type, path, data))
+    
+    def _consume(self, subscription):
+        """Apply queued events until the subscription drops or stop() is called"""
+        while not self.stop_event.is_set():
+            try:
+                event = self._events.get(timeout=self.check_interval)
+            except queue.Empty:
+                if not subscription.is_alive():
+                    raise ConnectionError('event stream closed')
+                continue
+            
+            changed = set()
+            while True:
+                changed |= self.store.apply(*event)
+                if len(changed) >= self.batch_size:
+                    break
+                try:
+                    event = self._events.get_nowait()
+                except queue.Empty:
+                    break
+            self._commit(changed)
+    
+    def _commit(self, changed):
+        self.store.persist(changed)
+        if self.on_change:
+            for device_id in changed:
+                self.on_change(device_id, self.store.devices.get(device_id))
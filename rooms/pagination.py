@@ -0,0 +1,127 @@
+"""
+Keyset (cursor) pagination
+
+A page is selected with a WHERE on the ordering columns of the row next to
+it instead of an OFFSET, so with an index on those columns every page is
+an index range scan that costs the same however deep into the listing it
+is. The last ordering column must be unique. Cursors are opaque strings
+holding the ordering values of the row a page continues from.
+"""
+import base64
+import binascii
+import json
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor that was not produced for this ordering"""
+
+
+def _json_default(value):
+    # Full isoformat: DjangoJSONEncoder cuts datetimes to milliseconds,
+    # which would skip or repeat rows sharing a millisecond
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(values):
+    data = json.dumps(list(values), default=_json_default, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """
+    Ordering values held by a cursor
+    
+    Raises:
+        InvalidCursor: If the cursor is malformed or has the wrong length
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise InvalidCursor('Invalid cursor')
+    if not isinstance(values, list) or len(values) != length:
+        raise InvalidCursor('Invalid cursor')
+    return values
+
+
+def _reverse(key):
+    return key[1:] if key.startswith('-') else f'-{key}'
+
+
+def _after(keys, values):
+    """Q for the rows that come after values in the order of keys"""
+    condition = Q()
+    equal = {}
+    for key, value in zip(keys, values):
+        field = key.lstrip('-')
+        lookup = 'lt' if key.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{field}__{lookup}': value})
+        equal[field] = value
+    if len(keys) == 1:
+        return condition
+    # A bound on the first column alone lets the database seek the index
+    first = keys[0].lstrip('-')
+    bound = 'lte' if keys[0].startswith('-') else 'gte'
+    return Q(**{f'{first}__{bound}': values[0]}) & condition
+
+
+class KeysetPage:
+    """
+    One page of rows and the cursors of its neighbours
+    
+    Attributes:
+        items: Rows of the page, in order
+        next_cursor: Cursor of the following page, None on the last page
+        previous_cursor: Cursor of the preceding page, None on the first page
+    """
+    
+    def __init__(self, items, keys, has_next, has_previous):
+        self.items = items
+        self.keys = keys
+        self.next_cursor = self._cursor(items[-1]) if has_next and items else None
+        self.previous_cursor = self._cursor(items[0]) if has_previous and items else None
+    
+    def _cursor(self, row):
+        fields = [key.lstrip('-') for key in self.keys]
+        if isinstance(row, dict):
+            return encode_cursor(row[field] for field in fields)
+        return encode_cursor(getattr(row, field) for field in fields)
+    
+    def __iter__(self):
+        return iter(self.items)
+    
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_page(queryset, keys, size, after=None, before=None):
+    """
+    Page of queryset in the order of keys
+    
+    Args:
+        queryset: Rows to page through, model instances or values() dicts
+        keys: Ordering, e.g. ['room_number'] or ['-timestamp', '-id'];
+            the last key must be unique
+        size: Rows per page
+        after: Cursor from next_cursor, the page following it
+        before: Cursor from previous_cursor, the page preceding it
+    
+    Returns:
+        KeysetPage
+    
+    Raises:
+        InvalidCursor: If a cursor is malformed
+    """
+    if before:
+        reverse = [_reverse(key) for key in keys]
+        values = decode_cursor(before, len(keys))
+        rows = list(queryset.filter(_after(reverse, values)).order_by(*reverse)[:size + 1])
+        has_previous = len(rows) > size
+        return KeysetPage(rows[:size][::-1], keys, True, has_previous)
+    
+    if after:
+        queryset = queryset.filter(_after(keys, decode_cursor(after, len(keys))))
+    rows = list(queryset.order_by(*keys)[:size + 1])
+    return KeysetPage(rows[:size], keys, len(rows) > size, bool(after))
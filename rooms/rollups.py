@@ -0,0 +1,223 @@
+"""
+Incremental hourly and daily rollups of raw OccupancyData
+
+Raw rows are folded into OccupancyHourly and OccupancyDaily in ID order,
+starting after the ID recorded in RollupWatermark, so each run only reads
+rows written since the previous one. Reports over weeks or months then
+read one row per room and day instead of every sensor sample.
+"""
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from .models import Room, OccupancyData, OccupancyHourly, OccupancyDaily, RollupWatermark, HOURLY_FIELDS
+
+
+WATERMARK_NAME = 'occupancy'
+HOUR = timedelta(hours=1)
+ROLLUP_FIELDS = [
+    'occupied_seconds', 'transitions', 'samples',
+    'first_timestamp', 'last_timestamp', 'last_is_occupied'
+]
+
+
+def hour_start(timestamp):
+    """Start of the UTC hour containing timestamp"""
+    return timestamp.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _merge_samples(target, samples, first_timestamp, last_timestamp, last_is_occupied):
+    target.samples += samples
+    if target.first_timestamp is None or first_timestamp < target.first_timestamp:
+        target.first_timestamp = first_timestamp
+    if target.last_timestamp is None or last_timestamp >= target.last_timestamp:
+        target.last_timestamp = last_timestamp
+        target.last_is_occupied = last_is_occupied
+
+
+class RollupDelta:
+    """Changes to apply to one rollup row"""
+    
+    __slots__ = ROLLUP_FIELDS
+    
+    def __init__(self):
+        self.occupied_seconds = 0.0
+        self.transitions = 0
+        self.samples = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.last_is_occupied = False
+    
+    def add_sample(self, timestamp, is_occupied):
+        _merge_samples(self, 1, timestamp, timestamp, is_occupied)
+    
+    def apply_to(self, row):
+        """Add this delta to a rollup row (or another delta)"""
+        row.occupied_seconds += self.occupied_seconds
+        row.transitions += self.transitions
+        if self.samples:
+            _merge_samples(row, self.samples, self.first_timestamp, self.last_timestamp, self.last_is_occupied)
+
+
+class DailyDelta(RollupDelta):
+    """RollupDelta that also splits the occupied time by hour of the day"""
+    
+    __slots__ = ['hourly_seconds']
+    
+    def __init__(self):
+        super().__init__()
+        self.hourly_seconds = [0.0] * 24
+    
+    def add_hour(self, hour, delta):
+        """Add the delta of one hour of this day"""
+        delta.apply_to(self)
+        self.hourly_seconds[hour.hour] += delta.occupied_seconds
+    
+    def apply_to(self, row):
+        super().apply_to(row)
+        for field, seconds in zip(HOURLY_FIELDS, self.hourly_seconds):
+            if seconds:
+                setattr(row, field, getattr(row, field) + seconds)
+
+
+def _load_last_states(room_ids):
+    """Map room id -> (timestamp, is_occupied) of its latest rolled up sample, or None"""
+    latest = OccupancyHourly.objects.filter(room=OuterRef('pk'), samples__gt=0).order_by('-hour')
+    rooms = Room.objects.filter(id__in=room_ids).annotate(
+        last_timestamp=Subquery(latest.values('last_timestamp')[:1]),
+        last_is_occupied=Subquery(latest.values('last_is_occupied')[:1])
+    ).values_list('id', 'last_timestamp', 'last_is_occupied')
+    states = dict.fromkeys(room_ids)
+    for room_id, last_timestamp, last_is_occupied in rooms:
+        if last_timestamp is not None:
+            states[room_id] = (last_timestamp, bool(last_is_occupied))
+    return states
+
+
+def build_deltas(rows, last_states):
+    """
+    Fold raw samples into hourly and daily deltas
+    
+    Each sample's state is counted as lasting until the room's next
+    sample, split across hour boundaries. Samples older than the room's
+    latest one arrived late: they are counted, but do not change the
+    occupied time or transitions.
+    
+    Args:
+        rows: (id, room_id, timestamp, is_occupied) tuples
+        last_states: room id -> (timestamp, is_occupied) of the latest
+            sample already rolled up, or None. Updated in place.
+    
+    Returns:
+        tuple: ((room_id, hour) -> RollupDelta, (room_id, day) -> RollupDelta)
+    """
+    hourly = defaultdict(RollupDelta)
+    for _, room_id, timestamp, is_occupied in sorted(rows, key=lambda row: (row[1], row[2], row[0])):
+        hourly[(room_id, hour_start(timestamp))].add_sample(timestamp, is_occupied)
+        
+        previous = last_states.get(room_id)
+        if previous is not None:
+            previous_timestamp, previous_is_occupied = previous
+            if timestamp < previous_timestamp:
+                continue
+            if previous_is_occupied:
+                start = previous_timestamp
+                hour = hour_start(start)
+                while start < timestamp:
+                    boundary = min(hour + HOUR, timestamp)
+                    hourly[(room_id, hour)].occupied_seconds += (boundary - start).total_seconds()
+                    start = boundary
+                    hour += HOUR
+            if is_occupied != previous_is_occupied:
+                hourly[(room_id, hour_start(timestamp))].transitions += 1
+        last_states[room_id] = (timestamp, is_occupied)
+    
+    daily = defaultdict(DailyDelta)
+    for (room_id, hour), delta in hourly.items():
+        daily[(room_id, hour.date())].add_hour(hour, delta)
+    return hourly, daily
+
+
+def _save_deltas(model, period_field, deltas, fields=ROLLUP_FIELDS, new_row_fields=None):
+    """
+    Add deltas to existing rollup rows and create the missing ones
+    
+    Args:
+        fields: Fields the deltas change
+        new_row_fields: Function returning extra fields of a new row from its period
+    """
+    if not deltas:
+        return
+    room_ids = {room_id for room_id, _ in deltas}
+    periods = [period for _, period in deltas]
+    existing = {
+        (row.room_id, getattr(row, period_field)): row
+        for row in model.objects.filter(
+            room_id__in=room_ids,
+            **{f'{period_field}__range': (min(periods), max(periods))}
+        )
+    }
+    
+    to_create = []
+    to_update = []
+    for (room_id, period), delta in deltas.items():
+        row = existing.get((room_id, period))
+        if row is None:
+            extra = new_row_fields(period) if new_row_fields else {}
+            row = model(room_id=room_id, **{period_field: period}, **extra)
+            to_create.append(row)
+        else:
+            to_update.append(row)
+        delta.apply_to(row)
+    
+    model.objects.bulk_create(to_create, batch_size=500)
+    model.objects.bulk_update(to_update, fields, batch_size=500)
+
+
+def roll_up_occupancy(batch_size=10000):
+    """
+    Fold raw OccupancyData rows written since the last run into the rollups
+    
+    Rows are processed in batches of batch_size, each in one transaction
+    together with the watermark update, so an interrupted run resumes
+    where it stopped. Only one run should be active at a time.
+    
+    Returns:
+        int: Number of raw rows processed
+    """
+    RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)
+    last_states = {}
+    processed = 0
+    while True:
+        with transaction.atomic():
+            watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK_NAME)
+            rows = list(
+                OccupancyData.objects.filter(id__gt=watermark.last_id).order_by('id').values_list(
+                    'id', 'room_id', 'timestamp', 'is_occupied'
+                )[:batch_size]
+            )
+            if not rows:
+                return processed
+            
+            unseen = {room_id for _, room_id, _, _ in rows} - set(last_states)
+            if unseen:
+                last_states.update(_load_last_states(unseen))
+            hourly, daily = build_deltas(rows, last_states)
+            _save_deltas(OccupancyHourly, 'hour', hourly)
+            _save_deltas(
+                OccupancyDaily, 'day', daily,
+                fields=ROLLUP_FIELDS + HOURLY_FIELDS,
+                new_row_fields=lambda day: {'weekday': day.weekday()}
+            )
+            
+            watermark.last_id = rows[-1][0]
+            watermark.save(update_fields=['last_id', 'updated_at'])
+        processed += len(rows)
+
+
+def reset_rollups():
+    """Delete all rollups so the next run rebuilds them from the raw rows"""
+    with transaction.atomic():
+        OccupancyHourly.objects.all().delete()
+        OccupancyDaily.objects.all().delete()
+        RollupWatermark.objects.filter(name=WATERMARK_NAME).delete()
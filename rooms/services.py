@@ -0,0 +1,250 @@
+"""
+Bulk occupancy resolution for sets of rooms
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Exists, Max, OuterRef, Q
+from django.utils import timezone
+from echo_occupancy.replicas import primary_reads
+from reservations.models import Reservation
+from .models import DeviceState
+
+
+OCCUPANCY_VERSION_KEY = 'occupancy:version'
+FLOOR_SUMMARY_CACHE_KEY = 'dashboard:floors:{}:{}:{}'
+
+# Cache backends that each process keeps to itself
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_shared():
+    """Whether every process (web workers, occupancy_listen) sees the same default cache"""
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+def get_occupancy_version():
+    """
+    Time of the last known change to room occupancy, as a Unix timestamp
+    
+    Kept in the Django cache and bumped by bump_occupancy_version(), so
+    clients can be told nothing changed without touching the database.
+    Deployments running several processes need a shared cache backend.
+    """
+    version = cache.get(OCCUPANCY_VERSION_KEY)
+    if version is None:
+        cache.add(OCCUPANCY_VERSION_KEY, time.time(), None)
+        version = cache.get(OCCUPANCY_VERSION_KEY, time.time())
+    return version
+
+
+def bump_occupancy_version():
+    """Record that reservations, rooms or sensor state changed"""
+    cache.set(OCCUPANCY_VERSION_KEY, time.time(), None)
+
+
+def get_occupancy_changed_at():
+    """
+    Time after which resolved occupancy may differ, as a Unix timestamp
+    
+    When occupancy is read from the cached Firebase snapshot rather than
+    DeviceState, sensor changes are not signalled, so the start of the
+    current snapshot TTL window counts as a change as well. When it is
+    read from DeviceState but the cache is local to each process, the
+    version bumps of occupancy_listen never reach this process, so the
+    latest DeviceState update counts instead (one indexed query).
+    """
+    changed_at = get_occupancy_version()
+    if not getattr(settings, 'OCCUPANCY_LIVE_STATE', False):
+        ttl = max(getattr(settings, 'FIREBASE_SNAPSHOT_TTL', 5), 1)
+        changed_at = max(changed_at, time.time() // ttl * ttl)
+    elif not cache_is_shared():
+        latest = DeviceState.objects.aggregate(latest=Max('updated_at'))['latest']
+        if latest is not None:
+            changed_at = max(changed_at, latest.timestamp())
+    return changed_at
+
+
+def _empty_status():
+    return {
+        'is_occupied': False,
+        'is_reserved': False,
+        'user': None,
+        'occupancy_data': None
+    }
+
+
+def current_reservations(today=None):
+    """
+    Reservations covering today
+    
+    Manager reservations are excluded and, as in
+    Room.get_current_occupancy_status, a reservation without any dates
+    counts as current.
+    """
+    if today is None:
+        today = timezone.now().date()
+    return Reservation.objects.active(today).filter(
+        Q(check_in__date__lte=today, check_out__date__gte=today) |
+        Q(check_in__isnull=True, check_out__isnull=True)
+    ).exclude(user__role='manager')
+
+
+def get_current_reservations(rooms, today=None):
+    """Map room id -> reservation covering today for the given rooms, in one query"""
+    reservations = current_reservations(today).filter(room__in=rooms).select_related('user')
+    
+    current = {}
+    for reservation in reservations:
+        # Default ordering is newest first, keep the first match per room
+        current.setdefault(reservation.room_id, reservation)
+    return current
+
+
+def floor_summaries(rooms, today=None):
+    """
+    Room counts per floor, computed by one aggregate query
+    
+    Args:
+        rooms: Room queryset to count, e.g. the rooms of a building
+    
+    Returns:
+        list: Dicts with the floor and building, 'rooms', 'iot_rooms',
+        'reserved' (rooms with a current reservation) and 'available',
+        ordered by building and floor; rooms without a floor are counted
+        under floor None
+    """
+    reserved = Exists(current_reservations(today).filter(room=OuterRef('pk')))
+    summaries = list(rooms.order_by().annotate(is_reserved=reserved).values(
+        'floor_id', 'floor__number', 'floor__name', 'building__code', 'building__name'
+    ).annotate(
+        rooms=Count('id'),
+        iot_rooms=Count('id', filter=Q(has_iot_device=True)),
+        reserved=Count('id', filter=Q(is_reserved=True))
+    ).order_by('building__code', 'floor__number'))
+    for summary in summaries:
+        summary['available'] = summary['rooms'] - summary['reserved']
+    return summaries
+
+
+def get_floor_summaries(rooms, scope, today=None):
+    """
+    floor_summaries() cached until occupancy changes
+    
+    Args:
+        scope: String identifying the rooms queryset, part of the cache key
+    """
+    if today is None:
+        today = timezone.now().date()
+    # Sensor state is not counted, so only room and reservation changes matter
+    key = FLOOR_SUMMARY_CACHE_KEY.format(get_occupancy_version(), today, scope)
+    summaries = cache.get(key)
+    if summaries is None:
+        with primary_reads():
+            summaries = floor_summaries(rooms, today)
+        cache.set(key, summaries, getattr(settings, 'DASHBOARD_FRAGMENT_TTL', 3600))
+    return summaries
+
+
+def get_iot_occupancy(rooms):
+    """
+    Map room id -> occupancy data for the given rooms with an IoT device
+    
+    Reads the Firebase /devices snapshot once instead of one round trip
+    per room, waiting at most FIREBASE_REQUEST_TIMEOUT seconds for it.
+    """
+    iot_rooms = [room for room in rooms if room.has_iot_device and room.iot_device_id]
+    if not iot_rooms:
+        return {}
+    
+    from rooms.firebase_service import FirebaseService
+    try:
+        firebase_service = FirebaseService()
+        devices = firebase_service.get_all_rooms_occupancy(
+            timeout=getattr(settings, 'FIREBASE_REQUEST_TIMEOUT', 1)
+        )
+    except Exception:
+        # Silently fail - don't block the page if Firebase is unavailable
+        return {}
+    
+    occupancy = {}
+    for room in iot_rooms:
+        data = FirebaseService.format_occupancy(devices.get(str(room.iot_device_id)))
+        if data:
+            occupancy[room.id] = data
+    return occupancy
+
+
+def resolve_occupancy(rooms, user, today=None):
+    """
+    Build the dashboard rows for the given rooms
+    
+    Returns a list of dicts with 'room', 'status', 'reservation' and
+    'color' keys, matching what Room.get_current_occupancy_status and the
+    per-room dashboard loop used to produce, using a constant number of
+    queries regardless of how many rooms are passed in. With user=None no
+    room is marked as the user's own.
+    """
+    rooms = list(rooms)
+    reservations = get_current_reservations(rooms, today=today)
+    
+    # Only rooms without a current reservation need IoT data
+    unreserved = [room for room in rooms if room.id not in reservations]
+    iot_occupancy = get_iot_occupancy(unreserved)
+    
+    rooms_data = []
+    for room in rooms:
+        reservation = reservations.get(room.id)
+        status = _empty_status()
+        
+        if reservation:
+            status.update({
+                'is_occupied': True,
+                'is_reserved': True,
+                'user': reservation.user
+            })
+        elif room.id in iot_occupancy:
+            occupancy_data = iot_occupancy[room.id]
+            status.update({
+                'is_occupied': occupancy_data.get('is_occupied', False),
+                'occupancy_data': occupancy_data
+            })
+        
+        # Determine room color
+        if reservation and user is not None and reservation.user_id == user.id:
+            color = 'green'  # User's selected room
+        elif reservation:
+            color = 'yellow'  # Currently rented/reserved by someone else
+        elif status['is_occupied']:
+            color = 'yellow'  # Occupied
+        else:
+            color = 'white'  # Available
+        
+        rooms_data.append({
+            'room': room,
+            'status': status,
+            'reservation': reservation,
+            'color': color
+        })
+    
+    return rooms_data
+
+
+def serialize_room_state(room_data, user=None):
+    """JSON-ready form of one resolve_occupancy row"""
+    room = room_data['room']
+    status = room_data['status']
+    reservation = room_data['reservation']
+    return {
+        'room_number': room.room_number,
+        'color': room_data['color'],
+        'is_occupied': status['is_occupied'],
+        'is_reserved': status['is_reserved'],
+        'is_own': bool(reservation and user is not None and reservation.user_id == user.id),
+        'reserved_by': reservation.user.username if reservation else None,
+        'has_iot_device': room.has_iot_device,
+        'occupancy_data': status['occupancy_data'],
+    }
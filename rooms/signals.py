@@ -0,0 +1,23 @@
+"""
+Signal handlers that keep the occupancy version current
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from reservations.models import Reservation
+from reservations.signals import reservations_expired
+from .models import Building, Floor, Room
+from .services import bump_occupancy_version
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+@receiver(post_save, sender=Floor)
+@receiver(post_delete, sender=Floor)
+@receiver(post_save, sender=Building)
+@receiver(post_delete, sender=Building)
+@receiver(reservations_expired)
+def occupancy_changed(sender, **kwargs):
+    """Bump the occupancy version when a room, its floor or a reservation changes"""
+    bump_occupancy_version()
@@ -0,0 +1,1085 @@
+import asyncio
+import csv
+import gzip
+import importlib
+import io
+import json
+import random
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from accounts.models import User
+from echo_occupancy.metrics import OCCUPANCY_EVENTS_DROPPED
+from echo_occupancy.replicas import PIN_COOKIE, ReplicaPinMiddleware, primary_reads, read_from_replica
+from reservations.models import Reservation
+from .analytics import HOURS_PER_WEEK, utilization_report
+from .anomalies import AnomalyDetector
+from .archive import OccupancyArchive
+from .exports import iterate_keyset
+from .firebase_service import SNAPSHOT_CACHE_KEY, FirebaseService
+from .fragments import get_room_grid
+from .ingestion import OccupancyIngestor
+from .live import OccupancyHub
+from .models import HOURLY_FIELDS, Building, DeviceState, Floor, OccupancyAlert, OccupancyDaily, OccupancyData, OccupancyHourly, Room, RollupWatermark
+from .occupancy_listener import DeviceStateStore, FirebaseSubscription, MemoryEventSource, OccupancyListener
+from .pagination import InvalidCursor, encode_cursor, keyset_page
+from . import rollups
+from .rollups import reset_rollups, roll_up_occupancy
+from .services import get_occupancy_changed_at
+
+
+class MemoryPublisher:
+    """Room states kept in memory in place of the database, for OccupancyHub"""
+    
+    def __init__(self):
+        self.version = 0
+        self.states = {}
+    
+    def set(self, room_number, is_occupied):
+        self.states[room_number] = ({'room_number': room_number, 'is_occupied': is_occupied}, None)
+        self.version += 1
+    
+    def get_version(self):
+        return self.version
+    
+    def load_states(self):
+        return dict(self.states)
+
+
+class OccupancyHubTests(SimpleTestCase):
+    def setUp(self):
+        self.publisher = MemoryPublisher()
+        self.publisher.set('101', False)
+        self.hub = OccupancyHub(
+            interval=0.01,
+            load_states=self.publisher.load_states,
+            get_version=self.publisher.get_version
+        )
+    
+    async def subscribe_in_request(self, user_id):
+        # As in a request passing sync-only middleware: the view runs under
+        # async_to_sync, whose thread executor quits when the request ends
+        return await sync_to_async(async_to_sync(self.hub.subscribe))(user_id)
+    
+    async def next_state(self, subscriber):
+        return await asyncio.wait_for(subscriber.queue.get(), 2)
+    
+    async def change_after_first_subscriber_left(self):
+        first = await self.subscribe_in_request(1)
+        self.assertEqual((await self.next_state(first))['is_occupied'], False)
+        self.hub.unsubscribe(first)
+        
+        second = await self.subscribe_in_request(2)
+        self.assertEqual((await self.next_state(second))['is_occupied'], False)
+        
+        self.publisher.set('101', True)
+        try:
+            return await self.next_state(second)
+        finally:
+            self.hub.unsubscribe(second)
+    
+    def test_change_after_first_subscriber_left_reaches_second(self):
+        # On a loop of its own, like the ASGI server's, rather than under
+        # the async_to_sync of an async test method
+        state = asyncio.run(self.change_after_first_subscriber_left())
+        self.assertEqual(state, {'room_number': '101', 'is_occupied': True})
+
+
+@override_settings(OCCUPANCY_LIVE_STATE=True)
+class OccupancyChangedAtTests(TestCase):
+    def setUp(self):
+        cache.clear()
+    
+    def test_listener_writes_seen_with_local_cache(self):
+        # occupancy_listen runs in another process: its version bump lands
+        # in that process's cache, only the DeviceState row is shared
+        before = get_occupancy_changed_at()
+        DeviceState.objects.create(device_id='101', is_occupied=True)
+        DeviceState.objects.filter(device_id='101').update(updated_at=timezone.now() + timedelta(seconds=5))
+        self.assertGreater(get_occupancy_changed_at(), before)
+    
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/echo-occupancy-test-cache'}})
+    def test_shared_cache_needs_no_query(self):
+        with self.assertNumQueries(0):
+            get_occupancy_changed_at()
+
+
+@override_settings(OCCUPANCY_LIVE_STATE=True, FIREBASE_SNAPSHOT_TTL=5)
+class OccupancyEtagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.manager = User.objects.create(username='manager', role='manager')
+        self.room = Room.objects.create(room_number='101')
+        self.client.force_login(self.manager)
+        # Start of a bucket after every version set so far
+        self.start = (time.time() // 5 + 1) * 5
+    
+    def poll(self, seconds, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        with mock.patch('rooms.views.time') as clock:
+            clock.time.return_value = self.start + seconds
+            return self.client.get('/api/occupancy/', **headers)
+    
+    def test_change_without_version_bump_shows_up_after_ttl(self):
+        etag = self.poll(0)['ETag']
+        self.assertEqual(self.poll(1, etag).status_code, 304)
+        
+        # Saved by another web worker: this process's version never moves
+        Reservation.objects.bulk_create([Reservation(
+            user=User.objects.create(username='guest'),
+            room=self.room,
+            check_in=timezone.now() - timedelta(days=1),
+            check_out=timezone.now() + timedelta(days=1)
+        )])
+        response = self.poll(5, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertTrue(response.json()['rooms'][0]['is_reserved'])
+    
+    def test_shared_cache_keeps_etag_until_a_change(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory.name}
+        with override_settings(CACHES={'default': backend}):
+            etag = self.poll(0)['ETag']
+            self.assertEqual(self.poll(60, etag).status_code, 304)
+
+
+@override_settings(OCCUPANCY_LIVE_STATE=True)
+class ManagerGridTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.manager = User.objects.create(username='manager', role='manager')
+        Room.objects.create(room_number='101', has_iot_device=True, iot_device_id='101')
+        DeviceState.objects.create(device_id='101', is_occupied=False, data={'occupied': False})
+    
+    def test_listener_writes_refresh_cached_grid(self):
+        self.assertIn('Available', get_room_grid(Room.objects.all(), self.manager))
+        # As written by occupancy_listen in its own process, without a
+        # version bump in this process's cache
+        DeviceState.objects.filter(device_id='101').update(
+            is_occupied=True,
+            data={'occupied': True},
+            updated_at=timezone.now() + timedelta(seconds=5)
+        )
+        self.assertIn('Occupied', get_room_grid(Room.objects.all(), self.manager))
+
+
+@override_settings(OCCUPANCY_LIVE_STATE=True)
+class DashboardQueryCountTests(TestCase):
+    """The dashboard resolves occupancy in a constant number of queries"""
+    
+    def setUp(self):
+        self.manager = User.objects.create(username='manager', role='manager')
+        self.guest = User.objects.create(username='guest')
+        self.added = 0
+    
+    def add_rooms(self, count):
+        now = timezone.now()
+        for _ in range(count):
+            self.added += 1
+            number = str(100 + self.added)
+            # Every other room has a sensor, every third a current reservation
+            room = Room.objects.create(
+                room_number=number,
+                has_iot_device=self.added % 2 == 0,
+                iot_device_id=number if self.added % 2 == 0 else None
+            )
+            if room.has_iot_device:
+                DeviceState.objects.create(device_id=number, is_occupied=True, data={'occupied': True})
+            if self.added % 3 == 0:
+                other = User.objects.create(username=f'guest{number}')
+                Reservation.objects.create(
+                    user=other,
+                    room=room,
+                    check_in=now - timedelta(days=1),
+                    check_out=now + timedelta(days=1)
+                )
+    
+    def dashboard_queries(self, user):
+        self.client.force_login(user)
+        # Measure the cold path, not the cached room cards and grid
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/rooms/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+    
+    def test_manager_dashboard_queries_do_not_grow_with_rooms(self):
+        self.add_rooms(5)
+        few = self.dashboard_queries(self.manager)
+        self.add_rooms(45)
+        self.assertEqual(self.dashboard_queries(self.manager), few)
+    
+    def test_guest_dashboard_queries_do_not_grow_with_rooms(self):
+        self.add_rooms(5)
+        Reservation.objects.create(
+            user=self.guest,
+            room=Room.objects.get(room_number='101'),
+            check_in=timezone.now() - timedelta(days=1),
+            check_out=timezone.now() + timedelta(days=1)
+        )
+        few = self.dashboard_queries(self.guest)
+        self.add_rooms(45)
+        self.assertEqual(self.dashboard_queries(self.guest), few)
+
+
+class KeysetPageTests(TestCase):
+    def setUp(self):
+        numbers = [str(101 + i) for i in range(13)]
+        random.Random(0).shuffle(numbers)
+        for number in numbers:
+            Room.objects.create(room_number=number)
+        self.numbers = sorted(numbers)
+    
+    def walk(self, queryset, keys, size):
+        """Pages from the first to the last and back again"""
+        forward = [keyset_page(queryset, keys, size)]
+        while forward[-1].next_cursor:
+            forward.append(keyset_page(queryset, keys, size, after=forward[-1].next_cursor))
+        backward = [forward[-1]]
+        while backward[-1].previous_cursor:
+            backward.append(keyset_page(queryset, keys, size, before=backward[-1].previous_cursor))
+        return forward, backward
+    
+    def test_walk_visits_each_room_once_in_order(self):
+        forward, backward = self.walk(Room.objects.all(), ['room_number'], 4)
+        self.assertEqual([len(page) for page in forward], [4, 4, 4, 1])
+        self.assertEqual([room.room_number for page in forward for room in page], self.numbers)
+        self.assertEqual([room.room_number for page in reversed(backward) for room in page], self.numbers)
+        self.assertIsNone(forward[0].previous_cursor)
+        self.assertIsNone(backward[-1].previous_cursor)
+    
+    def test_walk_descending_with_ties_on_first_key(self):
+        room = Room.objects.get(room_number='101')
+        now = timezone.now()
+        # Three samples per timestamp, so pages split rows that tie
+        OccupancyData.objects.bulk_create(
+            OccupancyData(room=room, is_occupied=True, timestamp=now - timedelta(minutes=i // 3))
+            for i in range(11)
+        )
+        queryset = OccupancyData.objects.values('id', 'timestamp')
+        expected = list(queryset.order_by('-timestamp', '-id'))
+        forward, backward = self.walk(queryset, ['-timestamp', '-id'], 2)
+        self.assertEqual([row for page in forward for row in page], expected)
+        self.assertEqual([row for page in reversed(backward) for row in page], expected)
+    
+    def test_bad_cursor_is_rejected(self):
+        for cursor in ('not a cursor', encode_cursor(['101', 1])):
+            with self.assertRaises(InvalidCursor):
+                keyset_page(Room.objects.all(), ['room_number'], 4, after=cursor)
+
+
+@override_settings(OCCUPANCY_LIVE_STATE=True, DASHBOARD_PAGE_SIZE=3)
+class DashboardPagingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create(username='manager', role='manager'))
+        building = Building.objects.create(code='B1')
+        self.floor = Floor.objects.create(building=building, number=1)
+        for i in range(8):
+            Room.objects.create(room_number=str(101 + i), floor=self.floor if i % 2 else None)
+    
+    def page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+    
+    def room_numbers(self, url):
+        """Room numbers of every page, following the next links from url"""
+        numbers = []
+        while url:
+            context = self.page(url)
+            numbers += [room.room_number for room in context['page']]
+            url = f'/rooms/{context["next_url"]}' if context['next_url'] else None
+        return numbers
+    
+    def test_next_and_previous_links(self):
+        self.assertEqual(self.room_numbers('/rooms/'), [str(101 + i) for i in range(8)])
+        second = self.page('/rooms/' + self.page('/rooms/')['next_url'])
+        first = self.page('/rooms/' + second['previous_url'])
+        self.assertEqual([room.room_number for room in first['page']], ['101', '102', '103'])
+        self.assertIsNone(first['previous_url'])
+    
+    def test_filters_are_kept_across_pages(self):
+        url = f'/rooms/?building=B1&floor={self.floor.id}'
+        self.assertEqual(self.room_numbers(url), ['102', '104', '106', '108'])
+    
+    def test_bad_cursor_shows_first_page(self):
+        context = self.page('/rooms/?after=garbage')
+        self.assertEqual([room.room_number for room in context['page']], ['101', '102', '103'])
+    
+    def test_unknown_building_or_floor_is_not_found(self):
+        other = Floor.objects.create(building=Building.objects.create(code='B2'), number=1)
+        for url in ('/rooms/?building=B9', f'/rooms/?building=B1&floor={other.id}', '/rooms/?building=B1&floor=x'):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+
+class RoomHistoryApiTests(TestCase):
+    url = '/api/rooms/101/history/'
+    
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create(room_number='101')
+        Room.objects.create(room_number='102')
+        self.guest = User.objects.create(username='guest')
+        now = timezone.now()
+        Reservation.objects.create(
+            user=self.guest,
+            room=self.room,
+            check_in=now - timedelta(days=1),
+            check_out=now + timedelta(days=1)
+        )
+        # Every 10 minutes for the last 70 minutes, oldest first
+        self.now = now.replace(microsecond=0)
+        for i in range(8):
+            OccupancyData.objects.create(
+                room=self.room,
+                is_occupied=i % 2 == 0,
+                timestamp=self.now - timedelta(minutes=10 * (7 - i))
+            )
+        self.client.force_login(self.guest)
+    
+    def get(self, url, status=200, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status, response.content)
+        return response.json()
+    
+    def test_other_users_room_is_forbidden(self):
+        self.get('/api/rooms/102/history/', status=403)
+        self.client.force_login(User.objects.create(username='manager', role='manager'))
+        self.get('/api/rooms/102/history/')
+    
+    def test_invalid_parameters(self):
+        for params in (
+            {'since': 'yesterday'},
+            {'until': '2026-13-01'},
+            {'since': '2026-03-02', 'until': '2026-03-01'},
+            {'limit': 'all'},
+            {'limit': 0},
+            {'after': 'garbage'},
+            {'before': encode_cursor([1])},
+        ):
+            self.assertIn('error', self.get(self.url, status=400, **params), params)
+    
+    def test_next_and_previous_links(self):
+        expected = list(OccupancyData.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+        pages = [self.get(self.url, limit=3)]
+        self.assertIsNone(pages[0]['previous'])
+        while pages[-1]['next']:
+            pages.append(self.get(pages[-1]['next']))
+        self.assertEqual([[r['id'] for r in page['results']] for page in pages],
+                         [expected[:3], expected[3:6], expected[6:]])
+        self.assertTrue(pages[0]['next'].startswith(f'{self.url}?limit=3&after='))
+        
+        # The previous link of the last page leads back to the second
+        self.assertEqual(self.get(pages[-1]['previous']), pages[1])
+    
+    def test_since_and_until_bound_the_samples(self):
+        since = self.now - timedelta(minutes=40)
+        until = self.now - timedelta(minutes=10)
+        results = self.get(self.url, since=since.isoformat(), until=until.isoformat())['results']
+        timestamps = [datetime.fromisoformat(r['timestamp']) for r in results]
+        self.assertEqual(timestamps, [until - timedelta(minutes=10 * i) for i in range(1, 4)])
+
+
+class HangingReference:
+    """Stands in for a Firebase reference whose get() waits until released"""
+    
+    def __init__(self):
+        self.released = threading.Event()
+        self.data = None
+    
+    def get(self):
+        self.released.wait(5)
+        return self.data
+    
+    def release(self, data):
+        self.data = data
+        self.released.set()
+
+
+@override_settings(OCCUPANCY_LIVE_STATE=False, FIREBASE_SNAPSHOT_TTL=30)
+class FirebaseOutageTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.reference = HangingReference()
+        patcher = mock.patch('rooms.firebase_service.db.reference', return_value=self.reference)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        FirebaseService._app = object()
+    
+    def tearDown(self):
+        self.reference.release(None)
+        if FirebaseService._snapshot_future is not None:
+            FirebaseService._snapshot_future.result(5)
+        FirebaseService._snapshot_future = None
+        FirebaseService._app = None
+        cache.clear()
+    
+    def test_failed_fetch_is_cached(self):
+        submitted = FirebaseService.metrics()['submitted']
+        self.assertEqual(FirebaseService().get_all_rooms_occupancy(timeout=0.05), {})
+        # Later requests neither wait nor queue another fetch
+        for _ in range(3):
+            self.assertEqual(FirebaseService().get_all_rooms_occupancy(timeout=0.05), {})
+        self.assertEqual(FirebaseService.metrics()['submitted'], submitted + 1)
+    
+    def test_fetch_in_flight_is_joined(self):
+        submitted = FirebaseService.metrics()['submitted']
+        FirebaseService().get_all_rooms_occupancy(timeout=0.05)
+        cache.delete(SNAPSHOT_CACHE_KEY)
+        FirebaseService().get_all_rooms_occupancy(timeout=0.05)
+        self.assertEqual(FirebaseService.metrics()['submitted'], submitted + 1)
+    
+    def test_late_result_replaces_cached_failure(self):
+        FirebaseService().get_all_rooms_occupancy(timeout=0.05)
+        self.reference.release({'101': {'occupied': True}})
+        FirebaseService._snapshot_future.result(5)
+        self.assertEqual(FirebaseService().get_all_rooms_occupancy(), {'101': {'occupied': True}})
+
+
+class DeviceStateStoreTests(TestCase):
+    def test_persist_writes_changed_and_deletes_removed_devices(self):
+        store = DeviceStateStore()
+        store.persist(store.replace({'101': {'occupied': True}, '102': {'occupied': False}}))
+        self.assertEqual(
+            dict(DeviceState.objects.values_list('device_id', 'is_occupied')),
+            {'101': True, '102': False}
+        )
+        
+        store.persist(store.apply('put', '/101', None) | store.apply('patch', '/102', {'occupied': True}))
+        self.assertEqual(dict(DeviceState.objects.values_list('device_id', 'is_occupied')), {'102': True})
+        self.assertEqual(DeviceState.objects.get(device_id='102').data, {'occupied': True})
+
+
+class FirebaseSubscriptionTests(SimpleTestCase):
+    def test_registration_without_stream_thread_counts_as_alive(self):
+        self.assertTrue(FirebaseSubscription(mock.Mock(spec=['close'])).is_alive())
+
+
+class OccupancyListenerTests(TransactionTestCase):
+    def run_listener(self, listener):
+        try:
+            listener.run()
+        finally:
+            # The listener thread has its own database connection
+            connection.close()
+    
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail('listener did not catch up')
+            time.sleep(0.01)
+    
+    def occupied(self, device_id, is_occupied):
+        return lambda: DeviceState.objects.filter(device_id=device_id, is_occupied=is_occupied).exists()
+    
+    def test_reconnect_resyncs_changes_missed_while_disconnected(self):
+        source = MemoryEventSource({'101': {'occupied': False}})
+        listener = OccupancyListener(
+            source, min_backoff=0.01, max_backoff=0.01, check_interval=0.01, log=lambda message: None
+        )
+        thread = threading.Thread(target=self.run_listener, args=(listener,))
+        thread.start()
+        try:
+            self.wait_for(lambda: source.subscription is not None)
+            self.assertTrue(self.occupied('101', False)())
+            
+            source.send('patch', '/101', {'occupied': True})
+            self.wait_for(self.occupied('101', True))
+            
+            # A change lost with the connection, only the snapshot taken on
+            # reconnecting brings it in
+            first = source.subscription
+            source.tree.apply('put', '/102', {'occupied': True})
+            source.disconnect()
+            self.wait_for(self.occupied('102', True))
+            self.assertIsNot(source.subscription, first)
+        finally:
+            listener.stop()
+            thread.join(5)
+
+
+@override_settings(DATABASE_REPLICA_ALIASES=['replica'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def reads_in_view(self, cookies=None):
+        seen = {}
+        
+        @read_from_replica
+        def view(request):
+            seen['view'] = Room.objects.all().db
+            with primary_reads():
+                seen['primary_reads'] = Room.objects.all().db
+            return HttpResponse()
+        
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        ReplicaPinMiddleware(view)(request)
+        return seen
+    
+    def test_reads_go_to_replica_except_in_primary_reads(self):
+        self.assertEqual(self.reads_in_view(), {'view': 'replica', 'primary_reads': 'default'})
+    
+    def test_pinned_browser_reads_from_primary(self):
+        seen = self.reads_in_view(cookies={PIN_COOKIE: '1'})
+        self.assertEqual(seen['view'], 'default')
+
+
+@override_settings(DATABASE_REPLICA_ALIASES=['replica'], OCCUPANCY_LIVE_STATE=True)
+class ReplicaViewTests(TransactionTestCase):
+    """Dashboard and report views read from a replica, a second connection to the test database"""
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.settings['replica'] = {**connections['default'].settings_dict}
+    
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        super().tearDownClass()
+    
+    def setUp(self):
+        cache.clear()
+        self.manager = User.objects.create(username='manager', role='manager')
+        self.guest = User.objects.create(username='guest')
+        Room.objects.create(room_number='101')
+    
+    def replica_queries(self, user, url):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries]
+    
+    def test_dashboard_reads_from_replica(self):
+        self.assertTrue(any('"rooms_room"' in sql for sql in self.replica_queries(self.manager, '/rooms/')))
+    
+    def test_report_reads_from_replica(self):
+        self.assertTrue(self.replica_queries(self.manager, '/rooms/analytics/'))
+    
+    def test_reads_after_write_go_to_primary(self):
+        self.client.force_login(self.guest)
+        check_in = date.today() + timedelta(days=1)
+        response = self.client.post('/reservations/reserve/101/', {
+            'check_in_date': check_in,
+            'check_out_date': check_in + timedelta(days=2),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.replica_queries(self.guest, '/rooms/'), [])
+
+
+class OccupancyIngestorTests(TestCase):
+    def setUp(self):
+        Room.objects.create(room_number='101', has_iot_device=True, iot_device_id='101')
+        self.ingestor = OccupancyIngestor(batch_size=10, max_retries=1)
+        for is_occupied in (True, False):
+            self.ingestor.submit('101', is_occupied)
+    
+    def failing_write(self):
+        return mock.patch.object(
+            OccupancyData.objects, 'bulk_create', side_effect=OperationalError('database is locked')
+        )
+    
+    def test_failed_batch_is_retried(self):
+        with self.failing_write(), self.assertRaises(OperationalError):
+            self.ingestor.flush()
+        self.assertEqual(self.ingestor.flush(), 2)
+        self.assertEqual(OccupancyData.objects.count(), 2)
+        self.assertEqual(self.ingestor.dropped, 0)
+    
+    def test_batch_is_dropped_and_counted_after_retries(self):
+        dropped = OCCUPANCY_EVENTS_DROPPED._values.get(('write_failed',), 0)
+        with self.failing_write():
+            for _ in range(2):
+                with self.assertRaises(OperationalError):
+                    self.ingestor.flush()
+        self.assertEqual(self.ingestor.flush(), 0)
+        self.assertEqual(self.ingestor.dropped, 2)
+        self.assertEqual(OCCUPANCY_EVENTS_DROPPED._values[('write_failed',)], dropped + 2)
+
+
+class RollupTests(TestCase):
+    start = datetime(2026, 3, 2, 10, 30, tzinfo=dt_timezone.utc)
+    
+    def setUp(self):
+        self.room = Room.objects.create(room_number='101')
+    
+    def sample(self, minutes, is_occupied, room=None):
+        OccupancyData.objects.create(
+            room=room or self.room,
+            is_occupied=is_occupied,
+            timestamp=self.start + timedelta(minutes=minutes)
+        )
+    
+    def hourly(self):
+        return {
+            row.hour.hour: (row.occupied_seconds, row.transitions, row.samples)
+            for row in OccupancyHourly.objects.filter(room=self.room)
+        }
+    
+    def rollups(self):
+        """Every rollup row as plain values, for comparing two runs"""
+        hourly = {
+            (row.room_id, row.hour): (row.occupied_seconds, row.transitions, row.samples,
+                                      row.first_timestamp, row.last_timestamp, row.last_is_occupied)
+            for row in OccupancyHourly.objects.all()
+        }
+        daily = {
+            (row.room_id, row.day): (row.occupied_seconds, row.transitions, row.samples, row.weekday,
+                                     row.last_is_occupied, row.hourly_seconds)
+            for row in OccupancyDaily.objects.all()
+        }
+        return hourly, daily
+    
+    def test_state_is_split_at_hour_boundaries(self):
+        # Occupied from 10:30 until 12:15
+        self.sample(0, True)
+        self.sample(105, False)
+        self.assertEqual(roll_up_occupancy(), 2)
+        self.assertEqual(self.hourly(), {10: (1800, 0, 1), 11: (3600, 0, 0), 12: (900, 1, 1)})
+        
+        day = OccupancyDaily.objects.get(room=self.room)
+        self.assertEqual((day.occupied_seconds, day.transitions, day.samples), (6300, 1, 2))
+        self.assertEqual(day.hourly_seconds[10:13], [1800, 3600, 900])
+        self.assertEqual(day.weekday, 0)
+    
+    def test_state_is_carried_across_runs(self):
+        self.sample(0, True)
+        roll_up_occupancy()
+        self.sample(60, False)
+        roll_up_occupancy()
+        self.assertEqual(self.hourly(), {10: (1800, 0, 1), 11: (1800, 1, 1)})
+    
+    def test_late_sample_is_counted_without_changing_the_timeline(self):
+        self.sample(0, True)
+        self.sample(60, False)
+        roll_up_occupancy()
+        # Reported after the 11:30 sample was already rolled up
+        self.sample(15, False)
+        roll_up_occupancy()
+        self.assertEqual(self.hourly(), {10: (1800, 0, 2), 11: (1800, 1, 1)})
+    
+    def test_failed_batch_is_rolled_back_with_its_watermark(self):
+        for minutes in range(0, 240, 30):
+            self.sample(minutes, minutes % 60 == 0)
+        original = rollups._save_deltas
+        calls = []
+        
+        def fail_third(*args, **kwargs):
+            # Two calls (hourly and daily) per batch
+            calls.append(1)
+            if len(calls) == 3:
+                raise RuntimeError('database went away')
+            return original(*args, **kwargs)
+        
+        with mock.patch('rooms.rollups._save_deltas', side_effect=fail_third):
+            with self.assertRaises(RuntimeError):
+                roll_up_occupancy(batch_size=3)
+        first_batch_id = OccupancyData.objects.order_by('id').values_list('id', flat=True)[2]
+        self.assertEqual(RollupWatermark.objects.get().last_id, first_batch_id)
+        self.assertEqual(sum(samples for _, _, samples in self.hourly().values()), 3)
+        
+        self.assertEqual(roll_up_occupancy(batch_size=3), 5)
+        resumed = self.rollups()
+        reset_rollups()
+        roll_up_occupancy()
+        self.assertEqual(self.rollups(), resumed)
+    
+    def test_incremental_runs_match_rebuild(self):
+        rng = random.Random(0)
+        rooms = [self.room, Room.objects.create(room_number='102'), Room.objects.create(room_number='103')]
+        minutes = {room.id: 0 for room in rooms}
+        for _ in range(6):
+            # A few samples per room, then an incremental run in small batches
+            for _ in range(rng.randint(5, 15)):
+                room = rng.choice(rooms)
+                minutes[room.id] += rng.randint(1, 150)
+                self.sample(minutes[room.id], rng.random() < 0.5, room=room)
+            roll_up_occupancy(batch_size=4)
+        incremental = self.rollups()
+        
+        reset_rollups()
+        roll_up_occupancy()
+        self.assertEqual(self.rollups(), incremental)
+        self.assertEqual(RollupWatermark.objects.get().last_id, OccupancyData.objects.latest('id').id)
+
+
+class OccupancyArchiveTests(TestCase):
+    start = datetime(2026, 1, 31, 22, 0, tzinfo=dt_timezone.utc)
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        rooms = [Room.objects.create(room_number='101'), Room.objects.create(room_number='102')]
+        # Every 30 minutes for 4 hours, across the end of January
+        for i in range(8):
+            OccupancyData.objects.create(
+                room=rooms[i % 2],
+                is_occupied=i % 3 == 0,
+                timestamp=self.start + timedelta(minutes=30 * i),
+                sensor_data={'sample': i}
+            )
+        self.cutoff = self.start + timedelta(hours=3)
+        self.archived = list(OccupancyData.objects.filter(timestamp__lt=self.cutoff).order_by('id').values_list(
+            'id', 'room__room_number', 'is_occupied', 'timestamp', 'sensor_data'
+        ))
+    
+    def archive(self):
+        return OccupancyArchive(self.directory).archive(self.cutoff, chunk_size=4, rolled_up_only=False)
+    
+    def read_back(self, **kwargs):
+        records = OccupancyArchive(self.directory).read(**kwargs)
+        return sorted(
+            (r['id'], r['room'], r['is_occupied'], r['timestamp'], r['sensor_data']) for r in records
+        )
+    
+    def test_archived_rows_are_deleted_and_read_back(self):
+        self.assertEqual(self.archive(), 6)
+        self.assertEqual(OccupancyData.objects.filter(timestamp__lt=self.cutoff).count(), 0)
+        self.assertEqual(OccupancyData.objects.count(), 2)
+        self.assertEqual(self.read_back(), self.archived)
+        
+        files = OccupancyArchive(self.directory).manifest['files']
+        self.assertEqual(sorted(files), ['101/2026-01.jsonl.gz', '101/2026-02.jsonl.gz',
+                                         '102/2026-01.jsonl.gz', '102/2026-02.jsonl.gz'])
+        february = self.read_back(room_number='101', start=datetime(2026, 2, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(february, [row for row in self.archived if row[1] == '101' and row[3].month == 2])
+    
+    def test_command_rejects_invalid_dates(self):
+        for since in ('March', '2026-02-30'):
+            with self.assertRaisesMessage(CommandError, f'Invalid date "{since}"'):
+                call_command('read_occupancy_archive', since=since, dir=self.directory)
+    
+    def test_rows_survive_a_failed_delete(self):
+        def fail_delete(queryset):
+            # By now the chunk must be on disk and in the manifest
+            ids = set(queryset.values_list('id', flat=True))
+            self.assertTrue(ids <= {record[0] for record in self.read_back()})
+            raise OperationalError('database is locked')
+        
+        with mock.patch('django.db.models.query.QuerySet.delete', autospec=True, side_effect=fail_delete):
+            with self.assertRaises(OperationalError):
+                self.archive()
+        self.assertEqual(OccupancyData.objects.count(), 8)
+        
+        # Repeating the run deletes the rows without archiving them twice
+        self.assertEqual(self.archive(), 6)
+        self.assertEqual(self.read_back(), self.archived)
+    
+    def test_rerun_truncates_a_partial_write(self):
+        # The first chunk reaches its files, but the run stops before the
+        # manifest records it
+        with mock.patch.object(OccupancyArchive, '_save_manifest', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.archive()
+        self.assertEqual(OccupancyData.objects.count(), 8)
+        
+        self.assertEqual(self.archive(), 6)
+        self.assertEqual(self.read_back(), self.archived)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create(username='manager', role='manager')
+        guests = [User.objects.create(username=f'guest{i}') for i in range(2)]
+        rooms = [Room.objects.create(room_number='101'), Room.objects.create(room_number='102')]
+        start = datetime(2026, 3, 2, 14, 0, 0, 123456, tzinfo=dt_timezone.utc)
+        # Back-to-back stays, alternating between the rooms
+        self.reservations = [
+            Reservation.objects.create(
+                user=guests[i % 2],
+                room=rooms[i % 2],
+                status='completed' if i < 3 else 'reserved',
+                check_in=start + timedelta(days=2 * i),
+                check_out=start + timedelta(days=2 * i + 2),
+                notes='Late arrival, "after 10pm"' if i == 1 else ''
+            )
+            for i in range(5)
+        ]
+        for i in range(3):
+            OccupancyData.objects.create(
+                room=rooms[0],
+                is_occupied=i % 2 == 0,
+                timestamp=start + timedelta(minutes=i),
+                sensor_data={'motion': i}
+            )
+        self.client.force_login(self.manager)
+    
+    def export(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Cache-Control'], 'no-store')
+        content = b''.join(response.streaming_content)
+        return response, content
+    
+    def reservation_rows(self, reservations):
+        return [
+            [str(r.id), r.room.room_number, r.user.username, r.status,
+             r.check_in.isoformat(), r.check_out.isoformat(), r.reserved_at.isoformat(), r.notes]
+            for r in reservations
+        ]
+    
+    def test_reservations_csv(self):
+        response, content = self.export('/api/export/reservations/')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="reservations.csv"')
+        rows = list(csv.reader(io.StringIO(content.decode())))
+        self.assertEqual(rows[0], ['id', 'room', 'user', 'status', 'check_in', 'check_out', 'reserved_at', 'notes'])
+        self.assertEqual(rows[1:], self.reservation_rows(self.reservations))
+    
+    def test_reservations_filters(self):
+        _, content = self.export(
+            '/api/export/reservations/', rooms='101', status='completed', since='2026-03-05', until='2026-03-09'
+        )
+        rows = list(csv.reader(io.StringIO(content.decode())))
+        self.assertEqual(rows[1:], self.reservation_rows([self.reservations[2]]))
+    
+    def test_occupancy_jsonl_keeps_full_timestamps(self):
+        response, content = self.export('/api/export/occupancy/', format='jsonl')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        records = [json.loads(line) for line in content.decode().splitlines()]
+        expected = [
+            {'id': r.id, 'room': '101', 'timestamp': r.timestamp.isoformat(),
+             'is_occupied': r.is_occupied, 'sensor_data': r.sensor_data}
+            for r in OccupancyData.objects.order_by('id')
+        ]
+        self.assertEqual(records, expected)
+        self.assertTrue(records[0]['timestamp'].endswith('.123456+00:00'))
+    
+    def test_gzip(self):
+        _, plain = self.export('/api/export/reservations/', format='jsonl')
+        response, content = self.export('/api/export/reservations/', format='jsonl', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="reservations.jsonl.gz"')
+        self.assertEqual(gzip.decompress(content), plain)
+    
+    def test_rows_are_read_in_keyset_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            chunks = list(iterate_keyset(Reservation.objects.all(), ['status'], chunk_size=2))
+        self.assertEqual([len(rows) for rows in chunks], [2, 2, 1])
+        self.assertEqual([row[0] for rows in chunks for row in rows], [r.id for r in self.reservations])
+        # One query per chunk and a last one that finds nothing left
+        self.assertEqual(len(queries), 4)
+        self.assertNotIn('OFFSET', queries[-1]['sql'])
+    
+    def test_guests_are_forbidden(self):
+        self.client.force_login(User.objects.get(username='guest0'))
+        for url in ('/api/export/reservations/', '/api/export/occupancy/'):
+            self.assertEqual(self.client.get(url).status_code, 403, url)
+    
+    def test_invalid_parameters(self):
+        for url in ('/api/export/reservations/', '/api/export/occupancy/'):
+            for params in ({'format': 'xml'}, {'since': 'March'}, {'until': '2026-02-30'}):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400, (url, params))
+                self.assertIn('error', response.json())
+
+
+class UtilizationReportTests(TestCase):
+    # Two weeks from Monday 2 March, so every weekday is counted twice
+    start = datetime(2026, 3, 2, tzinfo=dt_timezone.utc)
+    end = datetime(2026, 3, 16, tzinfo=dt_timezone.utc)
+    
+    def setUp(self):
+        self.room = Room.objects.create(room_number='101', has_iot_device=True)
+        self.unsensed = Room.objects.create(room_number='102')
+        # Occupied 10:00-11:00 on the first Monday and 10:00-10:30 on the second
+        for days, hours, is_occupied in ((0, 10, True), (0, 11, False), (7, 10, True), (7, 10.5, False)):
+            OccupancyData.objects.create(
+                room=self.room,
+                is_occupied=is_occupied,
+                timestamp=self.start + timedelta(days=days, hours=hours)
+            )
+        roll_up_occupancy()
+        guest = User.objects.create(username='guest')
+        manager = User.objects.create(username='manager', role='manager')
+        # Two days fall in the period but the stay starts before it
+        self.reserve(guest, self.room, -1, 2, 'completed')
+        self.reserve(guest, self.room, 8, 11, 'completed')
+        self.reserve(manager, self.unsensed, 0, 14, 'active')
+    
+    def reserve(self, user, room, check_in, check_out, status):
+        Reservation.objects.create(
+            user=user,
+            room=room,
+            status=status,
+            check_in=self.start + timedelta(days=check_in),
+            check_out=self.start + timedelta(days=check_out)
+        )
+    
+    def report(self, **kwargs):
+        report = utilization_report(self.start, self.end, **kwargs)
+        return report, {entry['room_number']: entry for entry in report['rooms']}
+    
+    def daily_columns(self):
+        return {
+            (row.room_id, row.day): (row.weekday, row.hourly_seconds)
+            for row in OccupancyDaily.objects.all()
+        }
+    
+    def test_heatmap_cells_are_average_occupancy_per_hour_of_week(self):
+        report, rooms = self.report()
+        heatmap = rooms['101']['heatmap']
+        self.assertEqual(len(heatmap), HOURS_PER_WEEK)
+        # Monday 10:00: 1.5 occupied hours over two Mondays
+        self.assertEqual(heatmap[10], 0.75)
+        self.assertEqual(sum(heatmap), 0.75)
+        self.assertEqual(rooms['101']['sensor_rate'], round(5400 / (14 * 86400), 4))
+        self.assertIsNone(rooms['102']['heatmap'])
+        self.assertIsNone(rooms['102']['sensor_rate'])
+        
+        summary = report['summary']
+        self.assertEqual((summary['rooms'], summary['rooms_with_sensor_data']), (2, 1))
+        self.assertEqual(summary['heatmap'], heatmap)
+    
+    def test_reserved_rate_and_average_stay(self):
+        report, rooms = self.report()
+        # Five of the 14 days; manager reservations are not counted
+        self.assertEqual(rooms['101']['reserved_rate'], round(5 / 14, 4))
+        self.assertEqual((rooms['101']['stays'], rooms['101']['average_stay_days']), (1, 3.0))
+        self.assertEqual(rooms['102']['reserved_rate'], 0)
+        self.assertEqual((rooms['102']['stays'], rooms['102']['average_stay_days']), (0, None))
+        self.assertEqual((report['summary']['stays'], report['summary']['average_stay_days']), (1, 3.0))
+    
+    def test_report_limited_to_rooms(self):
+        report, rooms = self.report(room_numbers=['102'], include_heatmaps=False)
+        self.assertEqual(list(rooms), ['102'])
+        self.assertNotIn('heatmap', rooms['102'])
+        self.assertIsNone(report['summary']['heatmap'])
+    
+    def test_api(self):
+        self.client.force_login(User.objects.get(username='guest'))
+        self.assertEqual(self.client.get('/api/analytics/utilization/').status_code, 403)
+        self.client.force_login(User.objects.get(username='manager'))
+        for params in ({'since': 'March'}, {'until': '2026-02-30'}, {'since': '2026-03-16', 'until': '2026-03-02'},
+                       {'since': '2025-01-01', 'until': '2026-03-16'}):
+            response = self.client.get('/api/analytics/utilization/', params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.json())
+        
+        response = self.client.get(
+            '/api/analytics/utilization/', {'since': '2026-03-02', 'until': '2026-03-16', 'heatmaps': '0'}
+        )
+        self.assertEqual(response.status_code, 200)
+        report, _ = self.report(include_heatmaps=False)
+        self.assertEqual(response.json(), report)
+    
+    def test_migration_backfills_hourly_columns(self):
+        migration = importlib.import_module('rooms.migrations.0006_occupancydaily_hourly_seconds')
+        expected = self.daily_columns()
+        # As the rollups were before the columns existed
+        OccupancyDaily.objects.update(weekday=0, **{field: 0 for field in HOURLY_FIELDS})
+        migration.backfill_hourly_seconds(apps, None)
+        self.assertEqual(self.daily_columns(), expected)
+        self.assertEqual(expected[(self.room.id, date(2026, 3, 9))][1][10], 1800)
+
+
+class AnomalyDetectorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create(room_number='101', has_iot_device=True, iot_device_id='d101')
+        self.reserved = Room.objects.create(room_number='102', has_iot_device=True, iot_device_id='d102')
+        self.guest = User.objects.create(username='guest')
+        self.reservation = self.reserve(self.guest, self.reserved)
+        self.now = timezone.now()
+    
+    def reserve(self, user, room):
+        now = timezone.now()
+        return Reservation.objects.create(
+            user=user,
+            room=room,
+            check_in=now - timedelta(days=1),
+            check_out=now + timedelta(days=1)
+        )
+    
+    def detector(self):
+        return AnomalyDetector(occupied_after=900, vacant_after=3600, refresh_interval=0)
+    
+    def at(self, seconds):
+        return self.now + timedelta(seconds=seconds)
+    
+    def alerts(self):
+        return list(OccupancyAlert.objects.order_by('id').values_list(
+            'room__room_number', 'kind', 'reservation_id', 'started_at', 'resolved_at'
+        ))
+    
+    def test_alerts_are_raised_at_their_deadlines(self):
+        detector = self.detector()
+        detector.observe('d101', True, self.at(0))
+        detector.observe('d102', False, self.at(0))
+        detector.tick(self.at(899))
+        self.assertEqual(detector.raised, 0)
+        detector.tick(self.at(900))
+        self.assertEqual(detector.raised, 1)
+        detector.tick(self.at(3600))
+        self.assertEqual(detector.flush(), 2)
+        self.assertEqual(self.alerts(), [
+            ('101', 'unreserved_occupied', None, self.at(0), None),
+            ('102', 'reserved_vacant', self.reservation.id, self.at(0), None),
+        ])
+    
+    def test_short_mismatch_raises_nothing(self):
+        detector = self.detector()
+        detector.observe('d101', True, self.at(0))
+        detector.observe('d101', False, self.at(600))
+        detector.observe('d101', True, self.at(1200))
+        # The deadline counts from the last time the mismatch started
+        detector.tick(self.at(2000))
+        self.assertEqual(detector.raised, 0)
+        detector.tick(self.at(2100))
+        self.assertEqual(detector.raised, 1)
+    
+    def test_alert_is_resolved_when_sensor_and_reservations_agree(self):
+        detector = self.detector()
+        detector.observe('d101', True, self.at(0))
+        detector.tick(self.at(1000))
+        detector.flush()
+        # The room gets a reservation, which the occupancy now matches
+        self.reserve(self.guest, self.room)
+        detector.tick(self.at(1100))
+        self.assertEqual(detector.flush(), 1)
+        self.assertEqual(self.alerts(), [('101', 'unreserved_occupied', None, self.at(0), self.at(1100))])
+        self.assertEqual(detector.resolved, 1)
+    
+    def test_manager_reservations_are_ignored(self):
+        manager = User.objects.create(username='manager', role='manager')
+        self.reserve(manager, self.room)
+        detector = self.detector()
+        detector.observe('d101', True, self.at(0))
+        detector.tick(self.at(900))
+        detector.flush()
+        self.assertEqual(self.alerts(), [('101', 'unreserved_occupied', None, self.at(0), None)])
+    
+    def test_restart_keeps_open_alerts_without_duplicates(self):
+        detector = self.detector()
+        detector.observe('d101', True, self.at(0))
+        detector.tick(self.at(900))
+        detector.flush()
+        DeviceState.objects.create(device_id='d101', is_occupied=True, data={'occupied': True})
+        
+        restarted = self.detector()
+        restarted.tick(self.at(5000))
+        self.assertEqual((restarted.raised, restarted.flush()), (0, 0))
+        # The alert loaded on start is resolved like one it raised
+        restarted.observe('d101', False, self.at(5100))
+        self.assertEqual(restarted.flush(), 1)
+        self.assertEqual(self.alerts(), [('101', 'unreserved_occupied', None, self.at(0), self.at(5100))])
@@ -5,6 +5,7 @@ app_name = 'rooms'
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
+    path('analytics/', views.analytics, name='analytics'),
     path('<str:room_number>/', views.room_detail, name='room_detail'),
 ]
 
@@ -1,139 +1,423 @@
+import hashlib
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
 from django.db.models import Q
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from .models import Room
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
+from echo_occupancy.replicas import read_from_replica
+from .analytics import AnalyticsError, HOURS_PER_WEEK, parse_report_params, utilization_report
+from .exports import ExportError, export_response, parse_export_params
+from .fragments import get_room_grid
+from .history import HistoryError, history_page, parse_history_params, serialize_history_record
+from .models import Building, Room, OccupancyData
+from .pagination import InvalidCursor, keyset_page
+from .services import cache_is_shared, resolve_occupancy, serialize_room_state, get_occupancy_changed_at, get_floor_summaries
+from reservations.current import get_current_reservation
 from reservations.models import Reservation
 
 
-def mark_expired_reservations_completed():
-    """Mark reservations as completed if check-out date has passed"""
-    today = timezone.now().date()
-    expired_reservations = Reservation.objects.filter(
-        status__in=['reserved', 'active'],
-        check_out__isnull=False
-    )
+def get_visible_rooms(user):
+    """Rooms the user may see: all for managers, their rented room otherwise"""
+    if user.is_manager():
+        # Manager can see all rooms
+        return Room.objects.all()
     
-    for reservation in expired_reservations:
-        if reservation.check_out.date() < today:
-            reservation.status = 'completed'
-            reservation.save()
+    # Normal user can only see their rented room
+    user_reservation = get_current_reservation(user)
+    
+    if user_reservation:
+        return Room.objects.filter(id=user_reservation.room_id)
+    return Room.objects.none()
+
+
+def _page_url(request, **params):
+    """Current URL with the paging cursor replaced by params"""
+    query = request.GET.copy()
+    for name in ('after', 'before'):
+        query.pop(name, None)
+    query.update(params)
+    return f'?{query.urlencode()}'
+
+
+def _manager_dashboard(request):
+    """
+    Filters, per-floor counts and one page of rooms for the manager dashboard
+    
+    Rooms can be narrowed with ?building=<code>&floor=<id> and are paged
+    by room number with keyset cursors (?after= / ?before=), so a page
+    costs the same however many rooms there are. The floor counts are SQL
+    aggregates cached until rooms or reservations change.
+    """
+    buildings = list(Building.objects.prefetch_related('floors'))
+    code = request.GET.get('building', '')
+    floor_id = request.GET.get('floor', '')
+    building = floor = None
+    rooms = Room.objects.all()
+    if code:
+        building = next((b for b in buildings if b.code == code), None)
+        if building is None:
+            raise Http404(f'No building {code}')
+        rooms = rooms.filter(building=building)
+        if floor_id:
+            floor = next((f for f in building.floors.all() if str(f.id) == floor_id), None)
+            if floor is None:
+                raise Http404(f'No floor {floor_id} in building {code}')
+            rooms = rooms.filter(floor=floor)
+    
+    size = getattr(settings, 'DASHBOARD_PAGE_SIZE', 100)
+    try:
+        page = keyset_page(rooms, ['room_number'], size,
+                           after=request.GET.get('after'), before=request.GET.get('before'))
+    except InvalidCursor:
+        page = keyset_page(rooms, ['room_number'], size)
+    
+    floors = get_floor_summaries(rooms, f'{building.id if building else ""}:{floor.id if floor else ""}')
+    return {
+        'page': page,
+        'buildings': buildings,
+        'building': building,
+        'floor': floor,
+        'floors': floors,
+        'total_rooms': sum(row['rooms'] for row in floors),
+        'page_rooms': ','.join(room.room_number for room in page),
+        'next_url': _page_url(request, after=page.next_cursor) if page.next_cursor else None,
+        'previous_url': _page_url(request, before=page.previous_cursor) if page.previous_cursor else None,
+    }
 
 
 @login_required
+@read_from_replica
 def dashboard(request):
     """Role-based dashboard view"""
-    # Mark expired reservations as completed
-    mark_expired_reservations_completed()
-    
     user = request.user
-    
-    if user.is_manager():
-        # Manager can see all rooms
-        rooms = Room.objects.all()
-    else:
-        # Normal user can only see their rented room
-        user_reservation = Reservation.objects.filter(
-            user=user,
-            status__in=['reserved', 'active']
-        ).first()
-        
-        if user_reservation:
-            rooms = Room.objects.filter(id=user_reservation.room.id)
-        else:
-            rooms = Room.objects.none()
-    
-    # Get occupancy status for each room
-    today = timezone.now().date()
-    rooms_data = []
-    for room in rooms:
-        status = room.get_current_occupancy_status()
-        # Exclude manager reservations and check if today is within reservation period
-        all_reservations = Reservation.objects.filter(
-            room=room,
-            status__in=['reserved', 'active']
-        ).exclude(user__role='manager')
-        
-        # Find reservation where today is within the reservation period
-        reservation = None
-        for res in all_reservations:
-            if res.check_in and res.check_out:
-                check_in_date = res.check_in.date() if hasattr(res.check_in, 'date') else res.check_in
-                check_out_date = res.check_out.date() if hasattr(res.check_out, 'date') else res.check_out
-                if check_in_date <= today <= check_out_date:
-                    reservation = res
-                    break
-            elif not res.check_in and not res.check_out:
-                # If no dates, consider it active
-                reservation = res
-                break
-        
-        # Determine room color
-        if reservation and reservation.user == user:
-            color = 'green'  # User's selected room
-        elif reservation:
-            color = 'yellow'  # Currently rented/reserved by someone else
-        elif status['is_occupied']:
-            color = 'yellow'  # Occupied
-        else:
-            color = 'white'  # Available
-        
-        rooms_data.append({
-            'room': room,
-            'status': status,
-            'reservation': reservation,
-            'color': color
-        })
-    
     context = {
-        'rooms_data': rooms_data,
         'is_manager': user.is_manager(),
         'user': user
     }
+    if user.is_manager():
+        context.update(_manager_dashboard(request))
+        rooms = context['page'].items
+    else:
+        # The user's room comes loaded with their cached reservation
+        reservation = request.current_reservation
+        rooms = [reservation.room] if reservation else []
+    
+    # Room cards come from the fragment cache, see rooms.fragments
+    context['room_grid'] = get_room_grid(rooms, user)
     
     return render(request, 'rooms/dashboard.html', context)
 
 
+def _can_view_room(request, room):
+    """Managers see every room, normal users only the one they have reserved"""
+    if request.user.is_manager():
+        return True
+    user_reservation = request.current_reservation
+    return bool(user_reservation) and user_reservation.room_id == room.id
+
+
 @login_required
+@read_from_replica
 def room_detail(request, room_number):
-    """Room detail view with occupancy data"""
+    """
+    Room detail view with occupancy data
+    
+    The occupancy history shows its newest page and scrolls further back
+    through room_history_api; ?since=, ?until= and ?after= are applied to
+    the first page as well, so the page also works without JavaScript.
+    """
     room = get_object_or_404(Room, room_number=room_number)
     user = request.user
     
     # Check permissions
-    if not user.is_manager():
+    if not _can_view_room(request, room):
         # Normal user can only view their own room
-        user_reservation = Reservation.objects.filter(
-            user=user,
-            room=room,
-            status__in=['reserved', 'active']
-        ).first()
-        
-        if not user_reservation:
-            from django.contrib import messages
-            from django.shortcuts import redirect
-            messages.error(request, 'You do not have permission to view this room.')
-            return redirect('rooms:dashboard')
+        from django.contrib import messages
+        from django.shortcuts import redirect
+        messages.error(request, 'You do not have permission to view this room.')
+        return redirect('rooms:dashboard')
     
     # Get current occupancy status
     status = room.get_current_occupancy_status()
     
     # Get reservation info (exclude manager reservations)
-    reservation = Reservation.objects.filter(
-        room=room,
-        status__in=['reserved', 'active']
-    ).exclude(user__role='manager').first()
+    reservation = Reservation.objects.active().filter(
+        room=room
+    ).exclude(user__role='manager').select_related('user').first()
     
-    # Get historical occupancy data
-    occupancy_history = room.occupancy_history.all()[:50]  # Last 50 records
+    # Get historical occupancy data, one keyset page at a time
+    try:
+        history_params = parse_history_params(request)
+    except HistoryError as e:
+        # Fall back to the unfiltered history
+        from django.contrib import messages
+        from django.shortcuts import redirect
+        messages.error(request, str(e))
+        return redirect('rooms:room_detail', room_number=room.room_number)
+    try:
+        history = history_page(room, history_params, after=request.GET.get('after'))
+    except InvalidCursor:
+        history = history_page(room, history_params)
+    history_api_url = reverse('api:room_history', args=[room.room_number])
+    
+    # Daily rollups (see rollup_occupancy) for the last 30 days, managers only
+    daily_occupancy = None
+    if user.is_manager():
+        since = timezone.now().date() - timedelta(days=30)
+        daily_occupancy = room.daily_occupancy.filter(day__gt=since)
     
     context = {
         'room': room,
         'status': status,
         'reservation': reservation,
-        'occupancy_history': occupancy_history,
+        'occupancy_history': history,
+        'history_since': request.GET.get('since', ''),
+        'history_until': request.GET.get('until', ''),
+        'history_older_url': _page_url(request, after=history.next_cursor) if history.next_cursor else None,
+        'history_api_url': (
+            history_api_url + _page_url(request, after=history.next_cursor) if history.next_cursor else None
+        ),
+        'history_newest_url': _page_url(request) if request.GET.get('after') else None,
+        'daily_occupancy': daily_occupancy,
         'is_manager': user.is_manager(),
     }
     
     return render(request, 'rooms/room_detail.html', context)
 
+
+@login_required
+@require_GET
+@read_from_replica
+def room_history_api(request, room_number):
+    """
+    Occupancy samples of one room as JSON, newest first
+    
+    Accepts the parameters of parse_history_params() and the ?after= /
+    ?before= cursors of a previous response, whose 'next' and 'previous'
+    URLs lead to the older and newer pages. Users see the same rooms as
+    on room_detail.
+    """
+    room = get_object_or_404(Room, room_number=room_number)
+    if not _can_view_room(request, room):
+        return JsonResponse({'error': 'You do not have permission to view this room.'}, status=403)
+    try:
+        params = parse_history_params(request)
+        page = history_page(room, params, after=request.GET.get('after'), before=request.GET.get('before'))
+    except (HistoryError, InvalidCursor) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse({
+        'room_number': room.room_number,
+        'results': [serialize_history_record(record) for record in page],
+        'next': request.path + _page_url(request, after=page.next_cursor) if page.next_cursor else None,
+        'previous': request.path + _page_url(request, before=page.previous_cursor) if page.previous_cursor else None,
+    })
+
+
+def _occupancy_changed_at():
+    """
+    get_occupancy_changed_at(), moved on every FIREBASE_SNAPSHOT_TTL seconds
+    when the cache is local to the process
+    
+    A local cache never sees the version bumps of other web workers, so a
+    reservation saved by one of them would otherwise keep answering polls
+    with 304 until the date changes.
+    """
+    changed_at = get_occupancy_changed_at()
+    if cache_is_shared():
+        return changed_at
+    ttl = max(getattr(settings, 'FIREBASE_SNAPSHOT_TTL', 5), 1)
+    now = time.time()
+    return max(changed_at, now - now % ttl)
+
+
+def _occupancy_etag(request):
+    """
+    ETag for occupancy_api, computed without resolving any occupancy
+    
+    Only get_occupancy_changed_at() may query the database, for the latest
+    DeviceState update when the cache is local to the process.
+    """
+    key = '|'.join([
+        repr(_occupancy_changed_at()),
+        str(timezone.now().date()),
+        str(request.user.pk),
+        request.GET.get('rooms', '')
+    ])
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def _occupancy_last_modified(request):
+    return datetime.fromtimestamp(_occupancy_changed_at(), tz=dt_timezone.utc)
+
+
+@login_required
+@require_GET
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_occupancy_etag, last_modified_func=_occupancy_last_modified)
+def occupancy_api(request):
+    """
+    Occupancy of every room visible to the user in one JSON response
+    
+    Accepts an optional ?rooms=101,102 filter. Responses carry an ETag and
+    Last-Modified, so a poll with an unchanged If-None-Match gets a 304
+    before any room, reservation or Firebase lookup is made.
+    """
+    user = request.user
+    rooms = get_visible_rooms(user)
+    
+    room_numbers = [n.strip() for n in request.GET.get('rooms', '').split(',') if n.strip()]
+    if room_numbers:
+        rooms = rooms.filter(room_number__in=room_numbers)
+    
+    rooms_payload = [
+        serialize_room_state(room_data, user)
+        for room_data in resolve_occupancy(rooms, user)
+    ]
+    
+    return JsonResponse({'rooms': rooms_payload})
+
+
+@login_required
+@require_GET
+def export_occupancy(request):
+    """
+    Stream OccupancyData as CSV or JSON Lines, managers only
+    
+    Accepts the parameters of parse_export_params(); since/until filter
+    on the sample timestamp.
+    """
+    if not request.user.is_manager():
+        return JsonResponse({'error': 'Only managers can export data.'}, status=403)
+    try:
+        params = parse_export_params(request)
+    except ExportError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    records = OccupancyData.objects.all()
+    if params['room_numbers']:
+        records = records.filter(room__room_number__in=params['room_numbers'])
+    if params['since']:
+        records = records.filter(timestamp__gte=params['since'])
+    if params['until']:
+        records = records.filter(timestamp__lt=params['until'])
+    
+    return export_response(
+        request,
+        records,
+        ['id', 'room', 'timestamp', 'is_occupied', 'sensor_data'],
+        ['room__room_number', 'timestamp', 'is_occupied', 'sensor_data'],
+        'occupancy',
+        params
+    )
+
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+@login_required
+@read_from_replica
+def analytics(request):
+    """Utilization report with an hour-of-week occupancy heatmap, managers only"""
+    from django.contrib import messages
+    from django.shortcuts import redirect
+    
+    if not request.user.is_manager():
+        messages.error(request, 'Only managers can view analytics.')
+        return redirect('rooms:dashboard')
+    
+    try:
+        params = parse_report_params(request)
+    except AnalyticsError as e:
+        # Fall back to the default period
+        messages.error(request, str(e))
+        return redirect('rooms:analytics')
+    
+    report = utilization_report(params['start'], params['end'], params['room_numbers'], include_heatmaps=False)
+    
+    # One row per weekday, each cell the average occupancy in percent
+    heatmap = report['summary']['heatmap'] or [0.0] * HOURS_PER_WEEK
+    heatmap_rows = [
+        (weekday, [round(rate * 100) for rate in heatmap[day * 24:(day + 1) * 24]])
+        for day, weekday in enumerate(WEEKDAYS)
+    ]
+    
+    context = {
+        'report': report,
+        'heatmap_rows': heatmap_rows,
+        'hours': range(24),
+        'since': params['start'].date(),
+        'until': params['end'].date(),
+    }
+    return render(request, 'rooms/analytics.html', context)
+
+
+@login_required
+@require_GET
+@read_from_replica
+def utilization_api(request):
+    """
+    Utilization report as JSON, managers only
+    
+    Accepts the parameters of parse_report_params(), and ?heatmaps=0 to
+    leave out the per-room heatmaps.
+    """
+    if not request.user.is_manager():
+        return JsonResponse({'error': 'Only managers can view analytics.'}, status=403)
+    try:
+        params = parse_report_params(request)
+    except AnalyticsError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse(utilization_report(
+        params['start'],
+        params['end'],
+        params['room_numbers'],
+        include_heatmaps=request.GET.get('heatmaps') not in ('0', 'false')
+    ))
+
+
+def _stream_scope(request):
+    """User ID and visible room numbers (None for all) for occupancy_stream"""
+    user = request.user
+    if not user.is_authenticated:
+        return None, None
+    if user.is_manager():
+        # A dashboard page only follows its own rooms
+        room_numbers = [n.strip() for n in request.GET.get('rooms', '').split(',') if n.strip()]
+        return user.id, room_numbers or None
+    return user.id, list(get_visible_rooms(user).values_list('room_number', flat=True))
+
+
+async def occupancy_stream(request):
+    """
+    Server-Sent Events stream of room state changes
+    
+    Managers receive every room (or those in ?rooms=101,102), normal
+    users only their rented room.
+    Each event carries one room in the same form as occupancy_api. Needs
+    the ASGI server; under WSGI it answers 501 and the dashboard falls
+    back to polling occupancy_api.
+    """
+    from .live import hub
+    
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse('Live updates require the ASGI server.', status=501)
+    
+    user_id, room_numbers = await sync_to_async(_stream_scope)(request)
+    if user_id is None:
+        return HttpResponse(status=401)
+    
+    subscriber = await hub.subscribe(user_id, room_numbers)
+    response = StreamingHttpResponse(hub.stream(subscriber), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
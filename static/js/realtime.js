@@ -38,37 +38,166 @@ function updateRoomOccupancy(roomNumber, occupancyData) {
     }
 }
 
+// Apply one room entry from the occupancy API to its card
+function updateRoomCard(room) {
+    const roomCard = document.querySelector(`.room-card[data-room-number="${room.room_number}"]`);
+    if (!roomCard) return;
+
+    roomCard.classList.remove('room-white', 'room-yellow', 'room-green');
+    roomCard.classList.add(`room-${room.color}`);
+
+    const statusBadge = roomCard.querySelector('.room-status .badge');
+    if (statusBadge) {
+        if (room.is_own) {
+            statusBadge.textContent = 'Your Room';
+            statusBadge.className = 'badge badge-green';
+        } else if (room.is_reserved) {
+            statusBadge.textContent = 'Reserved';
+            statusBadge.className = 'badge badge-yellow';
+        } else if (room.is_occupied) {
+            statusBadge.textContent = 'Occupied';
+            statusBadge.className = 'badge badge-yellow';
+        } else {
+            statusBadge.textContent = 'Available';
+            statusBadge.className = 'badge badge-white';
+        }
+    }
+
+    const realtimeIndicator = roomCard.querySelector('.realtime-indicator');
+    if (realtimeIndicator) {
+        realtimeIndicator.style.display = room.occupancy_data ? 'inline-block' : 'none';
+    }
+}
+
 // Poll for real-time updates (fallback if WebSocket/Firebase JS SDK not available)
-function pollOccupancyUpdates() {
-    // This would typically use Firebase JavaScript SDK or WebSocket
-    // For now, we'll use a polling mechanism as a fallback
-    
-    const roomsWithIoT = document.querySelectorAll('.room-card[data-has-iot="true"]');
-    
-    roomsWithIoT.forEach(roomCard => {
-        const roomNumber = roomCard.getAttribute('data-room-number');
-        
-        // Fetch occupancy data from Django backend
-        fetch(`/api/rooms/${roomNumber}/occupancy/`)
-            .then(response => response.json())
-            .then(data => {
-                if (data && data.occupancy_data) {
-                    updateRoomOccupancy(roomNumber, data.occupancy_data);
-                }
-            })
-            .catch(error => {
-                console.error('Error fetching occupancy data:', error);
-            });
-    });
+// One request per interval covers every room; unchanged state returns 304
+let occupancyEtag = null;
+
+function pollOccupancyUpdates(url) {
+    const headers = {};
+    if (occupancyEtag) {
+        headers['If-None-Match'] = occupancyEtag;
+    }
+
+    fetch(url, { headers: headers, cache: 'no-store', credentials: 'same-origin' })
+        .then(response => {
+            if (response.status === 304 || !response.ok) {
+                return null;
+            }
+            occupancyEtag = response.headers.get('ETag');
+            return response.json();
+        })
+        .then(data => {
+            if (data && data.rooms) {
+                data.rooms.forEach(updateRoomCard);
+            }
+        })
+        .catch(error => {
+            console.error('Error fetching occupancy data:', error);
+        });
+}
+
+function startPolling(url) {
+    // Poll every 5 seconds for updates (adjust as needed)
+    setInterval(() => pollOccupancyUpdates(url), 5000);
+}
+
+// Receive pushed updates over Server-Sent Events, polling if unavailable
+function subscribeOccupancyUpdates(streamUrl, pollUrl) {
+    if (!window.EventSource) {
+        startPolling(pollUrl);
+        return;
+    }
+
+    const source = new EventSource(streamUrl);
+    source.onmessage = event => updateRoomCard(JSON.parse(event.data));
+    source.onerror = () => {
+        // CONNECTING means the browser is already retrying on its own
+        if (source.readyState === EventSource.CLOSED) {
+            startPolling(pollUrl);
+        }
+    };
 }
 
 // Initialize real-time updates when page loads
 document.addEventListener('DOMContentLoaded', function() {
-    // Poll every 5 seconds for updates (adjust as needed)
-    // setInterval(pollOccupancyUpdates, 5000);
-    
-    // Note: For production, implement Firebase JavaScript SDK for real-time updates
-    // This would provide instant updates without polling
+    // Only the dashboard grid opts in to live updates
+    const grid = document.querySelector('.rooms-grid[data-occupancy-url]');
+    if (!grid) return;
+
+    const pollUrl = grid.getAttribute('data-occupancy-url');
+    const streamUrl = grid.getAttribute('data-stream-url');
+    if (streamUrl) {
+        subscribeOccupancyUpdates(streamUrl, pollUrl);
+    } else {
+        startPolling(pollUrl);
+    }
+});
+
+// Append one record from the room history API to the history table
+function appendHistoryRow(tbody, record) {
+    const row = document.createElement('tr');
+    const time = document.createElement('td');
+    // Local ISO timestamp, shown like the rows rendered by the server
+    time.textContent = record.timestamp.slice(0, 19).replace('T', ' ');
+    const status = document.createElement('td');
+    const badge = document.createElement('span');
+    badge.className = record.is_occupied ? 'badge badge-yellow' : 'badge badge-white';
+    badge.textContent = record.is_occupied ? 'Occupied' : 'Vacant';
+    status.appendChild(badge);
+    row.append(time, status);
+    tbody.appendChild(row);
+}
+
+// Load the next (older) page of occupancy history into the table
+function loadOlderHistory(link, tbody, observer) {
+    if (link.dataset.loading) return;
+    link.dataset.loading = 'true';
+
+    fetch(link.getAttribute('data-history-url'), { credentials: 'same-origin' })
+        .then(response => response.ok ? response.json() : Promise.reject(response.status))
+        .then(data => {
+            data.results.forEach(record => appendHistoryRow(tbody, record));
+            if (data.next) {
+                link.setAttribute('data-history-url', data.next);
+                // Keep the link usable as a plain page link
+                link.href = window.location.pathname + new URL(data.next, window.location.href).search;
+                delete link.dataset.loading;
+                if (observer) {
+                    // Observing again reports the link if it is still in view
+                    observer.unobserve(link);
+                    observer.observe(link);
+                }
+            } else {
+                if (observer) observer.disconnect();
+                link.remove();
+            }
+        })
+        .catch(error => {
+            console.error('Error fetching occupancy history:', error);
+            delete link.dataset.loading;
+        });
+}
+
+// Infinite scroll through the occupancy history on the room detail page
+document.addEventListener('DOMContentLoaded', function() {
+    const link = document.querySelector('.history-more[data-history-url]');
+    const tbody = document.querySelector('.history-rows');
+    if (!link || !tbody) return;
+
+    let observer = null;
+    if (window.IntersectionObserver) {
+        observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadOlderHistory(link, tbody, observer);
+            }
+        }, { rootMargin: '200px' });
+        observer.observe(link);
+    }
+    link.addEventListener('click', event => {
+        event.preventDefault();
+        loadOlderHistory(link, tbody, observer);
+    });
 });
 
 // Add room number data attributes to room cards for easier selection